@@ -0,0 +1,118 @@
+import os
+import time
+import threading
+from typing import Any, Dict, Optional
+
+# Kept identical in src/ and Marvin-Art/, since each service is built from its own directory
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """A call was refused without trying because its dependency's circuit is open"""
+
+
+class CircuitBreaker:
+    """Fails calls to a dependency fast once it keeps failing.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    every call is refused straight away with CircuitOpenError. After
+    `reset_seconds` one call is let through as a probe (half-open): if it
+    succeeds the circuit closes again, if it fails it stays open for
+    another `reset_seconds`.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.metrics = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0, "probes": 0}
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _current_state(self, now: float) -> str:
+        if self.state == OPEN and now - self.opened_at >= self.reset_seconds:
+            return HALF_OPEN
+        return self.state
+
+    def is_open(self) -> bool:
+        """True while calls are being refused (including a probe in progress)"""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            return state == OPEN or (state == HALF_OPEN and self._probing)
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless the call may go ahead"""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == OPEN or (state == HALF_OPEN and self._probing):
+                self.metrics["rejected"] += 1
+                raise CircuitOpenError(f"{self.name} is unavailable: {self.last_error}")
+            if state == HALF_OPEN:
+                self._probing = True
+                self.metrics["probes"] += 1
+            self.metrics["calls"] += 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                print(f"Circuit for {self.name} closed, the dependency is back")
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self, error: Any) -> None:
+        with self._lock:
+            self.metrics["failures"] += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error)[:200]
+            probe_failed = self._probing
+            self._probing = False
+            if probe_failed or (self.state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+                if self.state == CLOSED:
+                    self.metrics["opened"] += 1
+                    print(f"Circuit for {self.name} opened after {self.consecutive_failures} failures: {self.last_error}")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            return {
+                "state": state,
+                "consecutive_failures": self.consecutive_failures,
+                "open_seconds": round(now - self.opened_at, 1) if self.opened_at is not None else None,
+                "last_error": self.last_error,
+                **self.metrics
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def circuit_breaker(name: str) -> CircuitBreaker:
+    """The process-wide breaker for a dependency, created on first use"""
+    with _registry_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    with _registry_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.stats() for name, breaker in breakers.items()}
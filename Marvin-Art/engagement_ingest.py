@@ -0,0 +1,313 @@
+import os
+import csv
+import json
+import shutil
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+METRICS = ("likes", "shares", "comments", "impressions")
+
+# Names platforms (and exported spreadsheets) use for the same metric
+METRIC_ALIASES = {
+    "likes": ("likes", "like_count", "favorite_count", "favorites", "reactions"),
+    "shares": ("shares", "share_count", "retweets", "retweet_count", "reposts", "repost_count"),
+    "comments": ("comments", "comment_count", "replies", "reply_count"),
+    "impressions": ("impressions", "impression_count", "views", "view_count", "reach"),
+}
+
+# Must match engagement_score in add_engagement_metrics.sql
+ENGAGEMENT_WEIGHTS = {"likes": 1, "shares": 2, "comments": 3}
+
+DROP_EXTENSIONS = (".jsonl", ".csv")
+
+# PostgREST / Postgres codes for a function that doesn't exist
+MISSING_FUNCTION_CODES = ("PGRST202", "42883")
+
+
+def missing_function(error: Exception) -> bool:
+    """True if an rpc failed only because the function isn't installed"""
+    code = getattr(error, "code", None)
+    return code in MISSING_FUNCTION_CODES or any(c in str(error) for c in MISSING_FUNCTION_CODES)
+
+
+def _count(value: Any) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    try:
+        count = int(float(value))
+    except (TypeError, ValueError):
+        return None
+    return count if count >= 0 else None
+
+
+def _timestamp(value: Any) -> Optional[str]:
+    """ISO timestamp in UTC, truncated to the second so repeated reports of one reading collapse"""
+    if value in (None, ""):
+        return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+    try:
+        if isinstance(value, (int, float)):
+            parsed = datetime.fromtimestamp(value, timezone.utc)
+        else:
+            text = str(value).replace("Z", "+00:00")
+            main, _, rest = text.partition(".")
+            if rest:
+                # fromisoformat on Python 3.8 wants exactly 6 fractional digits
+                digits = "".join(c for c in rest if c.isdigit())
+                text = f"{main}.{digits[:6].ljust(6, '0')}{rest[len(digits):]}"
+            parsed = datetime.fromisoformat(text)
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.astimezone(timezone.utc).replace(microsecond=0).isoformat()
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+def normalize(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """One raw metrics record as a row for engagement_metrics, or None if unusable"""
+    image_id = record.get("image_id")
+    platform = (record.get("platform") or "").strip().lower()
+    observed_at = _timestamp(record.get("observed_at", record.get("timestamp")))
+    if not image_id or not platform or not observed_at:
+        return None
+
+    point = {
+        "image_id": str(image_id),
+        "platform": platform,
+        "observed_at": observed_at,
+        "external_post_id": record.get("external_post_id") or record.get("post_id") or None,
+    }
+    for metric, aliases in METRIC_ALIASES.items():
+        point[metric] = next((c for c in (_count(record.get(a)) for a in aliases) if c is not None), None)
+    if all(point[metric] is None for metric in METRICS):
+        return None
+    return point
+
+
+def read_drop(path: str) -> Iterator[Dict[str, Any]]:
+    """Raw records from a JSONL or CSV drop file"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(f)
+            return
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                print(f"Skipping bad line {line_number} in {path}")
+
+
+def engagement_score(point: Dict[str, Any]) -> float:
+    return sum(weight * (point.get(metric) or 0) for metric, weight in ENGAGEMENT_WEIGHTS.items())
+
+
+class EngagementIngester:
+    """Loads engagement metrics into engagement_metrics and engagement_rollups.
+
+    Records are normalized, merged on (image, platform, observed_at) and
+    written `batch_size` at a time through the ingest_engagement_metrics
+    function, which upserts the points and refreshes the rollups of the
+    images they touch in one set-based statement each. Without the
+    function (add_engagement_metrics.sql not run) points go in as bulk
+    upserts of only the metrics they carry, and rollups are computed here
+    from the latest stored reading per image and platform.
+    """
+
+    def __init__(self, supabase, batch_size: int = 5000, max_drop_attempts: int = 3):
+        self.supabase = supabase
+        self.batch_size = batch_size
+        self.max_drop_attempts = max_drop_attempts
+        self.use_function = True
+        self.drop_attempts: Dict[str, int] = {}
+        self.totals = {"points": 0, "rejected": 0, "batches": 0, "images": 0}
+        self.last_ingest_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def ingest(self, records: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """Normalize and write records; returns what was written and rejected"""
+        result = {"points": 0, "rejected": 0, "batches": 0, "images": 0}
+        batch: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        for record in records:
+            point = normalize(record)
+            if point is None:
+                result["rejected"] += 1
+                continue
+            key = (point["image_id"], point["platform"], point["observed_at"])
+            seen = batch.get(key)
+            if seen is None:
+                batch[key] = point
+            else:
+                # Same reading reported twice: keep every metric either copy has
+                seen.update({k: v for k, v in point.items() if v is not None})
+            if len(batch) >= self.batch_size:
+                self._write(list(batch.values()), result)
+                batch = {}
+        if batch:
+            self._write(list(batch.values()), result)
+
+        with self._lock:
+            for key, value in result.items():
+                self.totals[key] += value
+            self.last_ingest_at = datetime.now()
+        return result
+
+    def _write(self, points: List[Dict[str, Any]], result: Dict[str, int]) -> None:
+        if self.use_function:
+            try:
+                written = self.supabase.rpc('ingest_engagement_metrics', {"points": points}).execute().data or {}
+                result["points"] += written.get("points", len(points))
+                result["images"] += written.get("images", 0)
+                result["batches"] += 1
+                return
+            except Exception as e:
+                # Timeouts, 5xx and open circuits are passed on; only a missing function means fall back
+                if not missing_function(e):
+                    raise
+                print(f"ingest_engagement_metrics unavailable, using bulk upserts: {str(e)}")
+                self.use_function = False
+
+        # A bulk upsert sets every column it names, so group points by the
+        # fields they carry; a missing metric then keeps its stored value
+        groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        for point in points:
+            present = {k: v for k, v in point.items() if v is not None}
+            groups.setdefault(tuple(sorted(present)), []).append(present)
+        for group in groups.values():
+            self.supabase.table('engagement_metrics')\
+                .upsert(group, on_conflict='image_id,platform,observed_at')\
+                .execute()
+        rollups = self._rollups({point["image_id"] for point in points})
+        if rollups:
+            self.supabase.table('engagement_rollups').upsert(rollups, on_conflict='image_id').execute()
+        result["points"] += len(points)
+        result["images"] += len(rollups)
+        result["batches"] += 1
+
+    def _rollups(self, image_ids: Iterable[str], chunk_size: int = 100) -> List[Dict[str, Any]]:
+        """Rollup rows for images, from the latest stored reading per platform"""
+        latest: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        image_ids = sorted(image_ids)
+        for start in range(0, len(image_ids), chunk_size):
+            chunk = image_ids[start:start + chunk_size]
+            offset = 0
+            while True:
+                rows = self.supabase.table('engagement_metrics')\
+                    .select('image_id, platform, observed_at, likes, shares, comments, impressions')\
+                    .in_('image_id', chunk)\
+                    .order('observed_at', desc=True)\
+                    .range(offset, offset + 999)\
+                    .execute().data or []
+                for row in rows:
+                    # Newest first, so the first row seen per platform is its latest reading
+                    latest.setdefault((row["image_id"], row["platform"]), row)
+                offset += len(rows)
+                if len(rows) < 1000:
+                    break
+
+        by_image: Dict[str, List[Dict[str, Any]]] = {}
+        for (image_id, _), reading in latest.items():
+            by_image.setdefault(image_id, []).append(reading)
+        now = datetime.now(timezone.utc).isoformat()
+        rollups = []
+        for image_id, readings in by_image.items():
+            rollup = {metric: sum(p.get(metric) or 0 for p in readings) for metric in METRICS}
+            rollup.update({
+                "image_id": image_id,
+                "engagement_score": engagement_score(rollup),
+                "platforms": sorted(p["platform"] for p in readings),
+                "last_observed_at": max(p["observed_at"] for p in readings),
+                "updated_at": now
+            })
+            rollups.append(rollup)
+        return rollups
+
+    def ingest_file(self, path: str) -> Dict[str, int]:
+        return self.ingest(read_drop(path))
+
+    def _move_drop(self, directory: str, name: str, subdirectory: str) -> None:
+        target = os.path.join(directory, subdirectory)
+        os.makedirs(target, exist_ok=True)
+        shutil.move(os.path.join(directory, name), os.path.join(target, name))
+        self.drop_attempts.pop(name, None)
+
+    def ingest_drop_directory(self, directory: str) -> Dict[str, int]:
+        """Ingest every drop file in `directory`, moving each to processed/ once loaded.
+
+        A file that can't be read goes to failed/ straight away; one whose
+        records can't be written is retried on later runs and moved to
+        failed/ after `max_drop_attempts`.
+        """
+        totals = {"files": 0, "points": 0, "rejected": 0, "failed": 0}
+        if not os.path.isdir(directory):
+            return totals
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not name.endswith(DROP_EXTENSIONS) or not os.path.isfile(path):
+                continue
+            try:
+                records = list(read_drop(path))
+            except Exception as e:
+                print(f"Cannot read metrics drop {name}, moving it to failed/: {str(e)}")
+                self._move_drop(directory, name, "failed")
+                totals["failed"] += 1
+                continue
+            try:
+                result = self.ingest(records)
+            except Exception as e:
+                attempts = self.drop_attempts.get(name, 0) + 1
+                self.drop_attempts[name] = attempts
+                if attempts < self.max_drop_attempts:
+                    print(f"Error ingesting metrics from {name} (attempt {attempts}), will retry: {str(e)}")
+                else:
+                    print(f"Error ingesting metrics from {name}, moving it to failed/ after {attempts} attempts: {str(e)}")
+                    self._move_drop(directory, name, "failed")
+                    totals["failed"] += 1
+                continue
+            self._move_drop(directory, name, "processed")
+            totals["files"] += 1
+            totals["points"] += result["points"]
+            totals["rejected"] += result["rejected"]
+            print(f"Ingested {result['points']} metric points from {name} ({result['rejected']} rejected)")
+        return totals
+
+    def recent_posts(self, days: int) -> List[Dict[str, Any]]:
+        """Posts from the last `days` days that platforms can report metrics for"""
+        since = (datetime.now() - timedelta(days=days)).isoformat()
+        return self.supabase.table('feedback')\
+            .select('image_id, platform, external_post_id')\
+            .eq('status', 'posted')\
+            .gte('created_at', since)\
+            .execute().data or []
+
+    async def poll(self, adapters, days: int = 7) -> Dict[str, int]:
+        """Ask every adapter for metrics on its recent posts at once, then ingest them"""
+        posts = self.recent_posts(days)
+        by_platform: Dict[str, List[Dict[str, Any]]] = {}
+        for post in posts:
+            if post.get('external_post_id'):
+                by_platform.setdefault(post['platform'], []).append(post)
+
+        polled = [a for a in adapters if a.supports_metrics and by_platform.get(a.name)]
+        results = await asyncio.gather(*(a.fetch_metrics(by_platform[a.name]) for a in polled),
+                                       return_exceptions=True)
+        records: List[Dict[str, Any]] = []
+        for adapter, result in zip(polled, results):
+            if isinstance(result, Exception):
+                print(f"Error fetching metrics from {adapter.name}: {str(result)}")
+                continue
+            for record in result:
+                record.setdefault("platform", adapter.name)
+            records.extend(result)
+        return self.ingest(records)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.totals,
+                "mode": "function" if self.use_function else "bulk_upsert",
+                "last_ingest_at": self.last_ingest_at.isoformat() if self.last_ingest_at else None
+            }
@@ -1,11 +1,11 @@
 import os
 from dotenv import load_dotenv
-from supabase import create_client, Client, __version__ as supabase_version
+from supabase import __version__ as supabase_version
 import json
 from typing import Dict, Any, Literal, List, Optional
 from datetime import datetime
 from openai import OpenAI
-import requests
+from service_clients import create_supabase_client, openai_http_client
 from PIL import Image
 from io import BytesIO
 import socket
@@ -54,7 +54,7 @@ except Exception as e:
 try:
     # Initialize Supabase client with only the required parameters
     # Explicitly avoiding any proxy settings
-    supabase = create_client(
+    supabase = create_supabase_client(
         supabase_url=supabase_url,
         supabase_key=supabase_key
     )
@@ -69,7 +69,7 @@ if not openai_api_key:
     print("Warning: OPENAI_API_KEY not found in .env file")
     openai_client = None
 else:
-    openai_client = OpenAI(api_key=openai_api_key)
+    openai_client = OpenAI(api_key=openai_api_key, http_client=openai_http_client())
 
 # Marvin's specific ID
 MARVIN_ID = "af871ddd-febb-4454-9171-080450357b8c"
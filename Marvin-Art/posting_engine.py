@@ -0,0 +1,197 @@
+import time
+import uuid
+import random
+import asyncio
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Columns every feedback table has; used if the post columns migration hasn't been run
+LEGACY_FEEDBACK_COLUMNS = ("image_id", "platform", "posted_at", "status")
+
+# PostgREST's and Postgres's errors for a column that doesn't exist
+MISSING_COLUMN_CODES = ("PGRST204", "42703")
+
+
+def missing_column(error: Exception) -> bool:
+    """True if an insert failed only because a column isn't there"""
+    code = getattr(error, "code", None)
+    return code in MISSING_COLUMN_CODES or any(c in str(error) for c in MISSING_COLUMN_CODES)
+
+
+class PlatformError(Exception):
+    """A platform rejected or failed a post"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate_per_hour` tokens, up to `burst` saved up.
+
+    Uses a threading lock rather than asyncio primitives because posts run
+    both on the API's event loop and on the scheduler thread's own loop.
+    """
+
+    def __init__(self, rate_per_hour: float, burst: int = 1):
+        self.rate = rate_per_hour / 3600.0
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> bool:
+        """Take a token if one is available"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def wait_time(self) -> float:
+        """Seconds until a token will be available"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                return 0.0
+            return (1 - self.tokens) / self.rate if self.rate else float("inf")
+
+
+class PlatformAdapter:
+    """Interface for a social platform.
+
+    Subclasses implement post(); the class attributes set the platform's
+    rate limit and retry policy.
+    """
+
+    name = "platform"
+    posts_per_hour = 10
+    burst = 2
+    max_attempts = 3
+    retries_per_hour = 10  # retry budget shared by all posts to this platform
+    supports_metrics = False  # set by adapters that implement fetch_metrics
+
+    async def post(self, image: Dict[str, Any]) -> Dict[str, Any]:
+        """Publish the image and return {"post_id": ..., "url": ...}; raise PlatformError on failure"""
+        raise NotImplementedError
+
+    async def fetch_metrics(self, posts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Current engagement for feedback rows (image_id, external_post_id) as raw metric records.
+
+        Only called when supports_metrics is set.
+        """
+        return []
+
+
+class StubAdapter(PlatformAdapter):
+    """Local stand-in for a real platform: waits, then succeeds or fails at random.
+
+    It reports no metrics, so nothing made up reaches engagement_metrics.
+    """
+
+    def __init__(self, name: str, latency_seconds: float = 0.2, failure_rate: float = 0.0):
+        self.name = name
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+
+    async def post(self, image: Dict[str, Any]) -> Dict[str, Any]:
+        await asyncio.sleep(self.latency_seconds)
+        if random.random() < self.failure_rate:
+            raise PlatformError(f"{self.name} stub failure")
+        post_id = uuid.uuid4().hex[:12]
+        return {"post_id": post_id, "url": f"https://{self.name}.example/posts/{post_id}"}
+
+
+class PostingEngine:
+    """Fans one artwork out to every configured platform concurrently.
+
+    Each platform has its own token bucket for posts and for retries;
+    failed attempts back off exponentially until the attempt limit or the
+    retry budget runs out. The outcome for every platform is recorded in
+    one bulk insert into feedback.
+    """
+
+    def __init__(self, supabase, adapters: List[PlatformAdapter],
+                 max_wait_seconds: float = 60.0, retry_base_seconds: float = 2.0):
+        self.supabase = supabase
+        self.adapters = adapters
+        self.max_wait_seconds = max_wait_seconds
+        self.retry_base_seconds = retry_base_seconds
+        self.limits = {a.name: TokenBucket(a.posts_per_hour, a.burst) for a in adapters}
+        self.retry_budgets = {a.name: TokenBucket(a.retries_per_hour, a.retries_per_hour) for a in adapters}
+
+    async def _post_to(self, adapter: PlatformAdapter, image: Dict[str, Any]) -> Dict[str, Any]:
+        row = {
+            "image_id": image["id"],
+            "platform": adapter.name,
+            "posted_at": datetime.now().isoformat(),
+            "status": "failed",
+            "external_post_id": None,
+            "post_url": None,
+            "attempts": 0,
+            "error": None
+        }
+
+        limit = self.limits[adapter.name]
+        wait = limit.wait_time()
+        if wait > self.max_wait_seconds:
+            row["status"] = "rate_limited"
+            row["error"] = f"rate limit: next slot in {wait:.0f}s"
+            return row
+        if wait:
+            await asyncio.sleep(wait)
+        if not limit.take():
+            row["status"] = "rate_limited"
+            row["error"] = "rate limit"
+            return row
+
+        while True:
+            row["attempts"] += 1
+            try:
+                result = await adapter.post(image)
+                row.update({
+                    "status": "posted",
+                    "posted_at": datetime.now().isoformat(),
+                    "external_post_id": result.get("post_id"),
+                    "post_url": result.get("url"),
+                    "error": None
+                })
+                return row
+            except Exception as e:
+                row["error"] = str(e)
+                print(f"Posting image {image['id']} to {adapter.name} failed (attempt {row['attempts']}): {str(e)}")
+                if row["attempts"] >= adapter.max_attempts or not self.retry_budgets[adapter.name].take():
+                    return row
+                await asyncio.sleep(self.retry_base_seconds * 2 ** (row["attempts"] - 1))
+
+    async def post(self, image: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Post to all platforms at once and record the results; returns the feedback rows"""
+        rows = await asyncio.gather(*(self._post_to(adapter, image) for adapter in self.adapters))
+        try:
+            self.record(rows)
+        except Exception as e:
+            if not any(row["status"] == "posted" for row in rows):
+                raise
+            # A platform has the post already; raising would put the image back in the queue to be posted again
+            print(f"Error recording feedback for image {image['id']}, which was posted anyway: {str(e)}")
+        return rows
+
+    def record(self, rows: List[Dict[str, Any]]) -> None:
+        try:
+            self.supabase.table('feedback').insert(rows).execute()
+        except Exception as e:
+            if not missing_column(e):
+                raise
+            # Post columns not added yet (add_feedback_post_columns.sql): keep the basics
+            print(f"Feedback post columns missing, retrying with basic columns: {str(e)}")
+            self.supabase.table('feedback').insert(
+                [{k: row[k] for k in LEGACY_FEEDBACK_COLUMNS} for row in rows]
+            ).execute()
+
+
+def stub_adapters(platforms: str) -> List[PlatformAdapter]:
+    """Stub adapters for a comma-separated platform list, e.g. "twitter,instagram" """
+    return [StubAdapter(name.strip()) for name in platforms.split(",") if name.strip()]
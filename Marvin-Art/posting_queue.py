@@ -0,0 +1,236 @@
+import re
+import math
+import heapq
+import random
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Weights are exp(score - reference); rebase before the newest scores overflow a float
+MAX_WEIGHT_EXPONENT = 300
+
+
+def prompt_tokens(text: Optional[str]) -> Set[str]:
+    return {t for t in TOKEN_PATTERN.findall((text or "").lower()) if len(t) > 2}
+
+
+def parse_created_at(value: Optional[str]) -> float:
+    """POSIX timestamp of a Supabase created_at; naive values are taken as UTC"""
+    if not value:
+        return 0.0
+    try:
+        # fromisoformat on Python 3.8 wants exactly 6 fractional digits and no 'Z'
+        value = value.replace('Z', '+00:00')
+        main, _, rest = value.partition('.')
+        if rest:
+            digits = ''.join(c for c in rest if c.isdigit())
+            value = f"{main}.{digits[:6].ljust(6, '0')}{rest[len(digits):]}"
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    except ValueError:
+        return 0.0
+
+
+class _FenwickTree:
+    """Prefix sums over slot weights, for O(log n) weighted sampling"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.tree = [0.0] * (size + 1)
+
+    def add(self, slot: int, delta: float) -> None:
+        i = slot + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def total(self) -> float:
+        result, i = 0.0, self.size
+        while i > 0:
+            result += self.tree[i]
+            i -= i & -i
+        return result
+
+    def find(self, target: float) -> int:
+        """Slot whose cumulative weight range contains target"""
+        position = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            following = position + step
+            if following <= self.size and self.tree[following] <= target:
+                position = following
+                target -= self.tree[following]
+            step >>= 1
+        return min(position, self.size - 1)
+
+
+class PostingQueue:
+    """Unposted images ranked for posting.
+
+    Each image is scored once, when it is added:
+
+        score = ln(2) * created_at / half_life + ln(quality) - duplicate_weight * similarity
+
+    Because recency enters as a linear term in log space, every score decays
+    at the same rate, so the order never changes as time passes and scores
+    never need recomputing. similarity is the highest token overlap
+    (Jaccard) between the prompt and the most recent prompts already seen,
+    so near-duplicates sink. The best image is popped from a heap with lazy
+    deletion in O(log n); pick(sample=True) instead draws an image with
+    probability proportional to exp(score / temperature) from a Fenwick
+    tree, also in O(log n).
+    """
+
+    def __init__(self, half_life_hours: float = 72.0, duplicate_weight: float = 3.0,
+                 temperature: float = 1.0, recent_prompts: int = 200):
+        self.half_life_seconds = half_life_hours * 3600
+        self.duplicate_weight = duplicate_weight
+        self.temperature = temperature
+        self.recent = deque(maxlen=recent_prompts)
+        self.newest_at: Optional[str] = None
+        self.entries: Dict[str, Dict[str, Any]] = {}  # image id -> entry
+        self._heap: List[tuple] = []  # (-score, sequence, image id); stale items are skipped
+        self._sequence = 0
+        self._slots: List[Optional[str]] = []
+        self._free_slots: List[int] = []
+        self._tree = _FenwickTree(0)
+        self._reference: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, image_id: str) -> bool:
+        return image_id in self.entries
+
+    def quality(self, image: Dict[str, Any]) -> float:
+        """Quality multiplier from what we know at ingest; engagement can feed in via `boost`"""
+        quality = 1.0
+        if (image.get('settings') or {}).get('quality') == 'hd':
+            quality += 0.2
+        if image.get('generation_type') == 'manual':
+            quality += 0.3  # somebody asked for this one
+        return quality
+
+    def score(self, image: Dict[str, Any], tokens: Set[str], boost: float = 0.0) -> float:
+        similarity = 0.0
+        if tokens:
+            for seen in self.recent:
+                union = len(tokens | seen)
+                if union:
+                    similarity = max(similarity, len(tokens & seen) / union)
+        recency = math.log(2) * parse_created_at(image.get('created_at')) / self.half_life_seconds
+        return recency + math.log(self.quality(image)) + boost - self.duplicate_weight * similarity
+
+    def note_prompt(self, text: Optional[str]) -> None:
+        """Remember a prompt (e.g. of an already posted image) for the duplicate penalty"""
+        tokens = prompt_tokens(text)
+        if tokens:
+            self.recent.append(tokens)
+
+    def add(self, image: Dict[str, Any], boost: float = 0.0, score: Optional[float] = None) -> float:
+        """Score and queue an image row (with prompts(text) joined); returns its score.
+
+        Pass the score returned by pick() to put an image back unchanged.
+        """
+        image_id = image['id']
+        with self._lock:
+            if image_id in self.entries:
+                return self.entries[image_id]['score']
+            if score is None:
+                tokens = prompt_tokens((image.get('prompts') or {}).get('text'))
+                score = self.score(image, tokens, boost)
+                if tokens:
+                    self.recent.append(tokens)
+            created_at = image.get('created_at')
+            if created_at and (self.newest_at is None or created_at > self.newest_at):
+                self.newest_at = created_at
+
+            slot = self._free_slots.pop() if self._free_slots else self._new_slot()
+            self._slots[slot] = image_id
+            self._sequence += 1
+            entry = {"id": image_id, "score": score, "slot": slot, "weight": 0.0, "sequence": self._sequence}
+            self.entries[image_id] = entry
+            heapq.heappush(self._heap, (-score, self._sequence, image_id))
+            self._set_weight(entry)
+            return score
+
+    def _new_slot(self) -> int:
+        self._slots.append(None)
+        if len(self._slots) > self._tree.size:
+            self._rebuild(max(16, 2 * self._tree.size))
+        return len(self._slots) - 1
+
+    def _rebuild(self, size: int, reference: Optional[float] = None) -> None:
+        """Recreate the Fenwick tree (on growth or when rebasing weights)"""
+        self._tree = _FenwickTree(size)
+        if reference is not None:
+            self._reference = reference
+        for entry in self.entries.values():
+            entry["weight"] = 0.0
+            self._set_weight(entry)
+
+    def _set_weight(self, entry: Dict[str, Any]) -> None:
+        exponent_score = entry["score"] / self.temperature
+        if self._reference is None:
+            self._reference = exponent_score
+        if exponent_score - self._reference > MAX_WEIGHT_EXPONENT:
+            # Rebasing also sets this entry's weight
+            self._rebuild(self._tree.size, reference=exponent_score)
+            return
+        weight = math.exp(max(-MAX_WEIGHT_EXPONENT, exponent_score - self._reference))
+        self._tree.add(entry["slot"], weight - entry["weight"])
+        entry["weight"] = weight
+
+    def remove(self, image_id: str) -> bool:
+        """Drop an image (e.g. posted manually); its heap entry is skipped later"""
+        with self._lock:
+            return self._remove(image_id) is not None
+
+    def _remove(self, image_id: str) -> Optional[Dict[str, Any]]:
+        entry = self.entries.pop(image_id, None)
+        if entry is None:
+            return None
+        self._tree.add(entry["slot"], -entry["weight"])
+        self._slots[entry["slot"]] = None
+        self._free_slots.append(entry["slot"])
+        return entry
+
+    def _is_live(self, item: tuple) -> bool:
+        entry = self.entries.get(item[2])
+        return entry is not None and entry["sequence"] == item[1]
+
+    def peek(self) -> Optional[str]:
+        with self._lock:
+            while self._heap and not self._is_live(self._heap[0]):
+                heapq.heappop(self._heap)
+            return self._heap[0][2] if self._heap else None
+
+    def pick(self, sample: bool = False) -> Optional[Dict[str, Any]]:
+        """Remove and return the next {"id", "score"}: the best one, or a weighted random draw"""
+        with self._lock:
+            if sample and self.entries:
+                total = self._tree.total()
+                if total > 0:
+                    slot = self._tree.find(random.random() * total)
+                    image_id = self._slots[slot]
+                    if image_id is not None:
+                        entry = self._remove(image_id)
+                        return {"id": image_id, "score": entry["score"]}
+            while self._heap:
+                item = heapq.heappop(self._heap)
+                if self._is_live(item):
+                    entry = self._remove(item[2])
+                    return {"id": item[2], "score": entry["score"]}
+            return None
+
+    def top(self, n: int = 10) -> List[Dict[str, Any]]:
+        """Highest-ranked entries, for inspection"""
+        with self._lock:
+            ranked = heapq.nsmallest(n, ((-e["score"], e["id"]) for e in self.entries.values()))
+            return [{"id": image_id, "score": -neg_score} for neg_score, image_id in ranked]
@@ -0,0 +1,77 @@
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional, Sized
+
+
+class PostingStats:
+    """In-memory posting counters for /stats.
+
+    Counts are bumped as posts are made and new images appear, and
+    periodically reconciled against the database with count-only queries,
+    so reading them never touches the database.
+    """
+
+    def __init__(self, supabase):
+        self.supabase = supabase
+        self.posted_today = 0
+        self.unposted_count = 0
+        self.total_images = 0
+        self.total_posted = 0
+        self.day = datetime.now().date()
+        self.updated_at: Optional[datetime] = None
+        self.reconciled_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def _roll_over(self) -> None:
+        today = datetime.now().date()
+        if today != self.day:
+            self.day = today
+            self.posted_today = 0
+
+    def _count(self, table: str) -> int:
+        """Exact row count without downloading the rows"""
+        return self.supabase.table(table).select('id', count='exact').limit(1).execute().count or 0
+
+    def reconcile(self, posted_ids: Sized) -> None:
+        """Recompute every counter from the database"""
+        today = datetime.now().date()
+        # Images posted today, counting an image posted to several platforms once
+        posted_today = len({row['image_id'] for row in self.supabase.table('feedback')
+                            .select('image_id')
+                            .eq('status', 'posted')
+                            .gte('created_at', today.isoformat())
+                            .execute().data})
+        total_images = self._count('images')
+        with self._lock:
+            self.day = today
+            self.posted_today = posted_today
+            self.total_images = total_images
+            self.total_posted = len(posted_ids)
+            self.unposted_count = max(0, total_images - len(posted_ids))
+            self.reconciled_at = self.updated_at = datetime.now()
+
+    def record_post(self, image_id: str) -> None:
+        with self._lock:
+            self._roll_over()
+            self.posted_today += 1
+            self.total_posted += 1
+            self.unposted_count = max(0, self.unposted_count - 1)
+            self.updated_at = datetime.now()
+
+    def record_new_images(self, count: int = 1) -> None:
+        with self._lock:
+            self.total_images += count
+            self.unposted_count += count
+            self.updated_at = datetime.now()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._roll_over()
+            return {
+                "posted_today": self.posted_today,
+                "unposted_count": self.unposted_count,
+                "total_images": self.total_images,
+                "total_posted": self.total_posted,
+                "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+                "reconciled_at": self.reconciled_at.isoformat() if self.reconciled_at else None
+            }
@@ -0,0 +1,197 @@
+import os
+import time
+import threading
+from typing import Any, Dict, Optional
+
+import httpx
+from supabase import Client, create_client
+
+from circuit_breaker import CircuitBreaker, breaker_stats, circuit_breaker
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Kept identical in src/ and Marvin-Art/, since each service is built from its own directory
+
+# Connect quickly or give up; reads get longer for image downloads and DALL-E
+CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+READ_TIMEOUT_SECONDS = float(os.getenv("HTTP_READ_TIMEOUT_SECONDS", "30"))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "120"))
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+
+_clients: Dict[str, httpx.Client] = {}
+_metrics: Dict[str, Dict[str, Any]] = {}
+_lock = threading.Lock()
+_create_lock = threading.Lock()
+
+
+def _timeout(read_seconds: float) -> httpx.Timeout:
+    return httpx.Timeout(read_seconds, connect=CONNECT_TIMEOUT_SECONDS)
+
+
+class _MeteredTransport(httpx.HTTPTransport):
+    """Connection-pooling transport that counts requests, failures and time to response headers.
+
+    With a circuit breaker, transport errors and 5xx responses count against
+    the dependency, and requests are refused without a network round trip
+    while its circuit is open.
+    """
+
+    def __init__(self, name: str, breaker: Optional[CircuitBreaker] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.breaker = breaker
+        with _lock:
+            self.metrics = _metrics.setdefault(name, {
+                "requests": 0, "errors": 0, "in_flight": 0, "status": {}, "total_seconds": 0.0
+            })
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.breaker is not None:
+            self.breaker.before_call()
+        started_at = time.monotonic()
+        with _lock:
+            self.metrics["requests"] += 1
+            self.metrics["in_flight"] += 1
+        try:
+            response = super().handle_request(request)
+        except Exception as e:
+            with _lock:
+                self.metrics["errors"] += 1
+            if self.breaker is not None:
+                self.breaker.record_failure(repr(e))
+            raise
+        finally:
+            with _lock:
+                self.metrics["in_flight"] -= 1
+                self.metrics["total_seconds"] += time.monotonic() - started_at
+        status = f"{response.status_code // 100}xx"
+        with _lock:
+            self.metrics["status"][status] = self.metrics["status"].get(status, 0) + 1
+        if self.breaker is not None:
+            if response.status_code >= 500:
+                self.breaker.record_failure(f"HTTP {response.status_code}")
+            else:
+                self.breaker.record_success()
+        return response
+
+
+def pooled_client(name: str, client_class=httpx.Client, read_timeout: float = READ_TIMEOUT_SECONDS,
+                  breaker: Optional[CircuitBreaker] = None, **kwargs) -> httpx.Client:
+    """A keep-alive httpx client (HTTP/2 when h2 is installed) whose use shows in pool_stats()"""
+    transport = _MeteredTransport(
+        name,
+        breaker=breaker,
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_SECONDS
+        )
+    )
+    client = client_class(timeout=_timeout(read_timeout), transport=transport, **kwargs)
+    with _lock:
+        _clients[name] = client
+    return client
+
+
+def http_client(name: str = "http") -> httpx.Client:
+    """Shared client for plain HTTP fetches (images from storage and DALL-E URLs)"""
+    with _create_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = pooled_client(name, follow_redirects=True)
+        return client
+
+
+def http_get(url: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+    """GET through the shared pool, with a read timeout in seconds if given"""
+    if timeout is not None:
+        kwargs["timeout"] = _timeout(timeout)
+    return http_client().get(url, **kwargs)
+
+
+def create_supabase_client(supabase_url: str, supabase_key: str) -> Client:
+    """Supabase client whose database and storage requests go through pooled HTTP/2 sessions.
+
+    supabase-py 2.3 doesn't take an HTTP client, so the sessions it builds
+    are swapped for pooled ones with the same base URL and headers. Both
+    share the "supabase" circuit breaker.
+    """
+    client = create_client(supabase_url=supabase_url, supabase_key=supabase_key)
+    try:
+        rest = client.postgrest
+        session = rest.session
+        rest.session = pooled_client(
+            "supabase", type(session), breaker=circuit_breaker("supabase"),
+            base_url=session.base_url, headers=session.headers
+        )
+        session.close()
+
+        storage = client.storage
+        session = storage.session
+        storage.session = storage._client = pooled_client(
+            "storage", type(session), read_timeout=60, breaker=circuit_breaker("supabase"),
+            base_url=session.base_url, headers=session.headers, follow_redirects=True
+        )
+        session.close()
+    except Exception as e:
+        print(f"Using supabase-py's own HTTP sessions: {str(e)}")
+    return client
+
+
+def after_keyset(query, column: str, value: str, last_id: str, descending: bool = False):
+    """Limit a query to rows after (value, last_id) in (column, id) order.
+
+    Order the query by column and id the same way. postgrest-py 0.13 has no
+    or_(), so the PostgREST or filter is added as a raw parameter; values
+    are quoted since timestamps contain reserved characters.
+    """
+    op = "lt" if descending else "gt"
+    query.params = query.params.add(
+        "or", f'({column}.{op}."{value}",and({column}.eq."{value}",id.{op}."{last_id}"))'
+    )
+    return query
+
+
+def openai_http_client() -> httpx.Client:
+    """Pooled client for the OpenAI SDK (DALL-E calls can take a minute)"""
+    return pooled_client("openai", read_timeout=OPENAI_TIMEOUT_SECONDS, breaker=circuit_breaker("openai"))
+
+
+def _connections(client: httpx.Client) -> Dict[str, int]:
+    connections = list(client._transport._pool.connections)
+    return {
+        "open": len(connections),
+        "idle": sum(1 for c in connections if c.is_idle()),
+        "http2": sum(1 for c in connections if "HTTP/2" in c.info())
+    }
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Requests, responses by status class, mean time to first byte and open connections per pool,
+    plus the state of each dependency's circuit breaker"""
+    with _lock:
+        clients = dict(_clients)
+        snapshot = {name: {**m, "status": dict(m["status"])} for name, m in _metrics.items()}
+    stats = {}
+    for name, metrics in snapshot.items():
+        total_seconds = metrics.pop("total_seconds")
+        finished = metrics["requests"] - metrics["in_flight"]
+        metrics["mean_seconds"] = round(total_seconds / finished, 4) if finished else None
+        if name in clients:
+            try:
+                metrics["connections"] = _connections(clients[name])
+            except Exception:
+                pass
+        stats[name] = metrics
+    return {
+        "http2": HTTP2_AVAILABLE,
+        "limits": {"max_connections": MAX_CONNECTIONS, "max_keepalive_connections": MAX_KEEPALIVE_CONNECTIONS},
+        "pools": stats,
+        "circuits": breaker_stats()
+    }
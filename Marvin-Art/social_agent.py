@@ -1,16 +1,23 @@
 import os
 from dotenv import load_dotenv
-from supabase import create_client, Client, __version__ as supabase_version
+from supabase import __version__ as supabase_version
 import json
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 import time
+import asyncio
 import schedule
 from threading import Thread
-import requests
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 import uvicorn
+from posting_stats import PostingStats
+from posting_engine import PostingEngine, stub_adapters
+from posting_queue import PostingQueue
+from engagement_ingest import EngagementIngester
+from posted_index import PostedIndex
+from event_bus import make_event_bus
+from service_clients import create_supabase_client, pool_stats
 
 # Load environment variables
 load_dotenv()
@@ -34,7 +41,7 @@ print(f"Supabase Python library version: {supabase_version}")
 try:
     # Initialize Supabase client with only the required parameters
     # Explicitly avoiding any proxy settings
-    supabase = create_client(
+    supabase = create_supabase_client(
         supabase_url=supabase_url,
         supabase_key=supabase_key
     )
@@ -48,60 +55,228 @@ except Exception as e:
 # Constants
 MAX_POSTS_PER_DAY = 2
 POSTING_INTERVAL_HOURS = 12
+STATS_RECONCILE_MINUTES = 15
+
+# Platforms each artwork is posted to; local stub adapters until real ones are added
+SOCIAL_PLATFORMS = os.getenv("SOCIAL_PLATFORMS", "twitter")
+
+# How auto_post picks from the ranked queue: "top" (best score) or "weighted" (random, weighted by score)
+POST_SELECTION = os.getenv("POST_SELECTION", "top")
+QUEUE_COLUMNS = 'id, created_at, settings, generation_type, prompts(text)'
+QUEUE_PAGE_SIZE = 1000
+# Images read at startup, newest first; older ones are paged in when the queue runs dry
+QUEUE_LOAD_LIMIT = int(os.getenv("QUEUE_LOAD_LIMIT", "5000"))
+
+# Engagement metrics: platforms are polled for posts this recent, and
+# JSONL/CSV files dropped in METRICS_DROP_DIR are loaded every minute
+METRICS_POLL_MINUTES = int(os.getenv("METRICS_POLL_MINUTES", "30"))
+METRICS_POLL_DAYS = int(os.getenv("METRICS_POLL_DAYS", "7"))
+METRICS_DROP_DIR = os.getenv("METRICS_DROP_DIR", "data/metrics_drop")
+METRICS_BATCH_SIZE = int(os.getenv("METRICS_BATCH_SIZE", "5000"))
+
+# New images and posts arrive as events (image.created / image.posted) from the
+# generator and other agents; polling the tables then only backs them up
+event_bus = make_event_bus("social_agent")
+print(f"Event bus: {event_bus.describe()}")
 
 class SocialAgent:
     def __init__(self):
-        self.posted_images = set()
+        self.posted_images = PostedIndex(supabase)
+        self.stats = PostingStats(supabase)
+        self.engine = PostingEngine(supabase, stub_adapters(SOCIAL_PLATFORMS))
+        self.queue = PostingQueue()
+        self.metrics = EngagementIngester(supabase, batch_size=METRICS_BATCH_SIZE)
+        self.last_table_check: Optional[float] = None
+        # created_at high-water mark over every image row read, plus how many rows at it were read
+        self.images_mark: Optional[str] = None
+        self.images_at_mark = 0
+        # How many images, newest first, have been read into the queue so far
+        self.older_offset = 0
+        self.older_exhausted = False
         self.load_posted_images()
+        self.load_queue()
+        self.reconcile_stats()
+        event_bus.subscribe("image.created", self.on_image_created)
+        event_bus.subscribe("image.posted", self.on_image_posted, remote_only=True)
 
     def load_posted_images(self):
         """Load IDs of images that have already been posted"""
         try:
-            response = supabase.table('feedback').select('image_id').execute()
-            self.posted_images = {item['image_id'] for item in response.data}
+            self.posted_images.sync()
+            print(f"Posted index loaded with {len(self.posted_images)} images "
+                  f"({self.posted_images.memory_bytes() / 1e6:.1f} MB)")
         except Exception as e:
             print(f"Error loading posted images: {str(e)}")
 
+    def sync_posted_images(self):
+        """Pick up posts made since the last sync, e.g. by another process"""
+        try:
+            for image_id in self.posted_images.sync():
+                self.queue.remove(image_id)
+        except Exception as e:
+            print(f"Error syncing posted images: {str(e)}")
+
+    def reconcile_stats(self):
+        """Bring the in-memory /stats counters back in line with the database"""
+        try:
+            self.stats.reconcile(self.posted_images)
+        except Exception as e:
+            print(f"Error reconciling posting stats: {str(e)}")
+
+    def _advance_images_mark(self, rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            if row['created_at'] == self.images_mark:
+                self.images_at_mark += 1
+            elif self.images_mark is None or row['created_at'] > self.images_mark:
+                self.images_mark = row['created_at']
+                self.images_at_mark = 1
+
+    def _queue_rows(self, rows: List[Dict[str, Any]]) -> int:
+        """Add unposted rows to the queue; posted ones still count for the duplicate penalty"""
+        added = 0
+        for row in rows:
+            if row['id'] in self.posted_images:
+                self.queue.note_prompt((row.get('prompts') or {}).get('text'))
+            elif row['id'] not in self.queue:
+                self.queue.add(row)
+                added += 1
+        return added
+
+    def _older_images(self, limit: int) -> List[Dict[str, Any]]:
+        """Up to limit image rows older than those read so far, newest first"""
+        rows = []
+        while len(rows) < limit and not self.older_exhausted:
+            size = min(QUEUE_PAGE_SIZE, limit - len(rows))
+            # Offsets from the newest end: images created meanwhile shift them, which
+            # only means a few rows are read twice, and the queue ignores those
+            page = supabase.table('images').select(QUEUE_COLUMNS)\
+                .order('created_at.desc,id.desc')\
+                .range(self.older_offset, self.older_offset + size - 1)\
+                .execute().data or []
+            rows.extend(page)
+            self.older_offset += len(page)
+            self.older_exhausted = len(page) < size
+        return rows
+
+    def load_queue(self):
+        """Score the newest QUEUE_LOAD_LIMIT unposted images into the posting queue"""
+        try:
+            rows = self._older_images(QUEUE_LOAD_LIMIT)
+            self._advance_images_mark(rows)
+            # Oldest first, so the duplicate penalty compares each prompt with earlier ones
+            self._queue_rows(rows[::-1])
+            print(f"Posting queue loaded with {len(self.queue)} images"
+                  + ("" if self.older_exhausted else f" from the newest {len(rows)}; older ones load when it runs dry"))
+        except Exception as e:
+            print(f"Error loading posting queue: {str(e)}")
+
+    def load_older_images(self) -> int:
+        """Page older images into an empty queue; returns how many were queued"""
+        added = 0
+        while not added and not self.older_exhausted:
+            for row in self._older_images(QUEUE_PAGE_SIZE)[::-1]:
+                if row['id'] not in self.posted_images and row['id'] not in self.queue:
+                    self.queue.add(row)
+                    added += 1
+        if added:
+            print(f"Queued {added} older images for posting")
+        return added
+
+    def check_new_images(self):
+        """Queue images generated since the newest one we have seen"""
+        try:
+            added = 0
+            while True:
+                query = supabase.table('images').select(QUEUE_COLUMNS).order('created_at,id')
+                if self.images_mark:
+                    # gte plus a skip count, so images sharing the mark's timestamp are neither lost nor re-read
+                    query = query.gte('created_at', self.images_mark)
+                response = query.range(self.images_at_mark, self.images_at_mark + QUEUE_PAGE_SIZE - 1).execute()
+                added += self._queue_rows(response.data)
+                self._advance_images_mark(response.data)
+                if len(response.data) < QUEUE_PAGE_SIZE:
+                    break
+            if added:
+                self.stats.record_new_images(added)
+                print(f"Queued {added} new images for posting")
+        except Exception as e:
+            print(f"Error checking for new images: {str(e)}")
+
+    def check_tables(self):
+        """Poll for new images and posts: every minute until events from another
+        process have been seen, then only every STATS_RECONCILE_MINUTES as a backstop"""
+        now = time.monotonic()
+        if event_bus.remote and self.last_table_check is not None \
+                and now - self.last_table_check < STATS_RECONCILE_MINUTES * 60:
+            return
+        self.last_table_check = now
+        self.check_new_images()
+        self.sync_posted_images()
+
+    def on_image_created(self, event: Dict[str, Any]):
+        """Queue a freshly generated image as soon as the generator announces it"""
+        if self._queue_rows([event['data']]):
+            self.stats.record_new_images(1)
+
+    def on_image_posted(self, event: Dict[str, Any]):
+        """Another agent process posted an image: don't post it again"""
+        image_id = event['data']['id']
+        self.queue.remove(image_id)
+        if self.posted_images.add(image_id):
+            self.stats.record_post(image_id)
+
+    def poll_metrics(self):
+        """Fetch engagement for recent posts from every platform"""
+        try:
+            result = asyncio.run(self.metrics.poll(self.engine.adapters, days=METRICS_POLL_DAYS))
+            print(f"Polled {result['points']} metric points for {result['images']} images")
+        except Exception as e:
+            print(f"Error polling engagement metrics: {str(e)}")
+
+    def ingest_metrics_drop(self):
+        """Load any metrics files dropped in METRICS_DROP_DIR"""
+        try:
+            self.metrics.ingest_drop_directory(METRICS_DROP_DIR)
+        except Exception as e:
+            print(f"Error ingesting metrics drop: {str(e)}")
+
     def get_posted_images_today(self) -> int:
-        """Get count of images posted today"""
+        """Get count of images posted today (an image posted to several platforms counts once)"""
         try:
             today = datetime.now().date()
-            response = supabase.table('feedback').select('id').gte('created_at', today.isoformat()).execute()
-            return len(response.data)
+            response = supabase.table('feedback').select('image_id')\
+                .eq('status', 'posted')\
+                .gte('created_at', today.isoformat())\
+                .execute()
+            return len({item['image_id'] for item in response.data})
         except Exception as e:
             print(f"Error getting posted images count: {str(e)}")
             return 0
 
-    def get_unposted_images(self) -> List[Dict[str, Any]]:
-        """Get list of images that haven't been posted yet"""
-        try:
-            response = supabase.table('images').select('*').not_.in_('id', list(self.posted_images)).execute()
-            return response.data
-        except Exception as e:
-            print(f"Error getting unposted images: {str(e)}")
-            return []
-
-    def post_image(self, image_data: Dict[str, Any]) -> bool:
-        """Post an image to social media and record feedback"""
+    async def post_image_async(self, image_data: Dict[str, Any]) -> bool:
+        """Post an image to every platform at once and record one feedback row per platform"""
         try:
-            # Here you would implement the actual social media posting
-            # For now, we'll just record it in the feedback table
-            feedback_data = {
-                'image_id': image_data['id'],
-                'posted_at': datetime.now().isoformat(),
-                'platform': 'twitter',  # or whatever platform you're using
-                'status': 'posted'
-            }
-            
-            response = supabase.table('feedback').insert(feedback_data).execute()
-            if response.data:
+            rows = await self.engine.post(image_data)
+            for row in rows:
+                print(f"{row['platform']}: {row['status']}" + (f" ({row['error']})" if row['error'] else ""))
+            if any(row['status'] == 'posted' for row in rows):
                 self.posted_images.add(image_data['id'])
+                self.queue.remove(image_data['id'])
+                self.stats.record_post(image_data['id'])
+                event_bus.publish("image.posted", {
+                    "id": image_data['id'],
+                    "platforms": [row['platform'] for row in rows if row['status'] == 'posted']
+                })
                 return True
             return False
         except Exception as e:
             print(f"Error posting image: {str(e)}")
             return False
 
+    def post_image(self, image_data: Dict[str, Any]) -> bool:
+        """Blocking version of post_image_async for the scheduler thread"""
+        return asyncio.run(self.post_image_async(image_data))
+
     def auto_post(self):
         """Automatically post images based on schedule"""
         try:
@@ -110,20 +285,27 @@ class SocialAgent:
                 print("Daily post limit reached")
                 return
 
-            # Get unposted images
-            unposted_images = self.get_unposted_images()
-            if not unposted_images:
+            # Take the next image from the ranked queue
+            picked = self.queue.pick(sample=POST_SELECTION == "weighted")
+            if not picked and self.load_older_images():
+                picked = self.queue.pick(sample=POST_SELECTION == "weighted")
+            if not picked:
                 print("No unposted images available")
                 return
 
-            # Select a random image to post
-            import random
-            image_to_post = random.choice(unposted_images)
+            response = supabase.table('images').select('*, prompts(text)').eq('id', picked['id']).execute()
+            if not response.data:
+                print(f"Image {picked['id']} no longer exists, skipping")
+                return
+            image_to_post = response.data[0]
             
             # Post the image
             if self.post_image(image_to_post):
+                self.queue.note_prompt((image_to_post.get('prompts') or {}).get('text'))
                 print(f"Successfully posted image {image_to_post['id']}")
             else:
+                # Back in line for the next run, with the score it had
+                self.queue.add(image_to_post, score=picked['score'])
                 print(f"Failed to post image {image_to_post['id']}")
         except Exception as e:
             print(f"Error in auto_post: {str(e)}")
@@ -134,6 +316,15 @@ social_agent = SocialAgent()
 # Schedule auto-posting
 schedule.every(POSTING_INTERVAL_HOURS).hours.do(social_agent.auto_post)
 
+# Keep the queue and /stats counters current: events do most of it, these
+# checks catch anything missed, and a full recount runs now and then
+schedule.every(1).minutes.do(social_agent.check_tables)
+schedule.every(STATS_RECONCILE_MINUTES).minutes.do(social_agent.reconcile_stats)
+
+# Engagement metrics from the platforms and from the drop directory
+schedule.every(METRICS_POLL_MINUTES).minutes.do(social_agent.poll_metrics)
+schedule.every(1).minutes.do(social_agent.ingest_metrics_drop)
+
 # Run scheduler in a separate thread
 def run_scheduler():
     while True:
@@ -158,22 +349,47 @@ async def create_post(image_id: str):
             raise HTTPException(status_code=404, detail="Image not found")
 
         # Post the image
-        if social_agent.post_image(response.data[0]):
+        if await social_agent.post_image_async(response.data[0]):
             return {"status": "success", "message": f"Image {image_id} posted successfully"}
         else:
             raise HTTPException(status_code=500, detail="Failed to post image")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/queue")
+async def get_queue(limit: int = 10):
+    """Show the highest-ranked images waiting to be posted"""
+    return {"size": len(social_agent.queue), "selection": POST_SELECTION, "top": social_agent.queue.top(limit)}
+
+@app.post("/metrics")
+def ingest_metrics(records: List[Dict[str, Any]]):
+    """Ingest a batch of raw engagement records (same fields as the JSONL drop)"""
+    try:
+        return social_agent.metrics.ingest(records)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/metrics/status")
+async def get_metrics_status():
+    """Totals ingested since startup and which write path is in use"""
+    return social_agent.metrics.snapshot()
+
+@app.get("/events")
+async def get_event_stats():
+    """Event bus transport and how many events were published and received"""
+    return event_bus.stats()
+
+@app.get("/connections")
+async def get_connection_stats():
+    """Usage of the pooled HTTP connections to Supabase"""
+    return pool_stats()
+
 @app.get("/stats")
 async def get_stats():
-    """Get posting statistics"""
+    """Get posting statistics from the in-memory counters"""
     try:
-        posted_today = social_agent.get_posted_images_today()
-        unposted_count = len(social_agent.get_unposted_images())
         return {
-            "posted_today": posted_today,
-            "unposted_count": unposted_count,
+            **social_agent.stats.snapshot(),
             "max_posts_per_day": MAX_POSTS_PER_DAY,
             "posting_interval_hours": POSTING_INTERVAL_HOURS
         }
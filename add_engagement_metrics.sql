@@ -0,0 +1,106 @@
+-- Engagement metrics over time, one row per image, platform and observation.
+-- Counts are cumulative as reported by the platform (likes so far, etc.).
+CREATE TABLE IF NOT EXISTS engagement_metrics (
+    image_id UUID NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    platform TEXT NOT NULL,
+    observed_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    external_post_id TEXT,
+    likes BIGINT,
+    shares BIGINT,
+    comments BIGINT,
+    impressions BIGINT,
+    PRIMARY KEY (image_id, platform, observed_at)
+);
+
+-- Rows arrive roughly in time order, so a BRIN index keeps range scans cheap at almost no size
+CREATE INDEX IF NOT EXISTS idx_engagement_metrics_observed_at
+ON engagement_metrics USING BRIN (observed_at);
+
+COMMENT ON TABLE engagement_metrics IS 'Time series of engagement counts per image and platform';
+
+-- Latest totals per image, summed over platforms
+CREATE TABLE IF NOT EXISTS engagement_rollups (
+    image_id UUID PRIMARY KEY REFERENCES images(id) ON DELETE CASCADE,
+    likes BIGINT NOT NULL DEFAULT 0,
+    shares BIGINT NOT NULL DEFAULT 0,
+    comments BIGINT NOT NULL DEFAULT 0,
+    impressions BIGINT NOT NULL DEFAULT 0,
+    engagement_score DOUBLE PRECISION NOT NULL DEFAULT 0,
+    platforms TEXT[] NOT NULL DEFAULT '{}',
+    last_observed_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_engagement_rollups_score
+ON engagement_rollups (engagement_score DESC);
+
+COMMENT ON COLUMN engagement_rollups.engagement_score IS 'likes + 2 * shares + 3 * comments (see ENGAGEMENT_WEIGHTS in engagement_ingest.py)';
+
+-- Upsert a batch of points and refresh the rollups of the images they touch,
+-- all set-based in one round trip. Points must be unique on
+-- (image_id, platform, observed_at) within a batch; missing metrics keep
+-- whatever value the row already had.
+CREATE OR REPLACE FUNCTION ingest_engagement_metrics(points jsonb)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    points_written integer;
+    images_rolled_up integer;
+BEGIN
+    INSERT INTO engagement_metrics (
+        image_id, platform, observed_at, external_post_id, likes, shares, comments, impressions
+    )
+    SELECT p.image_id, p.platform, p.observed_at, p.external_post_id,
+           p.likes, p.shares, p.comments, p.impressions
+    FROM jsonb_to_recordset(points) AS p(
+        image_id uuid, platform text, observed_at timestamptz, external_post_id text,
+        likes bigint, shares bigint, comments bigint, impressions bigint
+    )
+    ON CONFLICT (image_id, platform, observed_at) DO UPDATE SET
+        external_post_id = coalesce(EXCLUDED.external_post_id, engagement_metrics.external_post_id),
+        likes = coalesce(EXCLUDED.likes, engagement_metrics.likes),
+        shares = coalesce(EXCLUDED.shares, engagement_metrics.shares),
+        comments = coalesce(EXCLUDED.comments, engagement_metrics.comments),
+        impressions = coalesce(EXCLUDED.impressions, engagement_metrics.impressions);
+    GET DIAGNOSTICS points_written = ROW_COUNT;
+
+    WITH touched AS (
+        SELECT DISTINCT (p->>'image_id')::uuid AS image_id
+        FROM jsonb_array_elements(points) AS p
+    ),
+    latest AS (
+        SELECT DISTINCT ON (m.image_id, m.platform) m.*
+        FROM engagement_metrics m
+        JOIN touched t ON t.image_id = m.image_id
+        ORDER BY m.image_id, m.platform, m.observed_at DESC
+    )
+    INSERT INTO engagement_rollups (
+        image_id, likes, shares, comments, impressions, engagement_score,
+        platforms, last_observed_at, updated_at
+    )
+    SELECT image_id,
+           sum(coalesce(likes, 0)),
+           sum(coalesce(shares, 0)),
+           sum(coalesce(comments, 0)),
+           sum(coalesce(impressions, 0)),
+           sum(coalesce(likes, 0)) + 2 * sum(coalesce(shares, 0)) + 3 * sum(coalesce(comments, 0)),
+           array_agg(platform ORDER BY platform),
+           max(observed_at),
+           now()
+    FROM latest
+    GROUP BY image_id
+    ON CONFLICT (image_id) DO UPDATE SET
+        likes = EXCLUDED.likes,
+        shares = EXCLUDED.shares,
+        comments = EXCLUDED.comments,
+        impressions = EXCLUDED.impressions,
+        engagement_score = EXCLUDED.engagement_score,
+        platforms = EXCLUDED.platforms,
+        last_observed_at = EXCLUDED.last_observed_at,
+        updated_at = EXCLUDED.updated_at;
+    GET DIAGNOSTICS images_rolled_up = ROW_COUNT;
+
+    RETURN jsonb_build_object('points', points_written, 'images', images_rolled_up);
+END;
+$$;
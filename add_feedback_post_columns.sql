@@ -0,0 +1,17 @@
+-- Record the outcome of each platform post in feedback.
+-- The posting engine writes one row per platform per artwork; older rows
+-- (single platform, posted only) keep their values and get NULLs here.
+ALTER TABLE feedback
+ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'posted',
+ADD COLUMN IF NOT EXISTS posted_at TIMESTAMP WITH TIME ZONE,
+ADD COLUMN IF NOT EXISTS external_post_id TEXT,
+ADD COLUMN IF NOT EXISTS post_url TEXT,
+ADD COLUMN IF NOT EXISTS attempts INTEGER DEFAULT 1,
+ADD COLUMN IF NOT EXISTS error TEXT;
+
+COMMENT ON COLUMN feedback.status IS 'posted, failed or rate_limited';
+COMMENT ON COLUMN feedback.external_post_id IS 'ID of the post on the platform';
+COMMENT ON COLUMN feedback.attempts IS 'Number of attempts made, including retries';
+
+CREATE INDEX IF NOT EXISTS idx_feedback_image_id ON feedback(image_id);
+CREATE INDEX IF NOT EXISTS idx_feedback_status_created_at ON feedback(status, created_at);
@@ -0,0 +1,103 @@
+-- One row per generation attempt: models, token usage, cost and stage timings
+CREATE TABLE IF NOT EXISTS generation_ledger (
+    id UUID PRIMARY KEY,
+    image_id UUID,
+    generation_type TEXT,
+    status TEXT NOT NULL DEFAULT 'ok',
+    error TEXT,
+    started_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    prompt_model TEXT,
+    prompt_attempts INTEGER,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    image_model TEXT,
+    size TEXT,
+    quality TEXT,
+    image_cost_tier TEXT,
+    cost_usd NUMERIC(10, 6) NOT NULL DEFAULT 0,
+    total_ms INTEGER,
+    stages JSONB NOT NULL DEFAULT '{}'::jsonb  -- stage name -> milliseconds
+);
+
+CREATE INDEX IF NOT EXISTS idx_generation_ledger_started_at ON generation_ledger (started_at);
+
+COMMENT ON TABLE generation_ledger IS 'Cost and latency of every generation, written in batches by the art generator';
+
+-- Server-side aggregation for the /ledger/summary endpoint
+CREATE OR REPLACE FUNCTION generation_ledger_summary(
+    since timestamp with time zone,
+    bucket text DEFAULT 'day'
+)
+RETURNS jsonb
+LANGUAGE sql STABLE
+AS $$
+    WITH ledger AS (
+        SELECT *
+        FROM generation_ledger
+        WHERE started_at >= since
+    ),
+    totals AS (
+        SELECT jsonb_build_object(
+            'generations', count(*),
+            'failed', count(*) FILTER (WHERE status = 'failed'),
+            'cost_usd', round(coalesce(sum(cost_usd), 0), 4),
+            'prompt_tokens', coalesce(sum(prompt_tokens), 0),
+            'completion_tokens', coalesce(sum(completion_tokens), 0),
+            'mean_total_ms', round(avg(total_ms)),
+            'p95_total_ms', percentile_disc(0.95) WITHIN GROUP (ORDER BY total_ms)
+        ) AS data
+        FROM ledger
+    ),
+    stages AS (
+        SELECT coalesce(jsonb_object_agg(name, jsonb_build_object('mean_ms', mean_ms, 'p95_ms', p95_ms)), '{}'::jsonb) AS data
+        FROM (
+            SELECT s.key AS name,
+                   round(avg(s.value::numeric)) AS mean_ms,
+                   percentile_disc(0.95) WITHIN GROUP (ORDER BY s.value::numeric) AS p95_ms
+            FROM ledger, jsonb_each_text(ledger.stages) AS s
+            GROUP BY s.key
+        ) t
+    ),
+    by_tier AS (
+        SELECT coalesce(jsonb_object_agg(image_cost_tier, jsonb_build_object('generations', n, 'cost_usd', cost)), '{}'::jsonb) AS data
+        FROM (
+            SELECT image_cost_tier, count(*) AS n, round(sum(cost_usd), 4) AS cost
+            FROM ledger
+            WHERE image_cost_tier IS NOT NULL
+            GROUP BY image_cost_tier
+        ) t
+    ),
+    buckets AS (
+        SELECT coalesce(jsonb_agg(jsonb_build_object(
+                   'bucket', b,
+                   'generations', n,
+                   'failed', failed,
+                   'cost_usd', cost,
+                   'prompt_tokens', prompt_tokens,
+                   'completion_tokens', completion_tokens,
+                   'mean_total_ms', mean_ms,
+                   'p95_total_ms', p95_ms,
+                   'per_hour', round(n / CASE WHEN bucket = 'hour' THEN 1.0 ELSE 24.0 END, 3)
+               ) ORDER BY b), '[]'::jsonb) AS data
+        FROM (
+            SELECT date_trunc(bucket, started_at) AS b,
+                   count(*) AS n,
+                   count(*) FILTER (WHERE status = 'failed') AS failed,
+                   round(sum(cost_usd), 4) AS cost,
+                   sum(prompt_tokens) AS prompt_tokens,
+                   sum(completion_tokens) AS completion_tokens,
+                   round(avg(total_ms)) AS mean_ms,
+                   percentile_disc(0.95) WITHIN GROUP (ORDER BY total_ms) AS p95_ms
+            FROM ledger
+            GROUP BY 1
+        ) t
+    )
+    SELECT jsonb_build_object(
+        'bucket', bucket,
+        'totals', totals.data,
+        'stages', stages.data,
+        'by_tier', by_tier.data,
+        'buckets', buckets.data
+    )
+    FROM totals, stages, by_tier, buckets;
+$$;
@@ -0,0 +1,53 @@
+-- Add a content hash to images so image URLs can be versioned and cached forever
+ALTER TABLE images
+ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+
+COMMENT ON COLUMN images.content_hash IS 'SHA-256 of the stored image bytes, used in immutable /proxy-image URLs';
+
+-- Recreate save_generation so it also stores the content hash
+CREATE OR REPLACE FUNCTION save_generation(
+    prompt_id uuid,
+    prompt_text text,
+    prompt_character_id uuid,
+    image_id uuid,
+    image jsonb
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    saved_prompt prompts%ROWTYPE;
+    saved_image images%ROWTYPE;
+BEGIN
+    INSERT INTO prompts (id, text, character_id, created_at)
+    VALUES (prompt_id, prompt_text, prompt_character_id, coalesce((image->>'created_at')::timestamptz, now()))
+    ON CONFLICT (id) DO NOTHING;
+
+    INSERT INTO images (
+        id, prompt_id, api_used, image_url, local_path, settings,
+        generation_type, storage_path, dalle_url, content_hash, created_at
+    )
+    VALUES (
+        image_id,
+        prompt_id,
+        image->>'api_used',
+        image->>'image_url',
+        image->>'local_path',
+        coalesce(image->'settings', '{}'::jsonb),
+        coalesce(image->>'generation_type', 'auto'),
+        image->>'storage_path',
+        image->>'dalle_url',
+        image->>'content_hash',
+        coalesce((image->>'created_at')::timestamptz, now())
+    )
+    ON CONFLICT (id) DO NOTHING;
+
+    SELECT * INTO saved_prompt FROM prompts WHERE id = prompt_id;
+    SELECT * INTO saved_image FROM images WHERE id = image_id;
+
+    RETURN jsonb_build_object(
+        'prompt', to_jsonb(saved_prompt),
+        'image', to_jsonb(saved_image)
+    );
+END;
+$$;
@@ -0,0 +1,58 @@
+-- Add preview fields to images so the gallery can paint something before the image loads
+ALTER TABLE images
+ADD COLUMN IF NOT EXISTS blurhash VARCHAR(64),
+ADD COLUMN IF NOT EXISTS dominant_color VARCHAR(7);
+
+COMMENT ON COLUMN images.blurhash IS 'BlurHash (4x3 components) of the image, computed at ingest';
+COMMENT ON COLUMN images.dominant_color IS 'Most common colour of the image as #rrggbb';
+
+-- Recreate save_generation so it also stores the preview fields
+CREATE OR REPLACE FUNCTION save_generation(
+    prompt_id uuid,
+    prompt_text text,
+    prompt_character_id uuid,
+    image_id uuid,
+    image jsonb
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    saved_prompt prompts%ROWTYPE;
+    saved_image images%ROWTYPE;
+BEGIN
+    INSERT INTO prompts (id, text, character_id, created_at)
+    VALUES (prompt_id, prompt_text, prompt_character_id, coalesce((image->>'created_at')::timestamptz, now()))
+    ON CONFLICT (id) DO NOTHING;
+
+    INSERT INTO images (
+        id, prompt_id, api_used, image_url, local_path, settings,
+        generation_type, storage_path, dalle_url, content_hash, blurhash,
+        dominant_color, created_at
+    )
+    VALUES (
+        image_id,
+        prompt_id,
+        image->>'api_used',
+        image->>'image_url',
+        image->>'local_path',
+        coalesce(image->'settings', '{}'::jsonb),
+        coalesce(image->>'generation_type', 'auto'),
+        image->>'storage_path',
+        image->>'dalle_url',
+        image->>'content_hash',
+        image->>'blurhash',
+        image->>'dominant_color',
+        coalesce((image->>'created_at')::timestamptz, now())
+    )
+    ON CONFLICT (id) DO NOTHING;
+
+    SELECT * INTO saved_prompt FROM prompts WHERE id = prompt_id;
+    SELECT * INTO saved_image FROM images WHERE id = image_id;
+
+    RETURN jsonb_build_object(
+        'prompt', to_jsonb(saved_prompt),
+        'image', to_jsonb(saved_image)
+    );
+END;
+$$;
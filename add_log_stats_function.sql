@@ -0,0 +1,65 @@
+-- Server-side aggregation of marvin_art_logs for the /logs/stats endpoint.
+-- Returns counts by level, by source and per time bucket, plus the most frequent
+-- messages (with ids and numbers normalised so repeats of the same event group together).
+CREATE OR REPLACE FUNCTION marvin_art_log_stats(
+    since timestamp with time zone,
+    bucket text DEFAULT 'hour',
+    filter_level text DEFAULT NULL,
+    filter_source text DEFAULT NULL,
+    top_n integer DEFAULT 10
+)
+RETURNS jsonb
+LANGUAGE sql STABLE
+AS $$
+    WITH logs AS (
+        SELECT level, source, message, created_at
+        FROM marvin_art_logs
+        WHERE created_at >= since
+          AND (filter_level IS NULL OR level = filter_level)
+          AND (filter_source IS NULL OR source = filter_source)
+    ),
+    by_level AS (
+        SELECT coalesce(jsonb_object_agg(level, n), '{}'::jsonb) AS data
+        FROM (SELECT level, count(*) AS n FROM logs GROUP BY level) t
+    ),
+    by_source AS (
+        SELECT coalesce(jsonb_object_agg(coalesce(source, 'unknown'), n), '{}'::jsonb) AS data
+        FROM (SELECT source, count(*) AS n FROM logs GROUP BY source) t
+    ),
+    buckets AS (
+        SELECT coalesce(jsonb_agg(jsonb_build_object(
+                   'bucket', b, 'level', level, 'source', source, 'count', n
+               ) ORDER BY b, level, source), '[]'::jsonb) AS data
+        FROM (
+            SELECT date_trunc(bucket, created_at) AS b, level, source, count(*) AS n
+            FROM logs
+            GROUP BY 1, 2, 3
+        ) t
+    ),
+    top_messages AS (
+        SELECT coalesce(jsonb_agg(jsonb_build_object(
+                   'message', message, 'level', level, 'count', n, 'last_seen', last_seen
+               ) ORDER BY n DESC), '[]'::jsonb) AS data
+        FROM (
+            SELECT regexp_replace(
+                       regexp_replace(message, '[0-9a-fA-F]{8}-[0-9a-fA-F-]{27}', '<id>', 'g'),
+                       '[0-9]+', '<n>', 'g'
+                   ) AS message,
+                   level,
+                   count(*) AS n,
+                   max(created_at) AS last_seen
+            FROM logs
+            GROUP BY 1, 2
+            ORDER BY n DESC
+            LIMIT top_n
+        ) t
+    )
+    SELECT jsonb_build_object(
+        'total', (SELECT count(*) FROM logs),
+        'by_level', by_level.data,
+        'by_source', by_source.data,
+        'buckets', buckets.data,
+        'top_messages', top_messages.data
+    )
+    FROM by_level, by_source, buckets, top_messages;
+$$;
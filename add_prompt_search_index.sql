@@ -0,0 +1,70 @@
+-- Add a full-text search vector to the prompts table
+ALTER TABLE prompts
+ADD COLUMN IF NOT EXISTS search_vector tsvector
+GENERATED ALWAYS AS (to_tsvector('english', coalesce(text, ''))) STORED;
+
+-- GIN index so /search doesn't scan every prompt
+CREATE INDEX IF NOT EXISTS idx_prompts_search_vector ON prompts USING gin(search_vector);
+
+-- Ranked prompt search used by the /search endpoint.
+-- Headlines are only computed for the requested page, since ts_headline is
+-- the most expensive part of the query. With filter_character_id, only that
+-- character's prompts are searched (the endpoint passes Marvin's id, like the
+-- in-process fallback index).
+-- Dropped first: adding an argument would otherwise leave the old version
+-- alongside, and PostgREST couldn't choose between the two.
+DROP FUNCTION IF EXISTS search_prompts(text, integer, integer);
+
+CREATE OR REPLACE FUNCTION search_prompts(
+    search_query text,
+    result_limit integer DEFAULT 20,
+    result_offset integer DEFAULT 0,
+    filter_character_id uuid DEFAULT NULL
+)
+RETURNS TABLE (
+    prompt_id uuid,
+    image_id uuid,
+    text text,
+    snippet text,
+    rank real,
+    created_at timestamp with time zone,
+    image_created_at timestamp with time zone,
+    settings jsonb,
+    total_count bigint
+)
+LANGUAGE sql STABLE
+AS $$
+    WITH query AS (
+        SELECT websearch_to_tsquery('english', search_query) AS q
+    ),
+    page AS (
+        SELECT p.id, p.text, p.created_at,
+               ts_rank_cd(p.search_vector, query.q) AS rank,
+               count(*) OVER () AS total_count
+        FROM prompts p, query
+        WHERE p.search_vector @@ query.q
+          AND (filter_character_id IS NULL OR p.character_id = filter_character_id)
+        ORDER BY rank DESC, p.created_at DESC
+        LIMIT result_limit OFFSET result_offset
+    )
+    SELECT page.id,
+           i.id,
+           page.text,
+           ts_headline('english', page.text, query.q,
+                       'StartSel=<mark>, StopSel=</mark>, MaxWords=25, MinWords=10, MaxFragments=2'),
+           page.rank,
+           page.created_at,
+           i.created_at,
+           i.settings,
+           page.total_count
+    FROM page
+    CROSS JOIN query
+    LEFT JOIN LATERAL (
+        SELECT images.id, images.created_at, images.settings
+        FROM images
+        WHERE images.prompt_id = page.id
+        ORDER BY images.created_at DESC
+        LIMIT 1
+    ) i ON true
+    ORDER BY page.rank DESC, page.created_at DESC;
+$$;
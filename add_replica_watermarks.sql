@@ -0,0 +1,45 @@
+-- updated_at on every table the generator mirrors into its SQLite read replica,
+-- so changed rows (e.g. an image whose upload finished) are synced, not just new ones
+ALTER TABLE images
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE;
+
+ALTER TABLE prompts
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE;
+
+UPDATE images SET updated_at = created_at WHERE updated_at IS NULL;
+UPDATE prompts SET updated_at = created_at WHERE updated_at IS NULL;
+UPDATE character_files SET updated_at = created_at WHERE updated_at IS NULL;
+
+ALTER TABLE images ALTER COLUMN updated_at SET DEFAULT now();
+ALTER TABLE prompts ALTER COLUMN updated_at SET DEFAULT now();
+ALTER TABLE character_files ALTER COLUMN updated_at SET DEFAULT now();
+
+CREATE INDEX IF NOT EXISTS idx_images_updated_at ON images (updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_prompts_updated_at ON prompts (updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_character_files_updated_at ON character_files (updated_at, id);
+
+-- Bump updated_at on every update, whoever makes it
+CREATE OR REPLACE FUNCTION set_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at = now();
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS images_set_updated_at ON images;
+CREATE TRIGGER images_set_updated_at
+BEFORE UPDATE ON images
+FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS prompts_set_updated_at ON prompts;
+CREATE TRIGGER prompts_set_updated_at
+BEFORE UPDATE ON prompts
+FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS character_files_set_updated_at ON character_files;
+CREATE TRIGGER character_files_set_updated_at
+BEFORE UPDATE ON character_files
+FOR EACH ROW EXECUTE FUNCTION set_updated_at();
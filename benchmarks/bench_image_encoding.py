@@ -0,0 +1,91 @@
+"""Compare storage encoders on generated images.
+
+Encodes each image with every available format (the current unoptimized
+PNG, optimized PNG, lossless and lossy WebP, AVIF if pillow-avif-plugin is
+installed) and reports mean encode time, decode time and size relative to
+the unoptimized PNG.
+
+    python benchmarks/bench_image_encoding.py [image ...]
+
+With no arguments it uses the images in the local image store
+(LOCAL_IMAGE_DIR, default src/images). If there are none it falls back to a
+synthetic image, which compresses very differently from real DALL-E output.
+"""
+import os
+import sys
+import glob
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+from PIL import Image
+
+from image_encoding import ImageEncoder, available_formats
+
+CANDIDATES = [
+    ("png (optimized)", ImageEncoder("png")),
+    ("webp lossless", ImageEncoder("webp")),
+    ("webp q90", ImageEncoder("webp", 90)),
+    ("avif q80", ImageEncoder("avif", 80)),
+    ("avif q60", ImageEncoder("avif", 60)),
+]
+
+
+def load_images(paths):
+    if not paths:
+        directory = os.getenv("LOCAL_IMAGE_DIR", os.path.join(os.path.dirname(__file__), "..", "src", "images"))
+        paths = sorted(glob.glob(os.path.join(directory, "*.png")))[:20]
+    images = []
+    for path in paths:
+        with Image.open(path) as image:
+            images.append(image.convert("RGB"))
+    if not images:
+        print("No images found, using a synthetic 1024x1024 image\n")
+        y, x = np.mgrid[0:1024, 0:1024] / 1024
+        noise = np.random.default_rng(0).normal(0, 12, (1024, 1024, 3))
+        pixels = np.stack([np.sin(x * 9) * 100 + 120, np.cos(y * 7) * 90 + 110, (x + y) * 80 + 40], axis=-1)
+        images.append(Image.fromarray(np.clip(pixels + noise, 0, 255).astype(np.uint8)))
+    return images
+
+
+def measure(images, encode):
+    encode_ms, decode_ms, sizes = [], [], []
+    for image in images:
+        start = time.perf_counter()
+        data = encode(image)
+        encode_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        with Image.open(BytesIO(data)) as decoded:
+            decoded.load()
+        decode_ms.append((time.perf_counter() - start) * 1000)
+        sizes.append(len(data))
+    return np.mean(encode_ms), np.mean(decode_ms), np.mean(sizes)
+
+
+def unoptimized_png(image):
+    # What generate_image used to store
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def main():
+    images = load_images(sys.argv[1:])
+    print(f"{len(images)} images, formats available: {', '.join(available_formats())}\n")
+
+    baseline = measure(images, unoptimized_png)
+    rows = [("png (unoptimized)", baseline)]
+    for name, encoder in CANDIDATES:
+        if encoder.format not in available_formats():
+            continue
+        rows.append((name, measure(images, encoder.encode)))
+
+    print(f"{'format':<20} {'encode ms':>10} {'decode ms':>10} {'size KB':>10} {'vs png':>8}")
+    for name, (encode_ms, decode_ms, size) in rows:
+        print(f"{name:<20} {encode_ms:>10.1f} {decode_ms:>10.1f} {size / 1024:>10.1f} {size / baseline[2]:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
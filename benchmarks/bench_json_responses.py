@@ -0,0 +1,82 @@
+"""Compare JSON serialization and compression for the /images payload.
+
+Builds a synthetic page of images in the shape returned by
+select('*, prompts(*)') and reports payload size and time per response for
+the old path (jsonable_encoder + json.dumps, uncompressed) against orjson
+with gzip and brotli.
+
+    python benchmarks/bench_json_responses.py [rows]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from http_cache import compress
+
+WORDS = ("dreamlike surreal forest glass moon violet ocean city neon rain whale library "
+         "clockwork bird mountain desert mirror cathedral storm garden lantern").split()
+
+
+def make_images(rows):
+    now = datetime.utcnow()
+    images = []
+    for i in range(rows):
+        prompt_id = str(uuid.uuid4())
+        created_at = (now - timedelta(hours=i)).isoformat()
+        images.append({
+            "id": str(uuid.uuid4()),
+            "prompt_id": prompt_id,
+            "api_used": "dall-e-3",
+            "image_url": f"https://example.supabase.co/storage/v1/object/public/marvin-art-images/images/{i}/marvin_art_{i}.png",
+            "dalle_url": "https://oaidalleapiprodscus.blob.core.windows.net/private/org/user/img.png?" + "x" * 400,
+            "local_path": f"images/marvin_art_{i}.png",
+            "storage_path": f"images/{i}/marvin_art_{i}.png",
+            "settings": {"model": "dall-e-3", "size": "1024x1024", "quality": "standard"},
+            "generation_type": "auto",
+            "created_at": created_at,
+            "prompts": {
+                "id": prompt_id,
+                "text": " ".join(random.choice(WORDS) for _ in range(120)),
+                "character_id": "af871ddd-febb-4454-9171-080450357b8c",
+                "created_at": created_at
+            }
+        })
+    return images
+
+
+def timed(fn, repeat=200):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    payload = make_images(rows)
+
+    before, before_ms = timed(lambda: json.dumps(jsonable_encoder(payload)).encode("utf-8"))
+    body, orjson_ms = timed(lambda: orjson.dumps(payload))
+    gz, gzip_ms = timed(lambda: compress(body, "gzip"))
+    br, br_ms = timed(lambda: compress(body, "br"))
+
+    print(f"/images payload with {rows} rows")
+    print(f"{'variant':<28}{'bytes':>10}{'ms':>10}")
+    print(f"{'json.dumps, uncompressed':<28}{len(before):>10}{before_ms:>10.3f}")
+    print(f"{'orjson, uncompressed':<28}{len(body):>10}{orjson_ms:>10.3f}")
+    print(f"{'orjson + gzip':<28}{len(gz):>10}{orjson_ms + gzip_ms:>10.3f}")
+    print(f"{'orjson + brotli':<28}{len(br):>10}{orjson_ms + br_ms:>10.3f}")
+    print(f"{'304 Not Modified':<28}{0:>10}{'-':>10}")
+
+
+if __name__ == "__main__":
+    main()
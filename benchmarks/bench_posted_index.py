@@ -0,0 +1,65 @@
+"""Compare the social agent's posted-image index with the set of strings it replaced.
+
+Builds both from the same random UUIDs and reports memory, build time and
+membership-check time for hits and misses.
+
+    python benchmarks/bench_posted_index.py [ids]
+
+Defaults to 1,000,000 ids. Set memory is measured with tracemalloc, so it
+includes the strings as well as the set's table.
+"""
+import os
+import sys
+import time
+import uuid
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Marvin-Art"))
+
+from posted_index import PostedIndex
+
+
+def measured(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, seconds
+
+
+def per_check_us(container, ids):
+    start = time.perf_counter()
+    for image_id in ids:
+        image_id in container
+    return (time.perf_counter() - start) / len(ids) * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    ids = [str(uuid.uuid4()) for _ in range(count)]
+    hits = ids[::max(1, count // 10000)]
+    misses = [str(uuid.uuid4()) for _ in range(len(hits))]
+
+    # Copy the strings so the set owns its own, as when loaded from the database
+    as_set, set_bytes, set_peak, set_seconds = measured(lambda: {s.encode().decode() for s in ids})
+
+    def build_index():
+        index = PostedIndex(supabase=None)
+        index.update(ids)
+        return index
+    index, index_bytes, index_peak, index_seconds = measured(build_index)
+
+    print(f"Posted-image index with {count:,} ids")
+    print(f"{'variant':<22}{'MB':>10}{'peak MB':>10}{'build s':>10}{'hit us':>10}{'miss us':>10}")
+    for name, container, size, peak, seconds in (
+            ("set of str", as_set, set_bytes, set_peak, set_seconds),
+            ("PostedIndex", index, index_bytes, index_peak, index_seconds)):
+        print(f"{name:<22}{size / 1e6:>10.1f}{peak / 1e6:>10.1f}{seconds:>10.2f}"
+              f"{per_check_us(container, hits):>10.2f}{per_check_us(container, misses):>10.2f}")
+    print(f"PostedIndex.memory_bytes(): {index.memory_bytes() / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
 import os
+import sys
 from dotenv import load_dotenv
-from supabase import create_client
-import requests
 from datetime import datetime
 from PIL import Image
 from io import BytesIO
 
+# The preview encoder and the shared clients live with the service code in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+from image_preview import compute_preview
+from image_store import LocalImageStore
+from service_clients import create_supabase_client, http_get
+
 # Load environment variables
 load_dotenv()
 
@@ -18,7 +23,7 @@ if not supabase_url or not supabase_key:
     exit(1)
 
 try:
-    supabase = create_client(
+    supabase = create_supabase_client(
         supabase_url=supabase_url,
         supabase_key=supabase_key
     )
@@ -27,6 +32,10 @@ except Exception as e:
     print(f"Error initializing Supabase client: {str(e)}")
     exit(1)
 
+# The generator's local image store, to find files by the names recorded in local_path
+LOCAL_IMAGE_DIR = os.getenv("LOCAL_IMAGE_DIR", "images")
+image_store = LocalImageStore(directory=LOCAL_IMAGE_DIR)
+
 def migrate_existing_images():
     """Migrate existing images to Supabase Storage"""
     try:
@@ -79,7 +88,7 @@ def migrate_existing_images():
                         print(f"Migrating image {image_id} from URL")
                         
                         # Download image
-                        response = requests.get(image['image_url'], timeout=5)
+                        response = http_get(image['image_url'], timeout=5)
                         if response.status_code == 200:
                             # Create storage path
                             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -118,5 +127,60 @@ def migrate_existing_images():
     except Exception as e:
         print(f"Error in migration: {str(e)}")
 
+def backfill_image_previews(batch_size: int = 100):
+    """Compute the BlurHash and dominant colour for images saved before they existed.
+
+    Pages through images without a preview in id order, each page starting
+    after the last id seen, so pages stay batch_size rows however many
+    images fail and rows updated meanwhile can't shift the next page.
+    """
+    updated = 0
+    failed = 0
+    last_id = None
+    try:
+        while True:
+            query = supabase.table('images')\
+                .select('id, image_url, local_path')\
+                .is_('blurhash', 'null')\
+                .order('id')\
+                .limit(batch_size)
+            if last_id:
+                query = query.gt('id', last_id)
+            batch = query.execute().data or []
+            if not batch:
+                break
+            last_id = batch[-1]['id']
+            
+            for image in batch:
+                image_id = image['id']
+                try:
+                    # Files live in the local image store; older rows may hold a path outside it
+                    local_path = image_store.resolve(image.get('local_path'))
+                    if not local_path and image.get('local_path') and os.path.exists(image['local_path']):
+                        local_path = image['local_path']
+                    if local_path:
+                        source = Image.open(local_path)
+                    elif image.get('image_url'):
+                        download = http_get(image['image_url'], timeout=10)
+                        download.raise_for_status()
+                        source = Image.open(BytesIO(download.content))
+                    else:
+                        raise ValueError("no source available")
+                    
+                    supabase.table('images').update(compute_preview(source)).eq('id', image_id).execute()
+                    updated += 1
+                except Exception as e:
+                    # The cursor has moved past it, so one broken image doesn't stall the backfill
+                    print(f"Error computing preview for image {image_id}: {str(e)}")
+                    failed += 1
+            print(f"Backfilled previews for {updated} images so far")
+            if len(batch) < batch_size:
+                break
+    except Exception as e:
+        print(f"Error in preview backfill: {str(e)}")
+    
+    print(f"Preview backfill finished: {updated} updated, {failed} failed")
+
 if __name__ == "__main__":
     migrate_existing_images()
+    backfill_image_previews()
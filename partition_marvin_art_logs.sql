@@ -0,0 +1,205 @@
+-- Convert marvin_art_logs into a table partitioned by day on created_at,
+-- so that old logs can be dropped a partition at a time instead of deleted row by row.
+
+BEGIN;
+
+ALTER TABLE marvin_art_logs RENAME TO marvin_art_logs_unpartitioned;
+
+CREATE TABLE marvin_art_logs (
+    id uuid NOT NULL DEFAULT gen_random_uuid(),
+    level text NOT NULL,
+    message text NOT NULL,
+    source text,
+    created_at timestamp with time zone NOT NULL DEFAULT now(),
+    metadata jsonb DEFAULT '{}'::jsonb,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- Catches rows outside the pre-created daily partitions
+CREATE TABLE marvin_art_logs_default PARTITION OF marvin_art_logs DEFAULT;
+
+CREATE INDEX idx_marvin_art_logs_created_at ON marvin_art_logs (created_at DESC);
+CREATE INDEX idx_marvin_art_logs_level_created_at ON marvin_art_logs (level, created_at);
+
+-- Create daily partitions (marvin_art_logs_pYYYYMMDD) for every day in [start_date, end_date].
+-- A day that already has rows in the default partition can't simply be created
+-- (Postgres refuses while the default holds rows in its range), so those rows
+-- are moved into a new standalone table first, which is then attached.
+CREATE OR REPLACE FUNCTION create_marvin_art_logs_partitions(start_date date, end_date date)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    day date := start_date;
+    created integer := 0;
+    partition_name text;
+BEGIN
+    WHILE day <= end_date LOOP
+        partition_name := 'marvin_art_logs_p' || to_char(day, 'YYYYMMDD');
+        IF to_regclass(partition_name) IS NULL THEN
+            IF EXISTS (
+                SELECT 1 FROM marvin_art_logs_default
+                WHERE created_at >= day::timestamptz AND created_at < (day + 1)::timestamptz
+            ) THEN
+                EXECUTE format(
+                    'CREATE TABLE %I (LIKE marvin_art_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                    partition_name
+                );
+                EXECUTE format(
+                    'WITH moved AS (
+                         DELETE FROM marvin_art_logs_default
+                         WHERE created_at >= %L AND created_at < %L
+                         RETURNING *
+                     )
+                     INSERT INTO %I SELECT * FROM moved',
+                    day::timestamptz, (day + 1)::timestamptz, partition_name
+                );
+                EXECUTE format(
+                    'ALTER TABLE marvin_art_logs ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, day::timestamptz, (day + 1)::timestamptz
+                );
+            ELSE
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF marvin_art_logs FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, day::timestamptz, (day + 1)::timestamptz
+                );
+            END IF;
+            created := created + 1;
+        END IF;
+        day := day + 1;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+-- Partitions for existing logs and the coming week
+SELECT create_marvin_art_logs_partitions(
+    coalesce((SELECT min(created_at)::date FROM marvin_art_logs_unpartitioned), current_date),
+    current_date + 7
+);
+
+INSERT INTO marvin_art_logs (id, level, message, source, created_at, metadata)
+SELECT id, level, message, source, coalesce(created_at, now()), metadata
+FROM marvin_art_logs_unpartitioned;
+
+DROP TABLE marvin_art_logs_unpartitioned;
+
+-- Apply log retention.
+--   retention_days: days to keep per level, e.g. {"default": 7, "ERROR": 30}
+--   batch_size / max_batches: bound the work done per call for row-level deletes
+-- Daily partitions older than the longest retention are dropped outright. Rows
+-- from shorter-lived levels are deleted in batches of batch_size without being
+-- returned to the client. "complete" is false when max_batches was reached and
+-- the caller should run the function again.
+CREATE OR REPLACE FUNCTION purge_marvin_art_logs(
+    retention_days jsonb DEFAULT '{"default": 7}'::jsonb,
+    batch_size integer DEFAULT 5000,
+    max_batches integer DEFAULT 20
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    default_days integer := coalesce((retention_days->>'default')::integer, 7);
+    default_from date;
+    default_to date;
+    level_keys text[];
+    max_days integer;
+    drop_before date;
+    part record;
+    lvl text;
+    lvl_days integer;
+    cutoff timestamptz;
+    batch_rows bigint;
+    batch_bytes bigint;
+    batches integer := 0;
+    level_rows bigint;
+    rows_deleted bigint := 0;
+    bytes_reclaimed bigint := 0;
+    partitions_dropped integer := 0;
+    by_level jsonb := '{}'::jsonb;
+    complete boolean := true;
+BEGIN
+    -- Keep a week of partitions ready so new logs never land in the default partition
+    PERFORM create_marvin_art_logs_partitions(current_date, current_date + 7);
+
+    -- Rows that landed in the default partition anyway (purge not run for over a
+    -- week, clock skew) are moved into daily partitions, so retention drops them too
+    SELECT min(created_at)::date, max(created_at)::date INTO default_from, default_to
+    FROM marvin_art_logs_default;
+    IF default_from IS NOT NULL THEN
+        PERFORM create_marvin_art_logs_partitions(default_from, default_to);
+    END IF;
+
+    SELECT array_agg(key) INTO level_keys
+    FROM jsonb_object_keys(retention_days) AS key
+    WHERE key <> 'default';
+    level_keys := coalesce(level_keys, ARRAY[]::text[]);
+
+    SELECT greatest(default_days, coalesce(max(value::integer), 0)) INTO max_days
+    FROM jsonb_each_text(retention_days);
+    drop_before := current_date - max_days;
+
+    FOR part IN
+        SELECT c.oid, c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'marvin_art_logs'::regclass
+          AND c.relname ~ '^marvin_art_logs_p[0-9]{8}$'
+          AND to_date(right(c.relname, 8), 'YYYYMMDD') + 1 <= drop_before
+    LOOP
+        EXECUTE format('SELECT count(*) FROM %I', part.relname) INTO batch_rows;
+        bytes_reclaimed := bytes_reclaimed + pg_total_relation_size(part.oid);
+        rows_deleted := rows_deleted + batch_rows;
+        partitions_dropped := partitions_dropped + 1;
+        EXECUTE format('DROP TABLE %I', part.relname);
+    END LOOP;
+
+    -- Row-level deletes for levels with a shorter retention (NULL = every other level)
+    FOR lvl IN SELECT unnest(level_keys) UNION ALL SELECT NULL LOOP
+        lvl_days := CASE WHEN lvl IS NULL THEN default_days ELSE (retention_days->>lvl)::integer END;
+        cutoff := now() - make_interval(days => lvl_days);
+        level_rows := 0;
+
+        LOOP
+            IF batches >= max_batches THEN
+                complete := false;
+                EXIT;
+            END IF;
+
+            WITH doomed AS (
+                SELECT l.id, l.created_at
+                FROM marvin_art_logs l
+                WHERE l.created_at < cutoff
+                  AND (CASE WHEN lvl IS NULL THEN l.level <> ALL(level_keys) ELSE l.level = lvl END)
+                LIMIT batch_size
+            ), deleted AS (
+                DELETE FROM marvin_art_logs l
+                USING doomed d
+                WHERE l.id = d.id AND l.created_at = d.created_at
+                RETURNING pg_column_size(l.*) AS size
+            )
+            SELECT count(*), coalesce(sum(size), 0) INTO batch_rows, batch_bytes FROM deleted;
+
+            batches := batches + 1;
+            level_rows := level_rows + batch_rows;
+            bytes_reclaimed := bytes_reclaimed + batch_bytes;
+            EXIT WHEN batch_rows < batch_size;
+        END LOOP;
+
+        rows_deleted := rows_deleted + level_rows;
+        by_level := by_level || jsonb_build_object(coalesce(lvl, 'default'), level_rows);
+        EXIT WHEN NOT complete;
+    END LOOP;
+
+    RETURN jsonb_build_object(
+        'rows_deleted', rows_deleted,
+        'bytes_reclaimed', bytes_reclaimed,
+        'partitions_dropped', partitions_dropped,
+        'by_level', by_level,
+        'complete', complete
+    );
+END;
+$$;
+
+COMMIT;
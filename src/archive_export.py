@@ -0,0 +1,210 @@
+import json
+import time
+import tarfile
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, Callable, Dict, Iterator, Optional
+
+FORMATS = ("zip", "tar")
+CHUNK_SIZE = 64 * 1024
+
+# Magic numbers of the formats we store, for naming entries
+SIGNATURES = (
+    (b"\x89PNG", "png"),
+    (b"\xff\xd8", "jpg"),
+    (b"GIF8", "gif"),
+)
+
+
+def guess_extension(data: bytes) -> str:
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[4:12] in (b"ftypavif", b"ftypavis"):
+        return "avif"
+    for signature, extension in SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    return "bin"
+
+
+class _Sink:
+    """Write-only file object that hands written bytes back to the generator"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class ArchiveExporter:
+    """Streams the gallery as a ZIP or tar archive plus a JSONL manifest.
+
+    Rows are read page by page in created_at order, and image bytes are
+    fetched a few entries ahead on a small thread pool so downloads overlap
+    with sending. Each entry is written to the response as soon as it is
+    ready, so memory stays at roughly `prefetch` images however large the
+    export is. Manifest lines are spooled to a temporary file and appended
+    as the last entry.
+    """
+
+    def __init__(self, supabase, read_image: Callable[[Dict[str, Any]], Optional[bytes]],
+                 page_size: int = 100, prefetch: int = 8, workers: int = 4):
+        self.supabase = supabase
+        self.read_image = read_image
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.workers = workers
+
+    def rows(self, since: Optional[str] = None, until: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Image rows with their prompts, oldest first, paged on (created_at, id).
+
+        Each page starts at the last created_at seen (gte) and skips the rows
+        at that timestamp already yielded, so rows sharing a timestamp across
+        a page boundary are neither lost nor repeated.
+        """
+        mark, at_mark = since, 0
+        while True:
+            query = self.supabase.table('images')\
+                .select('*, prompts(*)')\
+                .order('created_at,id')\
+                .range(at_mark, at_mark + self.page_size - 1)
+            if mark:
+                query = query.gte('created_at', mark)
+            if until:
+                query = query.lt('created_at', until)
+            page = query.execute().data or []
+            yield from page
+            if len(page) < self.page_size:
+                return
+            for row in page:
+                if row['created_at'] == mark:
+                    at_mark += 1
+                else:
+                    mark, at_mark = row['created_at'], 1
+
+    def _fetch(self, row: Dict[str, Any]) -> Optional[bytes]:
+        try:
+            return self.read_image(row)
+        except Exception as e:
+            print(f"Error reading image {row.get('id')} for export: {str(e)}")
+            return None
+
+    def _fetched(self, rows: Iterator[Dict[str, Any]]):
+        """(row, bytes) pairs in order, with up to `prefetch` downloads in flight"""
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+            for row in rows:
+                pending.append((row, pool.submit(self._fetch, row)))
+                if len(pending) >= self.prefetch:
+                    row, future = pending.popleft()
+                    yield row, future.result()
+            while pending:
+                row, future = pending.popleft()
+                yield row, future.result()
+
+    def _manifest_line(self, row: Dict[str, Any], name: Optional[str], size: int) -> bytes:
+        prompt = row.get('prompts') or {}
+        return json.dumps({
+            "id": row.get('id'),
+            "file": name,
+            "bytes": size,
+            "created_at": row.get('created_at'),
+            "prompt_id": row.get('prompt_id'),
+            "prompt": prompt.get('text'),
+            "settings": row.get('settings'),
+            "generation_type": row.get('generation_type'),
+            "content_hash": row.get('content_hash'),
+            "image_url": row.get('image_url')
+        }).encode("utf-8") + b"\n"
+
+    def stream(self, format: str = "zip", since: Optional[str] = None, until: Optional[str] = None,
+               mtime: Callable[[Dict[str, Any]], Optional[float]] = lambda row: None) -> Iterator[bytes]:
+        """Yield the archive in chunks as entries become available"""
+        if format not in FORMATS:
+            raise ValueError(f"Unsupported export format: {format}")
+        for chunk in self._stream(format, since, until, mtime):
+            if chunk:
+                yield chunk
+
+    def _stream(self, format, since, until, mtime) -> Iterator[bytes]:
+        sink = _Sink()
+        exported = missing = 0
+        with tempfile.TemporaryFile() as manifest:
+            archive = zipfile.ZipFile(sink, mode="w") if format == "zip" else tarfile.open(fileobj=sink, mode="w|")
+            for row, data in self._fetched(self.rows(since, until)):
+                name = None
+                if data:
+                    name = f"images/{(row.get('created_at') or '')[:10]}_{row['id']}.{guess_extension(data)}"
+                    self._add(archive, name, data, mtime(row))
+                    exported += 1
+                else:
+                    missing += 1
+                manifest.write(self._manifest_line(row, name, len(data) if data else 0))
+                yield sink.drain()
+
+            size = manifest.tell()
+            manifest.seek(0)
+            yield from self._add_stream(archive, sink, "manifest.jsonl", manifest, size)
+            archive.close()
+            yield sink.drain()
+        print(f"Export finished: {exported} images, {missing} unavailable")
+
+    def _add(self, archive, name: str, data: bytes, mtime: Optional[float]) -> None:
+        if isinstance(archive, zipfile.ZipFile):
+            info = zipfile.ZipInfo(name, date_time=self._date_time(mtime))
+            # Images are already compressed; storing them saves CPU for nothing lost
+            archive.writestr(info, data, compress_type=zipfile.ZIP_STORED)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = mtime or 0
+            archive.addfile(info, BytesIO(data))
+
+    def _add_stream(self, archive, sink: _Sink, name: str, source, size: int) -> Iterator[bytes]:
+        """Copy a file of known size into the archive in chunks, yielding as it goes"""
+        if isinstance(archive, zipfile.ZipFile):
+            info = zipfile.ZipInfo(name, date_time=self._date_time(time.time()))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(info, mode="w", force_zip64=True) as entry:
+                chunk = source.read(CHUNK_SIZE)
+                while chunk:
+                    entry.write(chunk)
+                    yield sink.drain()
+                    chunk = source.read(CHUNK_SIZE)
+            return
+
+        # tarfile.addfile would buffer the whole file, so write the header and
+        # the padded data blocks ourselves, exactly as addfile does
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = time.time()
+        archive.addfile(info)
+        chunk = source.read(CHUNK_SIZE)
+        while chunk:
+            archive.fileobj.write(chunk)
+            yield sink.drain()
+            chunk = source.read(CHUNK_SIZE)
+        blocks, remainder = divmod(size, tarfile.BLOCKSIZE)
+        if remainder:
+            archive.fileobj.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+            blocks += 1
+        archive.offset += blocks * tarfile.BLOCKSIZE
+
+    @staticmethod
+    def _date_time(mtime: Optional[float]):
+        if not mtime:
+            return (1980, 1, 1, 0, 0, 0)
+        return time.gmtime(mtime)[:6]
@@ -0,0 +1,284 @@
+import os
+import glob
+import json
+import uuid
+import select
+import socket
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set
+
+try:
+    # LISTEN/NOTIFY needs a direct Postgres connection; psycopg2 is optional
+    import psycopg2
+    import psycopg2.extensions
+    POSTGRES_AVAILABLE = True
+except ImportError:
+    POSTGRES_AVAILABLE = False
+
+# Kept identical in src/ and Marvin-Art/, since each service is built from its own directory
+
+EVENT_TYPES = ("image.created", "image.uploaded", "image.posted")
+HELLO = "bus.hello"  # sent on start and answered once, so peers find each other before any real event
+CHANNEL = "marvin_events"
+MAX_PAYLOAD_BYTES = 7900  # NOTIFY payloads are limited to 8000 bytes
+
+Handler = Callable[[Dict[str, Any]], None]
+
+
+class EventBus:
+    """In-process event bus, and the base for the cross-process transports.
+
+    An event is {"type", "id", "source", "at", "data"}. publish() runs this
+    process's handlers straight away and hands the event to the transport;
+    events coming back from the transport that this process published are
+    ignored, so handlers see each event once. Delivery is best effort:
+    events are hints to refresh caches early, and every consumer still
+    reconciles against the database on its own schedule.
+    """
+
+    def __init__(self, source: str):
+        self.source = f"{source}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.handlers: Dict[str, List[Handler]] = {}
+        self.published = 0
+        self.received = 0
+        self.peers: Set[str] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def remote(self) -> bool:
+        """True once an event from another process has arrived over the transport.
+
+        Only then is it safe for a consumer to poll the database less often.
+        """
+        return bool(self.peers)
+
+    def subscribe(self, event_type: str, handler: Handler, remote_only: bool = False) -> None:
+        """Call handler(event) for every event of this type ("*" for all).
+
+        With remote_only, events this process published itself are skipped.
+        """
+        if remote_only:
+            local_handler = handler
+
+            def handler(event):
+                if event.get("source") != self.source:
+                    local_handler(event)
+        with self._lock:
+            self.handlers.setdefault(event_type, []).append(handler)
+
+    def _event(self, event_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "type": event_type,
+            "id": uuid.uuid4().hex,
+            "source": self.source,
+            "at": datetime.now(timezone.utc).isoformat(),
+            "data": data
+        }
+
+    def publish(self, event_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        event = self._event(event_type, data)
+        self.published += 1
+        self._dispatch(event)
+        try:
+            self._send(event)
+        except Exception as e:
+            print(f"Error publishing {event_type} event: {str(e)}")
+        return event
+
+    def _send(self, event: Dict[str, Any]) -> None:
+        pass
+
+    def _receive(self, payload) -> None:
+        """Handle an event that arrived over the transport"""
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            print("Ignoring malformed event")
+            return
+        if event.get("source") == self.source:
+            return
+        with self._lock:
+            self.peers.add(event.get("source"))
+        if event.get("type") == HELLO:
+            if not event.get("data", {}).get("reply"):
+                self._hello(reply=True)
+            return
+        self.received += 1
+        self._dispatch(event)
+
+    def _hello(self, reply: bool = False) -> None:
+        try:
+            self._send(self._event(HELLO, {"reply": reply}))
+        except Exception as e:
+            print(f"Error announcing event bus: {str(e)}")
+
+    def _dispatch(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            handlers = self.handlers.get(event.get("type"), []) + self.handlers.get("*", [])
+        for handler in handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                print(f"Error handling {event.get('type')} event: {str(e)}")
+
+    def start(self) -> "EventBus":
+        return self
+
+    def describe(self) -> str:
+        return "in-process"
+
+    def stats(self) -> Dict[str, Any]:
+        return {"transport": self.describe(), "published": self.published, "received": self.received,
+                "peers": len(self.peers)}
+
+
+class SocketEventBus(EventBus):
+    """Events as datagrams between processes on one host.
+
+    Each process binds a Unix datagram socket in a shared directory and
+    publishing sends the event to every other socket there. Sends never
+    block: a subscriber whose buffer is full misses the event. Separate
+    containers only reach each other if the directory is a shared volume.
+    """
+
+    def __init__(self, source: str, directory: str):
+        super().__init__(source)
+        self.directory = directory
+        self.path = os.path.join(directory, f"{self.source.replace(':', '-')}.sock")
+        self._socket: Optional[socket.socket] = None
+
+    def start(self) -> "SocketEventBus":
+        os.makedirs(self.directory, exist_ok=True)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.path)
+        threading.Thread(target=self._listen, daemon=True).start()
+        self._hello()
+        return self
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                payload = self._socket.recv(65536)
+            except OSError as e:
+                print(f"Event socket closed: {str(e)}")
+                return
+            self._receive(payload)
+
+    def _send(self, event: Dict[str, Any]) -> None:
+        payload = json.dumps(event).encode("utf-8")
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sender.setblocking(False)
+        try:
+            for path in glob.glob(os.path.join(self.directory, "*.sock")):
+                if path == self.path:
+                    continue
+                try:
+                    sender.sendto(payload, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Left behind by a process that has exited
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                except BlockingIOError:
+                    print(f"Event subscriber {os.path.basename(path)} is not keeping up, dropped {event['type']}")
+        finally:
+            sender.close()
+
+    def describe(self) -> str:
+        return f"unix sockets in {self.directory}"
+
+
+class PostgresEventBus(EventBus):
+    """Events over Postgres LISTEN/NOTIFY on a direct database connection.
+
+    One connection listens on a background thread; publishing uses a
+    second one, reconnecting if it has dropped. Event data should stay
+    small (ids and a few fields): NOTIFY payloads are capped at 8000 bytes.
+    """
+
+    def __init__(self, source: str, dsn: str, channel: str = CHANNEL):
+        super().__init__(source)
+        self.dsn = dsn
+        self.channel = channel
+        self._publisher = None
+        self._publish_lock = threading.Lock()
+
+    def _connect(self):
+        connection = psycopg2.connect(self.dsn)
+        connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return connection
+
+    def start(self) -> "PostgresEventBus":
+        listener = self._connect()  # fail here, not on the thread, if the database is unreachable
+        threading.Thread(target=self._listen, args=(listener,), daemon=True).start()
+        self._hello()
+        return self
+
+    def _listen(self, connection) -> None:
+        while True:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                while True:
+                    if select.select([connection], [], [], 60) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        self._receive(connection.notifies.pop(0).payload)
+            except Exception as e:
+                print(f"Event listener lost its connection, reconnecting: {str(e)}")
+                threading.Event().wait(5)
+                try:
+                    connection = self._connect()
+                except Exception as e:
+                    print(f"Error reconnecting event listener: {str(e)}")
+
+    def _send(self, event: Dict[str, Any]) -> None:
+        payload = json.dumps(event)
+        if len(payload.encode("utf-8")) > MAX_PAYLOAD_BYTES:
+            raise ValueError(f"{event['type']} event is too large for NOTIFY")
+        with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publisher is None or self._publisher.closed:
+                        self._publisher = self._connect()
+                    with self._publisher.cursor() as cursor:
+                        cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+                    return
+                except psycopg2.OperationalError:
+                    self._publisher = None
+                    if attempt:
+                        raise
+
+    def describe(self) -> str:
+        return f"postgres LISTEN/NOTIFY on {self.channel}"
+
+
+def make_event_bus(source: str) -> EventBus:
+    """The event bus chosen by EVENT_BUS: postgres, socket or local.
+
+    Without EVENT_BUS, postgres is used when DATABASE_URL is set and
+    psycopg2 is installed, otherwise sockets when EVENT_SOCKET_DIR is set
+    (a directory shared by every process, e.g. a volume mounted into both
+    containers), otherwise in-process. A transport that fails to start
+    falls back to in-process delivery.
+    """
+    choice = os.getenv("EVENT_BUS", "").lower()
+    dsn = os.getenv("DATABASE_URL")
+    socket_dir = os.getenv("EVENT_SOCKET_DIR")
+    if not choice:
+        choice = "postgres" if dsn and POSTGRES_AVAILABLE else "socket" if socket_dir else "local"
+    try:
+        if choice == "postgres":
+            if not POSTGRES_AVAILABLE or not dsn:
+                raise RuntimeError("needs psycopg2 and DATABASE_URL")
+            return PostgresEventBus(source, dsn).start()
+        if choice == "socket":
+            if not socket_dir:
+                raise RuntimeError("needs EVENT_SOCKET_DIR, a directory shared by every process")
+            return SocketEventBus(source, socket_dir).start()
+    except Exception as e:
+        print(f"Event bus '{choice}' unavailable, delivering events in-process only: {str(e)}")
+    return EventBus(source)
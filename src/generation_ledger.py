@@ -0,0 +1,245 @@
+import time
+import uuid
+import atexit
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+BUCKETS = ("hour", "day")
+
+# Every column of generation_ledger. Each queued row has all of them (None
+# where unknown): PostgREST rejects a bulk insert whose objects have
+# different keys (PGRST102), and failed generations never get an image.
+COLUMNS = (
+    "id", "image_id", "generation_type", "status", "error", "started_at",
+    "prompt_model", "prompt_attempts", "prompt_tokens", "completion_tokens",
+    "image_model", "size", "quality", "image_cost_tier", "cost_usd", "total_ms", "stages"
+)
+
+# USD list prices; update when OpenAI changes them
+TOKEN_PRICES = {  # per 1K tokens: (prompt, completion)
+    "gpt-4": (0.03, 0.06),
+}
+IMAGE_PRICES = {  # per image, by (model, quality, size)
+    ("dall-e-3", "standard", "1024x1024"): 0.040,
+    ("dall-e-3", "standard", "1024x1792"): 0.080,
+    ("dall-e-3", "standard", "1792x1024"): 0.080,
+    ("dall-e-3", "hd", "1024x1024"): 0.080,
+    ("dall-e-3", "hd", "1024x1792"): 0.120,
+    ("dall-e-3", "hd", "1792x1024"): 0.120,
+}
+
+
+def generation_cost(record: Dict[str, Any]) -> float:
+    prompt_price, completion_price = TOKEN_PRICES.get(record.get("prompt_model"), (0.0, 0.0))
+    cost = (record.get("prompt_tokens", 0) * prompt_price + record.get("completion_tokens", 0) * completion_price) / 1000
+    if record.get("image_model"):
+        cost += IMAGE_PRICES.get((record["image_model"], record.get("quality"), record.get("size")), 0.0)
+    return round(cost, 6)
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class GenerationLedger:
+    """One generation_ledger row per generation: models, tokens, cost and stage timings.
+
+    A generation is wrapped in record(); the code it calls marks stages with
+    stage() and adds details with note() / add_usage(), which find the open
+    record through a thread-local, so nothing has to be passed down. Finished
+    records are buffered and inserted in batches by a background thread
+    every `flush_seconds`, or sooner once `batch_size` are waiting. If the
+    database is unreachable, up to `max_pending` records are kept for the
+    next attempt.
+    """
+
+    def __init__(self, supabase, flush_seconds: float = 10.0, batch_size: int = 50, max_pending: int = 1000):
+        self.supabase = supabase
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.pending: List[Dict[str, Any]] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @contextmanager
+    def record(self, generation_type: str):
+        """Time a whole generation and queue its ledger row when it ends, failed or not"""
+        record = {
+            "id": str(uuid.uuid4()),
+            "generation_type": generation_type,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "status": "ok",
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "stages": {}
+        }
+        outer = getattr(self._local, "record", None)
+        self._local.record = record
+        started = time.monotonic()
+        try:
+            yield record
+        except Exception as e:
+            record["status"] = "failed"
+            record["error"] = str(e)[:500]
+            raise
+        finally:
+            self._local.record = outer
+            record["total_ms"] = round((time.monotonic() - started) * 1000)
+            if record.get("image_model"):
+                record["image_cost_tier"] = f"{record['image_model']}/{record.get('quality')}/{record.get('size')}"
+            record["cost_usd"] = generation_cost(record)
+            self._enqueue({column: record.get(column) for column in COLUMNS})
+
+    @contextmanager
+    def stage(self, name: str):
+        """Add the time spent in the block to the open record's stage (no-op outside record())"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            record = getattr(self._local, "record", None)
+            if record is not None:
+                elapsed = round((time.monotonic() - started) * 1000)
+                record["stages"][name] = record["stages"].get(name, 0) + elapsed
+
+    def note(self, **fields) -> None:
+        record = getattr(self._local, "record", None)
+        if record is not None:
+            record.update(fields)
+
+    def add_usage(self, usage) -> None:
+        """Add an OpenAI response's token usage to the open record"""
+        record = getattr(self._local, "record", None)
+        if record is not None and usage is not None:
+            record["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+            record["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+
+    def _enqueue(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self.pending.append(record)
+            if len(self.pending) > self.max_pending:
+                dropped = len(self.pending) - self.max_pending
+                del self.pending[:dropped]
+                print(f"Generation ledger backlog full, dropped {dropped} oldest records")
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Insert everything waiting in one batch; returns how many rows were written"""
+        with self._lock:
+            batch, self.pending = self.pending, []
+        if not batch:
+            return 0
+        try:
+            self.supabase.table('generation_ledger').insert(batch).execute()
+            return len(batch)
+        except Exception as e:
+            print(f"Error writing {len(batch)} generation ledger records, will retry: {str(e)}")
+            with self._lock:
+                self.pending = (batch + self.pending)[-self.max_pending:]
+            return 0
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            self.flush()
+
+    def summary(self, since: datetime, bucket: str = "day", fallback_row_limit: int = 20000) -> Dict[str, Any]:
+        """Totals, per-stage timings, cost per image tier and time buckets since `since`.
+
+        Uses the generation_ledger_summary database function; if it isn't
+        installed, pages through the rows and aggregates here.
+        """
+        try:
+            response = self.supabase.rpc('generation_ledger_summary', {
+                "since": since.isoformat(),
+                "bucket": bucket
+            }).execute()
+            summary = response.data or {}
+            summary["truncated"] = False
+            return summary
+        except Exception as e:
+            print(f"generation_ledger_summary unavailable, aggregating locally: {str(e)}")
+
+        rows = []
+        page_size = 1000
+        while len(rows) < fallback_row_limit:
+            page = self.supabase.table('generation_ledger')\
+                .select('started_at, status, cost_usd, prompt_tokens, completion_tokens, '
+                        'image_cost_tier, total_ms, stages')\
+                .gte('started_at', since.isoformat())\
+                .order('started_at')\
+                .range(len(rows), len(rows) + page_size - 1)\
+                .execute().data or []
+            rows.extend(page)
+            if len(page) < page_size:
+                break
+        summary = aggregate(rows, bucket)
+        summary["truncated"] = len(rows) >= fallback_row_limit
+        return summary
+
+
+def aggregate(rows: List[Dict[str, Any]], bucket: str = "day") -> Dict[str, Any]:
+    """The same summary as generation_ledger_summary, from ledger rows"""
+    bucket_len = 13 if bucket == "hour" else 10  # ISO timestamp prefix: YYYY-MM-DDTHH / YYYY-MM-DD
+    bucket_hours = 1 if bucket == "hour" else 24
+
+    def totals(group: List[Dict[str, Any]]) -> Dict[str, Any]:
+        durations = [r["total_ms"] for r in group if r.get("total_ms") is not None]
+        return {
+            "generations": len(group),
+            "failed": sum(1 for r in group if r.get("status") == "failed"),
+            "cost_usd": round(sum(r.get("cost_usd") or 0 for r in group), 4),
+            "prompt_tokens": sum(r.get("prompt_tokens") or 0 for r in group),
+            "completion_tokens": sum(r.get("completion_tokens") or 0 for r in group),
+            "mean_total_ms": round(sum(durations) / len(durations)) if durations else None,
+            "p95_total_ms": _percentile(durations, 0.95)
+        }
+
+    stage_times = defaultdict(list)
+    tiers = defaultdict(list)
+    buckets = defaultdict(list)
+    for row in rows:
+        for name, ms in (row.get("stages") or {}).items():
+            stage_times[name].append(ms)
+        if row.get("image_cost_tier"):
+            tiers[row["image_cost_tier"]].append(row)
+        buckets[(row.get("started_at") or "")[:bucket_len]].append(row)
+
+    def bucket_start(prefix: str) -> str:
+        return prefix + (":00:00" if bucket == "hour" else "T00:00:00")
+
+    return {
+        "bucket": bucket,
+        "totals": totals(rows),
+        "stages": {
+            name: {"mean_ms": round(sum(times) / len(times)), "p95_ms": _percentile(times, 0.95)}
+            for name, times in sorted(stage_times.items())
+        },
+        "by_tier": {
+            tier: {"generations": len(group), "cost_usd": round(sum(r.get("cost_usd") or 0 for r in group), 4)}
+            for tier, group in sorted(tiers.items())
+        },
+        "buckets": [
+            {"bucket": bucket_start(prefix), **totals(group),
+             "per_hour": round(len(group) / bucket_hours, 3)}
+            for prefix, group in sorted(buckets.items())
+        ]
+    }
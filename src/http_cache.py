@@ -0,0 +1,181 @@
+import os
+import gzip
+import hashlib
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Optional, Set, Tuple
+
+import brotli
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+# Responses smaller than this aren't worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+# Generated images never change, so versioned image URLs can be cached forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Bumped whenever this process changes image rows without changing their
+# created_at or the row count (e.g. when a background upload finishes),
+# so ETags built from those two values still change.
+_data_version = 0
+_version_lock = threading.Lock()
+
+
+def bump_data_version(*args) -> None:
+    global _data_version
+    with _version_lock:
+        _data_version += 1
+
+
+def make_etag(*parts: Any) -> str:
+    """Build a weak ETag from cheap-to-compute values such as newest created_at and row count"""
+    digest = hashlib.sha1(repr((_data_version,) + parts).encode("utf-8")).hexdigest()[:20]
+    # Weak, because the body differs byte-for-byte between compressed encodings
+    return f'W/"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check If-None-Match, ignoring the weak prefix as RFC 9110 requires for GET"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == wanted:
+            return True
+    return False
+
+
+def accepted_encodings(request: Request) -> Set[str]:
+    accept = request.headers.get("accept-encoding", "")
+    return {part.split(";")[0].strip().lower() for part in accept.split(",")}
+
+
+def choose_encoding(request: Request) -> Optional[str]:
+    encodings = accepted_encodings(request)
+    if "br" in encodings:
+        return "br"
+    if "gzip" in encodings:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        # Quality 5 is the usual sweet spot for on-the-fly compression
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def not_modified(etag: str, max_age: int) -> Response:
+    return Response(status_code=304, headers={
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max_age}",
+        "Vary": "Accept-Encoding"
+    })
+
+
+def json_response(request: Request, payload: Any, etag: Optional[str] = None,
+                  max_age: int = 10) -> Response:
+    """Serialize payload with orjson, compressing it when the client allows and it's large enough"""
+    body = orjson.dumps(payload)
+    headers = {
+        "Cache-Control": f"public, max-age={max_age}",
+        "Vary": "Accept-Encoding"
+    }
+    if etag:
+        headers["ETag"] = etag
+
+    encoding = choose_encoding(request)
+    if encoding and len(body) >= MIN_COMPRESS_SIZE:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single "bytes=" range into inclusive (start, end).
+
+    Returns None when the header should be ignored (malformed or multiple
+    ranges, which we answer with the full body) and raises ValueError when
+    the range can't be satisfied.
+    """
+    if not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, separator, end_text = header[6:].strip().partition("-")
+    if not separator or not all(t == "" or t.isdigit() for t in (start_text, end_text)):
+        return None
+    if start_text == "":
+        # Suffix range: the last N bytes
+        if end_text == "":
+            return None
+        length = int(end_text)
+        if length == 0:
+            raise ValueError("range not satisfiable")
+        return max(0, size - length), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if start > end and end_text:
+        return None
+    if start >= size:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def binary_response(request: Request, media_type: str, etag: str, cache_control: str,
+                    data: Optional[bytes] = None, path: Optional[str] = None,
+                    last_modified: Optional[float] = None) -> Response:
+    """Serve image bytes (or a file) with validators, 304 handling and single byte ranges"""
+    if path is not None and last_modified is None:
+        last_modified = os.path.getmtime(path)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes"
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+
+    # Conditional GET: If-None-Match takes precedence over If-Modified-Since
+    if request.headers.get("if-none-match"):
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+    elif last_modified is not None and request.headers.get("if-modified-since"):
+        try:
+            since = parsedate_to_datetime(request.headers["if-modified-since"]).timestamp()
+            if int(last_modified) <= since:
+                return Response(status_code=304, headers=headers)
+        except (TypeError, ValueError):
+            pass
+
+    size = len(data) if data is not None else os.path.getsize(path)
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+
+    start, end = byte_range if byte_range else (0, size - 1)
+    if data is not None:
+        body = data[start:end + 1]
+    else:
+        with open(path, "rb") as f:
+            f.seek(start)
+            body = f.read(end - start + 1)
+
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return Response(content=body, status_code=206, media_type=media_type, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
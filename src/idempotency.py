@@ -0,0 +1,90 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a request with a different body"""
+
+
+class IdempotencyStore:
+    """Runs each Idempotency-Key's work once and replays the result.
+
+    The first request with a key runs the work; requests with the same key
+    that arrive while it is running wait for it and get its result, and
+    later ones get the stored result until it is `ttl_seconds` old. Failed
+    work isn't stored, so a retry runs it again. At most `max_entries`
+    results are kept, oldest evicted first. Results live in memory, so a
+    restart forgets them.
+    """
+
+    def __init__(self, ttl_seconds: float = 24 * 3600, max_entries: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self.replays = 0
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float) -> None:
+        """Drop expired results, then the oldest ones over the size limit; running work stays"""
+        excess = len(self.entries) + 1 - self.max_entries  # leave room for the entry being added
+        for scope_key, entry in list(self.entries.items()):
+            if not entry["done"].is_set():
+                continue
+            if excess > 0 or now - entry["completed_at"] > self.ttl_seconds:
+                del self.entries[scope_key]
+                excess -= 1
+
+    def run(self, scope: str, key: str, fingerprint: str, work: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return (result, replayed); blocks while another request with the key is running"""
+        scope_key = (scope, key)
+        with self._lock:
+            now = time.time()
+            self._prune(now)
+            entry = self.entries.get(scope_key)
+            if entry is not None and entry["fingerprint"] != fingerprint:
+                raise IdempotencyConflict(f"Idempotency-Key {key} was used with a different request")
+            owner = entry is None
+            if owner:
+                entry = {"fingerprint": fingerprint, "done": threading.Event(),
+                         "result": None, "error": None, "completed_at": None}
+                self.entries[scope_key] = entry
+
+        if not owner:
+            entry["done"].wait()
+            if entry["error"] is not None:
+                raise entry["error"]
+            with self._lock:
+                self.replays += 1
+            return entry["result"], True
+
+        try:
+            entry["result"] = work()
+        except Exception as e:
+            entry["error"] = e
+            with self._lock:
+                if self.entries.get(scope_key) is entry:
+                    del self.entries[scope_key]
+            raise
+        finally:
+            entry["completed_at"] = time.time()
+            entry["done"].set()
+        return entry["result"], False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            running = sum(1 for e in self.entries.values() if not e["done"].is_set())
+            return {"stored": len(self.entries) - running, "running": running, "replays": self.replays}
+
+
+def check_key(key: Optional[str]) -> Optional[str]:
+    """Validated Idempotency-Key header value, or None when absent"""
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+    return key
@@ -0,0 +1,81 @@
+import mimetypes
+from io import BytesIO
+from typing import Any, Dict, List, Optional
+
+from PIL import Image, features
+
+try:
+    # AVIF support for Pillow < 11 comes from an optional plugin
+    import pillow_avif  # noqa: F401
+    AVIF_AVAILABLE = True
+except ImportError:
+    AVIF_AVAILABLE = False
+
+# Python 3.8's mimetypes doesn't know these, and /proxy-image relies on it
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+
+FORMATS = ("png", "webp", "avif")
+
+
+class ImageEncoder:
+    """Encodes generated images for storage in one of the supported formats.
+
+    png is always lossless (zlib level 9 with filter optimisation). webp is
+    lossless unless a quality is given. avif is always lossy and defaults to
+    quality 80, which is visually transparent for DALL-E output.
+    """
+
+    def __init__(self, format: str = "png", quality: Optional[int] = None):
+        if format not in FORMATS:
+            raise ValueError(f"Unsupported storage format: {format}")
+        self.format = format
+        self.quality = quality
+
+    @property
+    def extension(self) -> str:
+        return self.format
+
+    @property
+    def content_type(self) -> str:
+        return f"image/{self.format}"
+
+    @property
+    def lossless(self) -> bool:
+        return self.format == "png" or (self.format == "webp" and self.quality is None)
+
+    def save_options(self) -> Dict[str, Any]:
+        if self.format == "png":
+            return {"format": "PNG", "optimize": True}
+        if self.format == "webp":
+            if self.quality is None:
+                return {"format": "WEBP", "lossless": True, "quality": 100, "method": 4}
+            return {"format": "WEBP", "quality": self.quality, "method": 6}
+        return {"format": "AVIF", "quality": self.quality or 80, "speed": 6}
+
+    def encode(self, image: Image.Image) -> bytes:
+        buffer = BytesIO()
+        image.save(buffer, **self.save_options())
+        return buffer.getvalue()
+
+    def describe(self) -> Dict[str, Any]:
+        """Summary stored in the image's settings"""
+        return {"format": self.format, "quality": self.quality, "lossless": self.lossless}
+
+
+def available_formats() -> List[str]:
+    formats = ["png"]
+    if features.check("webp"):
+        formats.append("webp")
+    if AVIF_AVAILABLE:
+        formats.append("avif")
+    return formats
+
+
+def make_encoder(format: str = "png", quality: Optional[int] = None) -> ImageEncoder:
+    """Encoder for the configured format, falling back to optimized PNG if it isn't available"""
+    format = format.lower()
+    if format not in available_formats():
+        print(f"Storage format {format} is not available, storing images as optimized PNG")
+        return ImageEncoder("png")
+    return ImageEncoder(format, quality)
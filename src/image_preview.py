@@ -0,0 +1,82 @@
+from typing import Dict
+
+import numpy as np
+from PIL import Image
+
+BASE83_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+# Previews only need a handful of pixels; this keeps encoding well under a millisecond
+SAMPLE_SIZE = 32
+
+
+def _encode83(value: int, length: int) -> str:
+    return "".join(BASE83_CHARS[(value // 83 ** (length - i)) % 83] for i in range(1, length + 1))
+
+
+def _srgb_to_linear(values: np.ndarray) -> np.ndarray:
+    values = values / 255.0
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+
+def _linear_to_srgb(value: float) -> int:
+    value = min(1.0, max(0.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash_encode(pixels: np.ndarray, x_components: int = 4, y_components: int = 3) -> str:
+    """BlurHash of an (height, width, 3) uint8 RGB array.
+
+    All DCT components are computed at once: a cosine basis per axis and a
+    single einsum over the linear-light pixels.
+    """
+    height, width = pixels.shape[:2]
+    linear = _srgb_to_linear(pixels[:, :, :3].astype(np.float64))
+    basis_x = np.cos(np.pi * np.arange(x_components)[:, None] * np.arange(width)[None, :] / width)
+    basis_y = np.cos(np.pi * np.arange(y_components)[:, None] * np.arange(height)[None, :] / height)
+    # factors[j, i] is the (i, j) component; the DC term is normalised by 1, the rest by 2
+    factors = np.einsum("jy,ix,yxc->jic", basis_y, basis_x, linear) / (width * height)
+    factors[1:, :, :] *= 2
+    factors[0, 1:, :] *= 2
+    factors = factors.reshape(-1, 3)
+    dc, ac = factors[0], factors[1:]
+
+    result = _encode83((x_components - 1) + (y_components - 1) * 9, 1)
+    if len(ac):
+        quantised_max = int(max(0, min(82, np.floor(np.abs(ac).max() * 166 - 0.5))))
+        maximum_value = (quantised_max + 1) / 166
+    else:
+        quantised_max = 0
+        maximum_value = 1
+    result += _encode83(quantised_max, 1)
+
+    result += _encode83(
+        (_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4
+    )
+    scaled = ac / maximum_value
+    quantised = np.clip(np.floor(np.sign(scaled) * np.abs(scaled) ** 0.5 * 9 + 9.5), 0, 18).astype(int)
+    for r, g, b in quantised:
+        result += _encode83(int(r) * 19 * 19 + int(g) * 19 + int(b), 2)
+    return result
+
+
+def dominant_color(pixels: np.ndarray) -> str:
+    """Most common colour as #rrggbb, using a 4-bit-per-channel histogram"""
+    rgb = pixels[:, :, :3].reshape(-1, 3).astype(np.int64)
+    bins = ((rgb >> 4) * np.array([256, 16, 1])).sum(axis=1)
+    counts = np.bincount(bins, minlength=4096)
+    # Average the pixels in the winning bin so the colour isn't snapped to the grid
+    r, g, b = rgb[bins == counts.argmax()].mean(axis=0).round().astype(int)
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def compute_preview(image: Image.Image) -> Dict[str, str]:
+    """BlurHash and dominant colour for an image, computed from a small downsampled copy"""
+    sample = image.convert("RGB")
+    sample.thumbnail((SAMPLE_SIZE, SAMPLE_SIZE), Image.BILINEAR)
+    pixels = np.asarray(sample)
+    return {
+        "blurhash": blurhash_encode(pixels),
+        "dominant_color": dominant_color(pixels)
+    }
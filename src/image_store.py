@@ -0,0 +1,195 @@
+import os
+import json
+import uuid
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+INDEX_FILENAME = "index.json"
+
+
+class LocalImageStore:
+    """Size-capped local copy of generated images.
+
+    Files live in a single directory under unique names. An in-memory index
+    (persisted alongside the files) records each file's size, creation time
+    and whether it is already safely in Supabase Storage, so lookups don't
+    touch the filesystem. Only uploaded files are ever evicted: while
+    uploads are behind, the store goes over its cap rather than lose the
+    only copy of an image, and logs a warning through `logger`.
+    """
+
+    def __init__(self, directory: str = "images", max_bytes: int = 2 * 1024 ** 3, logger=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.logger = logger
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.total_bytes = 0
+        self.over_capacity = False
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, INDEX_FILENAME)
+
+    def _load_index(self) -> None:
+        """Rebuild the index from disk, keeping upload state from the saved index"""
+        saved = {}
+        try:
+            with open(self._index_path()) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        entries = {}
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.is_file() or entry.name == INDEX_FILENAME or entry.name.endswith(".tmp"):
+                    continue
+                stat = entry.stat()
+                entries[entry.name] = {
+                    "size": stat.st_size,
+                    "created": saved.get(entry.name, {}).get("created", stat.st_mtime),
+                    "uploaded": saved.get(entry.name, {}).get("uploaded", False)
+                }
+        with self._lock:
+            self.entries = entries
+            self.total_bytes = sum(e["size"] for e in entries.values())
+
+    def _save_index(self) -> None:
+        tmp_path = self._index_path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self._index_path())
+
+    def new_filename(self, extension: str = "png") -> str:
+        """Unique filename, safe when several generations land in the same second"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return f"marvin_art_{timestamp}_{uuid.uuid4().hex[:8]}.{extension}"
+
+    def save(self, data: bytes, filename: Optional[str] = None, uploaded: bool = False) -> str:
+        """Write image bytes into the store and return the local path"""
+        filename = filename or self.new_filename()
+        path = os.path.join(self.directory, filename)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            previous = self.entries.get(filename)
+            if previous:
+                self.total_bytes -= previous["size"]
+            self.entries[filename] = {
+                "size": len(data),
+                "created": datetime.now().timestamp(),
+                "uploaded": uploaded
+            }
+            self.total_bytes += len(data)
+            warning = self._evict(keep=filename)
+            self._save_index()
+        self._warn(warning)
+        return path
+
+    def mark_uploaded(self, local_path: str) -> None:
+        """Record that a file is safely in Supabase Storage and may be evicted"""
+        self.mark_uploaded_many([local_path])
+
+    def mark_uploaded_many(self, local_paths: Iterable[str]) -> int:
+        """mark_uploaded for many files, saving the index once; returns how many changed"""
+        marked = 0
+        with self._lock:
+            for local_path in local_paths:
+                entry = self.entries.get(os.path.basename(local_path))
+                if entry and not entry["uploaded"]:
+                    entry["uploaded"] = True
+                    marked += 1
+            if not marked:
+                return 0
+            warning = self._evict()
+            self._save_index()
+        self._warn(warning)
+        return marked
+
+    def not_uploaded(self) -> List[str]:
+        """Filenames of stored images not yet known to be in Supabase Storage"""
+        with self._lock:
+            return [name for name, entry in self.entries.items() if not entry["uploaded"]]
+
+    def resolve(self, local_path: Optional[str]) -> Optional[str]:
+        """Return the path of a locally stored image, or None, without touching the disk"""
+        if not local_path:
+            return None
+        filename = os.path.basename(local_path)
+        if filename in self.entries:
+            return os.path.join(self.directory, filename)
+        return None
+
+    def adopt(self, path: str) -> Optional[str]:
+        """Move an image written outside the store (e.g. the old working-directory files) into it"""
+        filename = os.path.basename(path)
+        if not os.path.isfile(path) or filename in self.entries:
+            return None
+        target = os.path.join(self.directory, filename)
+        os.replace(path, target)
+        with self._lock:
+            size = os.path.getsize(target)
+            self.entries[filename] = {
+                "size": size,
+                "created": os.path.getmtime(target),
+                "uploaded": False
+            }
+            self.total_bytes += size
+            warning = self._evict()
+            self._save_index()
+        self._warn(warning)
+        return target
+
+    def _evict(self, keep: Optional[str] = None) -> Optional[str]:
+        """Remove uploaded files, oldest first, until under the byte cap.
+
+        Un-uploaded files are never removed. Returns a warning the first time
+        they alone keep the store over its cap (called with the lock held, so
+        the caller logs it after releasing the lock).
+        """
+        if self.total_bytes > self.max_bytes:
+            candidates = sorted(
+                (name for name, entry in self.entries.items() if entry["uploaded"] and name != keep),
+                key=lambda name: self.entries[name]["created"]
+            )
+            for name in candidates:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                entry = self.entries.pop(name)
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+                self.total_bytes -= entry["size"]
+
+        was_over, self.over_capacity = self.over_capacity, self.total_bytes > self.max_bytes
+        if self.over_capacity and not was_over:
+            pending = sum(1 for e in self.entries.values() if not e["uploaded"])
+            return (f"Local image store is over its cap ({self.total_bytes} of {self.max_bytes} bytes) "
+                    f"with {pending} images not yet uploaded; keeping them until they are")
+        return None
+
+    def _warn(self, message: Optional[str]) -> None:
+        if not message:
+            return
+        if self.logger:
+            self.logger.warning(message, {"directory": self.directory})
+        else:
+            print(message)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "files": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "over_capacity": self.over_capacity,
+                "uploaded": sum(1 for e in self.entries.values() if e["uploaded"])
+            }
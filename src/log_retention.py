@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from postgrest.types import ReturnMethod
+
+
+def parse_retention_days(value: str, default_days: int = 7) -> Dict[str, int]:
+    """Parse a retention spec like "default=7,WARNING=14,ERROR=30" into a dict"""
+    retention = {"default": default_days}
+    for part in (value or "").split(","):
+        if "=" not in part:
+            continue
+        level, days = part.split("=", 1)
+        level = level.strip()
+        retention[level if level.lower() == "default" else level.upper()] = int(days)
+    if "DEFAULT" in retention:
+        retention["default"] = retention.pop("DEFAULT")
+    return retention
+
+
+class LogRetention:
+    """Removes expired rows from marvin_art_logs according to per-level retention.
+
+    Prefers the purge_marvin_art_logs database function, which drops whole
+    daily partitions and deletes the rest in bounded batches server-side.
+    If the function isn't installed yet, falls back to deleting in bounded
+    batches through the REST API, without returning deleted rows.
+    """
+
+    def __init__(self, supabase, retention_days: Dict[str, int], batch_size: int = 5000,
+                 max_batches_per_call: int = 20, max_calls: int = 50):
+        self.supabase = supabase
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.max_batches_per_call = max_batches_per_call
+        self.max_calls = max_calls
+
+    def run(self) -> Dict[str, Any]:
+        """Apply retention and report what was reclaimed"""
+        try:
+            return self._run_rpc()
+        except Exception as e:
+            print(f"purge_marvin_art_logs unavailable, deleting in batches: {str(e)}")
+            return self._run_batched()
+
+    def _run_rpc(self) -> Dict[str, Any]:
+        report = {"rows_deleted": 0, "bytes_reclaimed": 0, "partitions_dropped": 0,
+                  "by_level": {}, "complete": False, "method": "partition"}
+        # Each call is its own transaction, so locks are released between calls
+        for _ in range(self.max_calls):
+            result = self.supabase.rpc('purge_marvin_art_logs', {
+                "retention_days": self.retention_days,
+                "batch_size": self.batch_size,
+                "max_batches": self.max_batches_per_call
+            }).execute().data or {}
+            report["rows_deleted"] += result.get("rows_deleted", 0)
+            report["bytes_reclaimed"] += result.get("bytes_reclaimed", 0)
+            report["partitions_dropped"] += result.get("partitions_dropped", 0)
+            for level, count in (result.get("by_level") or {}).items():
+                report["by_level"][level] = report["by_level"].get(level, 0) + count
+            if result.get("complete", True):
+                report["complete"] = True
+                break
+        return report
+
+    def _run_batched(self) -> Dict[str, Any]:
+        report = {"rows_deleted": 0, "bytes_reclaimed": None, "partitions_dropped": 0,
+                  "by_level": {}, "complete": True, "method": "batched"}
+        levels = [level for level in self.retention_days if level != "default"]
+        calls = 0
+
+        for level in levels + [None]:
+            days = self.retention_days["default"] if level is None else self.retention_days[level]
+            cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat()
+            deleted = 0
+            while True:
+                if calls >= self.max_calls * self.max_batches_per_call:
+                    report["complete"] = False
+                    break
+                ids = self._expired_ids(level, levels, cutoff)
+                if not ids:
+                    break
+                self.supabase.table('marvin_art_logs')\
+                    .delete(returning=ReturnMethod.minimal)\
+                    .in_('id', ids)\
+                    .execute()
+                calls += 1
+                deleted += len(ids)
+                if len(ids) < self.batch_size:
+                    break
+            report["by_level"][level or "default"] = deleted
+            report["rows_deleted"] += deleted
+        return report
+
+    def _expired_ids(self, level: Optional[str], levels, cutoff: str):
+        query = self.supabase.table('marvin_art_logs').select('id').lt('created_at', cutoff)
+        if level is not None:
+            query = query.eq('level', level)
+        elif levels:
+            query = query.not_.in_('level', levels)
+        response = query.limit(self.batch_size).execute()
+        return [row['id'] for row in response.data or []]
@@ -0,0 +1,96 @@
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+BUCKETS = ("hour", "day")
+
+ID_PATTERN = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F-]{27}")
+NUMBER_PATTERN = re.compile(r"[0-9]+")
+
+
+def normalize_message(message: str) -> str:
+    """Collapse ids and numbers so repeats of the same event group together"""
+    return NUMBER_PATTERN.sub("<n>", ID_PATTERN.sub("<id>", message or ""))
+
+
+def get_log_stats(
+    supabase,
+    since: datetime,
+    bucket: str = "hour",
+    level: Optional[str] = None,
+    source: Optional[str] = None,
+    top: int = 10,
+    fallback_row_limit: int = 20000
+) -> Dict[str, Any]:
+    """Aggregate marvin_art_logs by level, source and time bucket.
+
+    Uses the marvin_art_log_stats database function. If it isn't installed,
+    falls back to paging through the matching rows (only the columns needed)
+    and aggregating here, stopping after fallback_row_limit rows.
+    """
+    try:
+        response = supabase.rpc('marvin_art_log_stats', {
+            "since": since.isoformat(),
+            "bucket": bucket,
+            "filter_level": level,
+            "filter_source": source,
+            "top_n": top
+        }).execute()
+        stats = response.data or {}
+        stats["truncated"] = False
+        return stats
+    except Exception as e:
+        print(f"marvin_art_log_stats unavailable, aggregating locally: {str(e)}")
+
+    by_level = Counter()
+    by_source = Counter()
+    buckets = Counter()
+    messages = Counter()
+    last_seen: Dict[tuple, str] = {}
+    bucket_len = 13 if bucket == "hour" else 10  # ISO timestamp prefix: YYYY-MM-DDTHH / YYYY-MM-DD
+
+    page_size = 1000
+    offset = 0
+    total = 0
+    while offset < fallback_row_limit:
+        query = supabase.table('marvin_art_logs')\
+            .select('level, source, message, created_at')\
+            .gte('created_at', since.isoformat())
+        if level:
+            query = query.eq('level', level)
+        if source:
+            query = query.eq('source', source)
+        rows = query.order('created_at').range(offset, offset + page_size - 1).execute().data or []
+
+        for row in rows:
+            row_source = row.get('source') or 'unknown'
+            created_at = row.get('created_at') or ''
+            by_level[row['level']] += 1
+            by_source[row_source] += 1
+            buckets[(created_at[:bucket_len], row['level'], row_source)] += 1
+            key = (normalize_message(row.get('message')), row['level'])
+            messages[key] += 1
+            last_seen[key] = max(last_seen.get(key, ''), created_at)
+        total += len(rows)
+        offset += page_size
+        if len(rows) < page_size:
+            break
+
+    def bucket_start(prefix: str) -> str:
+        return prefix + (":00:00" if bucket == "hour" else "T00:00:00")
+
+    return {
+        "total": total,
+        "by_level": dict(by_level),
+        "by_source": dict(by_source),
+        "buckets": [
+            {"bucket": bucket_start(b), "level": lvl, "source": src, "count": n}
+            for (b, lvl, src), n in sorted(buckets.items())
+        ],
+        "top_messages": [
+            {"message": msg, "level": lvl, "count": n, "last_seen": last_seen[(msg, lvl)]}
+            for (msg, lvl), n in messages.most_common(top)
+        ],
+        "truncated": offset >= fallback_row_limit
+    }
@@ -1,18 +1,17 @@
 import os
 from dotenv import load_dotenv
-from supabase import create_client, __version__ as supabase_version
+from supabase import __version__ as supabase_version
 import json
-from typing import Dict, Any, Literal, List, Optional
+from typing import Dict, Any, Literal, List, Optional, Tuple
 from datetime import datetime, timedelta
 from openai import OpenAI
-import requests
 from PIL import Image
 from io import BytesIO
 import socket
 import sys
-from fastapi import FastAPI, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, Response
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 import os
@@ -20,6 +19,32 @@ import time
 import schedule
 from threading import Thread
 import uvicorn
+import uuid
+from prompt_index import PromptIndex
+from static_assets import StaticAssets
+from search_index import InvertedIndex
+from log_retention import LogRetention, parse_retention_days
+from log_stats import BUCKETS, get_log_stats
+from image_store import LocalImageStore
+from upload_queue import UploadQueue
+from outbox import Outbox
+from thumbnails import ThumbnailCache, snap_width
+from image_preview import compute_preview
+from image_encoding import make_encoder
+from archive_export import FORMATS as EXPORT_FORMATS, ArchiveExporter
+from event_bus import make_event_bus
+from service_clients import after_keyset, create_supabase_client, http_get, openai_http_client, pool_stats
+from idempotency import IdempotencyConflict, IdempotencyStore, check_key
+from generation_ledger import BUCKETS as LEDGER_BUCKETS, GenerationLedger
+from circuit_breaker import CIRCUIT_RESET_SECONDS, breaker_stats, circuit_breaker
+from read_replica import ReadReplica
+from http_cache import (
+    IMMUTABLE_CACHE_CONTROL, binary_response, bump_data_version, etag_matches,
+    json_response, make_etag, not_modified
+)
+import hashlib
+import mimetypes
+import glob
 
 # Load environment variables
 load_dotenv()
@@ -33,14 +58,25 @@ app = FastAPI(
 
 # No startup event handler - we'll use an endpoint instead
 
-# Mount static files directory
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Fingerprint and precompress the web UI assets once at startup
+STATIC_BUILD_DIR = os.getenv("STATIC_BUILD_DIR", "data/static")
+static_assets = StaticAssets(source_dir="static", build_dir=STATIC_BUILD_DIR)
+static_assets.build()
+
+# Serve static files: fingerprinted names are immutable, original names revalidate
+@app.get("/static/{filename}")
+async def get_static(filename: str, request: Request):
+    """Serve a web UI asset"""
+    response = static_assets.serve(request, filename)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return response
 
 # Add a route to serve the web UI
 @app.get("/ui")
-async def get_ui():
+async def get_ui(request: Request):
     """Serve the web UI"""
-    return FileResponse("static/index.html")
+    return static_assets.serve_index(request)
 
 # Database Logger class
 class DatabaseLogger:
@@ -49,6 +85,10 @@ class DatabaseLogger:
     
     def log(self, level, message, metadata=None):
         """Log a message to the database"""
+        if supabase_circuit.is_open():
+            # Supabase is down; don't queue up more failing writes
+            print(f"[{level}] {message}")
+            return
         try:
             log_data = {
                 "level": level,
@@ -73,6 +113,10 @@ class DatabaseLogger:
     def error(self, message, metadata=None):
         self.log("ERROR", message, metadata)
 
+# Supabase and OpenAI requests fail fast while their circuit is open (see service_clients.py)
+supabase_circuit = circuit_breaker("supabase")
+openai_circuit = circuit_breaker("openai")
+
 # Initialize Supabase client
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
@@ -94,9 +138,9 @@ except Exception as e:
     sys.exit(1)
 
 try:
-    # Initialize Supabase client with only the required parameters
+    # Initialize Supabase client with only the required parameters, on pooled connections
     # Explicitly avoiding any proxy settings
-    supabase = create_client(
+    supabase = create_supabase_client(
         supabase_url=supabase_url,
         supabase_key=supabase_key
     )
@@ -112,11 +156,146 @@ if not openai_api_key:
     print("Warning: OPENAI_API_KEY not found in .env file")
     openai_client = None
 else:
-    openai_client = OpenAI(api_key=openai_api_key)
+    openai_client = OpenAI(api_key=openai_api_key, http_client=openai_http_client())
 
 # Marvin's specific ID
 MARVIN_ID = "af871ddd-febb-4454-9171-080450357b8c"
 
+# Prompt similarity configuration
+PROMPT_INDEX_PATH = os.getenv("PROMPT_INDEX_PATH", "data/prompt_index.npz")
+PROMPT_SIMILARITY_THRESHOLD = float(os.getenv("PROMPT_SIMILARITY_THRESHOLD", "0.6"))
+PROMPT_MAX_ATTEMPTS = 3
+
+# Load the prompt similarity index and catch up on prompts saved since it was written
+prompt_index = PromptIndex(path=PROMPT_INDEX_PATH)
+try:
+    if prompt_index.load():
+        print(f"Loaded prompt index with {len(prompt_index)} prompts")
+    added = prompt_index.sync(supabase, character_id=MARVIN_ID)
+    if added:
+        prompt_index.save()
+    print(f"Prompt index ready ({len(prompt_index)} prompts, {added} new)")
+except Exception as e:
+    print(f"Error loading prompt index: {str(e)}")
+
+# Local image store: unique filenames in one directory, capped in size
+LOCAL_IMAGE_DIR = os.getenv("LOCAL_IMAGE_DIR", "images")
+LOCAL_IMAGE_MAX_BYTES = int(os.getenv("LOCAL_IMAGE_MAX_BYTES", str(2 * 1024 ** 3)))
+# Un-uploaded images are never evicted; the store goes over the cap and logs a warning instead
+image_store = LocalImageStore(directory=LOCAL_IMAGE_DIR, max_bytes=LOCAL_IMAGE_MAX_BYTES,
+                              logger=DatabaseLogger(source="art_generator"))
+
+# Move images saved by older versions into the working directory into the store
+for legacy_path in glob.glob("marvin_art_*.png"):
+    image_store.adopt(legacy_path)
+
+def mark_stored_images(chunk_size: int = 100) -> int:
+    """Mark store files whose image row already has a storage_path as uploaded.
+
+    Older versions uploaded every image as it was generated, so adopted files
+    are nearly all in storage already, and the upload queue only picks up
+    rows without a storage_path; without this they could never be evicted.
+    """
+    names = image_store.not_uploaded()
+    marked = 0
+    for start in range(0, len(names), chunk_size):
+        chunk = names[start:start + chunk_size]
+        # Older rows hold the bare filename, newer ones the path inside the store
+        paths = chunk + [os.path.join(LOCAL_IMAGE_DIR, name) for name in chunk]
+        rows = supabase.table('images').select('local_path, storage_path').in_('local_path', paths).execute().data or []
+        marked += image_store.mark_uploaded_many(row['local_path'] for row in rows if row.get('storage_path'))
+    return marked
+
+try:
+    marked = mark_stored_images()
+    if marked:
+        print(f"Marked {marked} locally stored images as already in storage")
+except Exception as e:
+    print(f"Error checking which local images are already in storage: {str(e)}")
+print(f"Local image store: {image_store.stats()}")
+
+# Downscaled gallery variants (?w=256/512/1024), encoded once and kept on disk
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", "data/thumbnails")
+thumbnails = ThumbnailCache(THUMBNAIL_DIR)
+
+# How generated images are encoded for storage: png (optimized, the default, so
+# stored files stay PNGs for existing consumers), webp (opt-in, lossless unless a
+# quality is set) or avif (needs pillow-avif-plugin). The untouched DALL-E PNG
+# can be kept as well, under originals/ in the bucket.
+STORAGE_IMAGE_FORMAT = os.getenv("STORAGE_IMAGE_FORMAT", "png")
+STORAGE_IMAGE_QUALITY = os.getenv("STORAGE_IMAGE_QUALITY")
+STORAGE_KEEP_ORIGINAL = os.getenv("STORAGE_KEEP_ORIGINAL", "false").lower() == "true"
+image_encoder = make_encoder(STORAGE_IMAGE_FORMAT, int(STORAGE_IMAGE_QUALITY) if STORAGE_IMAGE_QUALITY else None)
+print(f"Storing images as {image_encoder.describe()}")
+
+# Events shared with the social agent: image.created, image.uploaded, image.posted
+event_bus = make_event_bus("generator")
+print(f"Event bus: {event_bus.describe()}")
+
+def on_image_uploaded(image_id: str):
+    bump_data_version()
+    read_replica.refresh(image_id)
+    event_bus.publish("image.uploaded", {"id": image_id})
+
+# Another generator process added or uploaded an image: cached responses are stale
+event_bus.subscribe("image.created", bump_data_version, remote_only=True)
+event_bus.subscribe("image.uploaded", bump_data_version, remote_only=True)
+for event_type in ("image.created", "image.uploaded"):
+    event_bus.subscribe(event_type, lambda event: read_replica.refresh(event["data"]["id"]), remote_only=True)
+# The social agent recorded a post: bring the replica's feedback up to date for /unposted
+event_bus.subscribe("image.posted", lambda event: read_replica.request_sync(), remote_only=True)
+
+# Background uploads to Supabase Storage, persisted so retries survive restarts
+UPLOAD_QUEUE_PATH = os.getenv("UPLOAD_QUEUE_PATH", "data/upload_queue.json")
+upload_queue = UploadQueue(supabase, image_store, path=UPLOAD_QUEUE_PATH, on_uploaded=on_image_uploaded)
+try:
+    queued = upload_queue.enqueue_missing()
+    if queued:
+        print(f"Queued {queued} images that were never uploaded to storage")
+except Exception as e:
+    print(f"Error checking for images missing from storage: {str(e)}")
+
+# Local SQLite copy of images, prompts and character_files: serves reads once
+# it has synced, and is the fallback while Supabase is unreachable
+READ_REPLICA = os.getenv("READ_REPLICA", "true").lower() == "true"
+REPLICA_PATH = os.getenv("REPLICA_PATH", "data/replica.sqlite3")
+REPLICA_SYNC_SECONDS = float(os.getenv("REPLICA_SYNC_SECONDS", "30"))
+read_replica = ReadReplica(supabase, path=REPLICA_PATH, sync_seconds=REPLICA_SYNC_SECONDS)
+
+def use_replica() -> bool:
+    """Serve reads from the replica instead of Supabase"""
+    return READ_REPLICA and read_replica.ready
+
+# Cost and stage timings of every generation, inserted in batches
+generation_ledger = GenerationLedger(supabase)
+
+# Finished generations waiting for confirmation that they are in the database
+OUTBOX_DIR = os.getenv("OUTBOX_DIR", "data/outbox")
+outbox = Outbox(OUTBOX_DIR)
+
+# Full-text search configuration ("postgres" uses the search_prompts function,
+# "local" always uses the in-process inverted index)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "postgres")
+SEARCH_SYNC_INTERVAL_SECONDS = 60
+search_index = InvertedIndex()
+last_search_sync = 0.0
+
+def sync_search_index():
+    """Bring the in-process search index up to date with the prompts table"""
+    global last_search_sync
+    if time.time() - last_search_sync < SEARCH_SYNC_INTERVAL_SECONDS:
+        return
+    last_search_sync = time.time()
+    try:
+        added = search_index.sync(supabase, character_id=MARVIN_ID)
+        if added:
+            print(f"Search index synced ({len(search_index)} prompts, {added} new)")
+    except Exception as e:
+        print(f"Error syncing search index: {str(e)}")
+
+# Build the fallback index in the background so startup isn't blocked on it
+Thread(target=sync_search_index, daemon=True).start()
+
 # DALL-E 3 configuration
 DALLE_SIZES = Literal["1024x1024", "1024x1792", "1792x1024"]
 DALLE_QUALITY = Literal["standard", "hd"]
@@ -144,7 +323,7 @@ class MarvinArt:
         self.character_data = self._load_character_data()
 
     def _load_character_data(self) -> Dict[str, Any]:
-        """Load character data from the database"""
+        """Load character data from the database, or the cached copy if it is unreachable"""
         try:
             response = supabase.table('character_files').select('*').eq('id', MARVIN_ID).execute()
             if not response.data:
@@ -155,7 +334,7 @@ class MarvinArt:
             return character_data
         except Exception as e:
             print(f"Error loading character data: {str(e)}")
-            return {}
+            return read_replica.row('character_files', MARVIN_ID) or {}
 
     def create_marvin(self) -> None:
         """Create Marvin's character data in the database"""
@@ -281,27 +460,49 @@ class MarvinArt:
         """
 
     def generate_art_prompt(self) -> str:
-        """Generate an art prompt using the character's style and preferences"""
+        """Generate an art prompt using the character's style and preferences.
+
+        Prompts that are too similar to one already in the prompts table are
+        regenerated, and rejected after PROMPT_MAX_ATTEMPTS tries, so that we
+        never pay for a DALL-E call on a repeat.
+        """
         try:
             system_prompt = self.get_character_prompt()
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": "Generate a new prompt for a visual artwork."}
+            ]
             
-            response = openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": "Generate a new prompt for a visual artwork."}
-                ],
-                temperature=0.8,
-                max_tokens=150
-            )
-            
-            prompt = response.choices[0].message.content.strip()
-            print("\nGenerated Art Prompt:")
-            print("-" * 50)
-            print(prompt)
-            print("-" * 50)
+            for attempt in range(1, PROMPT_MAX_ATTEMPTS + 1):
+                with generation_ledger.stage("prompt"):
+                    response = openai_client.chat.completions.create(
+                        model="gpt-4",
+                        messages=messages,
+                        temperature=0.8,
+                        max_tokens=150
+                    )
+                generation_ledger.add_usage(response.usage)
+                generation_ledger.note(prompt_model="gpt-4", prompt_attempts=attempt)
+                
+                prompt = response.choices[0].message.content.strip()
+                print("\nGenerated Art Prompt:")
+                print("-" * 50)
+                print(prompt)
+                print("-" * 50)
+                
+                similar_id, similarity = prompt_index.max_similarity(prompt)
+                if similarity < PROMPT_SIMILARITY_THRESHOLD:
+                    return prompt
+                
+                print(f"Prompt too similar to prompt {similar_id} ({similarity:.2f}), attempt {attempt}/{PROMPT_MAX_ATTEMPTS}")
+                messages.append({"role": "assistant", "content": prompt})
+                messages.append({
+                    "role": "user",
+                    "content": "That idea is too close to an artwork you have already made. "
+                               "Generate a prompt with a different subject, setting and mood."
+                })
             
-            return prompt
+            raise Exception(f"Could not generate a novel prompt after {PROMPT_MAX_ATTEMPTS} attempts")
             
         except Exception as e:
             print(f"Error generating art prompt: {str(e)}")
@@ -314,78 +515,77 @@ class MarvinArt:
         size: DALLE_SIZES = "1024x1024",
         quality: DALLE_QUALITY = "standard"
     ) -> Dict[str, Any]:
-        """Generate an image using the specified API and store in Supabase Storage"""
+        """Generate an image using the specified API and save it to the local image store"""
         try:
             if api == "dalle":
                 print(f"\nGenerating image with DALL-E 3 ({size}, {quality} quality)...")
-                response = openai_client.images.generate(
-                    model="dall-e-3",
-                    prompt=prompt,
-                    size=size,
-                    quality=quality,
-                    n=1
-                )
+                generation_ledger.note(image_model="dall-e-3", size=size, quality=quality)
+                with generation_ledger.stage("image"):
+                    response = openai_client.images.generate(
+                        model="dall-e-3",
+                        prompt=prompt,
+                        size=size,
+                        quality=quality,
+                        n=1
+                    )
                 
                 # Get the image URL from DALL-E
                 dalle_url = response.data[0].url
                 print(f"\nGenerated image URL: {dalle_url}")
                 
                 # Download the image
-                image_response = requests.get(dalle_url)
-                image = Image.open(BytesIO(image_response.content))
+                with generation_ledger.stage("download"):
+                    image_response = http_get(dalle_url, timeout=60)
+                    image_response.raise_for_status()
+                    image = Image.open(BytesIO(image_response.content))
+                
+                # Encode for storage in the configured format
+                encode_start = time.time()
+                with generation_ledger.stage("encode"):
+                    image_bytes = image_encoder.encode(image)
+                print(f"Encoded image as {image_encoder.format}: {len(image_response.content)} -> "
+                      f"{len(image_bytes)} bytes in {time.time() - encode_start:.2f}s")
                 
-                # Create a unique filename
+                # Save locally under a unique name; the upload to Supabase Storage
+                # happens in the background once the database rows exist
+                filename = image_store.new_filename(image_encoder.extension)
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"marvin_art_{timestamp}.png"
+                with generation_ledger.stage("store"):
+                    local_path = image_store.save(image_bytes, filename)
+                print(f"Image saved locally as: {local_path}")
                 
-                # Save locally as backup
-                image.save(filename)
-                print(f"Image saved locally as: {filename}")
+                settings = {
+                    "model": "dall-e-3",
+                    "size": size,
+                    "quality": quality,
+                    "encoding": image_encoder.describe()
+                }
+                original = {}
+                if STORAGE_KEEP_ORIGINAL:
+                    original_filename = f"{os.path.splitext(filename)[0]}_original.png"
+                    original["original_local_path"] = image_store.save(image_response.content, original_filename)
+                    original["original_storage_path"] = f"originals/{timestamp}/{original_filename}"
+                    settings["encoding"]["original_path"] = original["original_storage_path"]
                 
+                # BlurHash and dominant colour let the gallery paint a preview instantly
                 try:
-                    # Upload to Supabase Storage
-                    storage_path = f"images/{timestamp}/{filename}"
-                    
-                    # Convert image to bytes for upload
-                    img_byte_arr = BytesIO()
-                    image.save(img_byte_arr, format='PNG')
-                    img_byte_arr.seek(0)
-                    
-                    # Upload to storage bucket
-                    supabase.storage.from_("marvin-art-images").upload(
-                        path=storage_path,
-                        file=img_byte_arr.getvalue(),
-                        file_options={"content-type": "image/png"}
-                    )
-                    print(f"Image uploaded to Supabase Storage: {storage_path}")
-                    
-                    # Get permanent public URL
-                    permanent_url = supabase.storage.from_("marvin-art-images").get_public_url(storage_path)
-                    
-                    return {
-                        "image_url": permanent_url,  # Store permanent URL instead of temporary DALL-E URL
-                        "dalle_url": dalle_url,      # Keep original URL for reference
-                        "local_path": filename,
-                        "storage_path": storage_path,
-                        "settings": {
-                            "model": "dall-e-3",
-                            "size": size,
-                            "quality": quality
-                        }
-                    }
-                except Exception as storage_error:
-                    print(f"Error uploading to Supabase Storage: {str(storage_error)}")
-                    print("Falling back to original URL")
-                    # Fall back to original behavior if storage upload fails
-                    return {
-                        "image_url": dalle_url,
-                        "local_path": filename,
-                        "settings": {
-                            "model": "dall-e-3",
-                            "size": size,
-                            "quality": quality
-                        }
-                    }
+                    with generation_ledger.stage("preview"):
+                        preview = compute_preview(image)
+                except Exception as e:
+                    print(f"Error computing image preview: {str(e)}")
+                    preview = {}
+                
+                return {
+                    "image_url": dalle_url,  # Replaced with the permanent URL once uploaded
+                    "dalle_url": dalle_url,
+                    "local_path": local_path,
+                    "content_hash": hashlib.sha256(image_bytes).hexdigest(),
+                    "pending_storage_path": f"images/{timestamp}/{filename}",
+                    "content_type": image_encoder.content_type,
+                    **preview,
+                    **original,
+                    "settings": settings
+                }
             else:
                 raise ValueError(f"Unsupported API: {api}")
                 
@@ -394,78 +594,170 @@ class MarvinArt:
             raise
 
     def save_to_database(self, prompt: str, image_data: Dict[str, Any], generation_type: str = "auto") -> Dict[str, Any]:
-        """Save the generated prompt and image data to Supabase"""
+        """Save the generated prompt and image data to Supabase.
+
+        The generation is written to the local outbox first and only removed
+        once the database has confirmed it, so it can be replayed if the
+        write fails.
+        """
         try:
-            # First, save the prompt
-            prompt_data = {
-                "text": prompt,
-                "character_id": MARVIN_ID,
-                "created_at": datetime.utcnow().isoformat()
-            }
-            prompt_response = supabase.table('prompts').insert(prompt_data).execute()
-            
-            if not prompt_response.data:
-                raise Exception("Failed to save prompt to database")
-            
-            prompt_id = prompt_response.data[0]['id']
-            print(f"\nSaved prompt to database with ID: {prompt_id}")
-            
-            # Then, save the image data
-            image_record = {
-                "prompt_id": prompt_id,
-                "api_used": "dall-e-3",
-                "image_url": image_data["image_url"],
-                "local_path": image_data["local_path"],
-                "settings": image_data["settings"],
-                "generation_type": generation_type,  # Add generation type
+            entry = {
+                "prompt_id": str(uuid.uuid4()),
+                "image_id": str(uuid.uuid4()),
+                "prompt": prompt,
+                "image_data": image_data,
+                "generation_type": generation_type,
                 "created_at": datetime.utcnow().isoformat()
             }
-            
-            # Add storage path and dalle_url if available
-            if "storage_path" in image_data:
-                image_record["storage_path"] = image_data["storage_path"]
-            
-            if "dalle_url" in image_data:
-                image_record["dalle_url"] = image_data["dalle_url"]
-            
-            image_response = supabase.table('images').insert(image_record).execute()
-            
-            if not image_response.data:
-                raise Exception("Failed to save image data to database")
-            
-            image_id = image_response.data[0]['id']
-            print(f"Saved image data to database with ID: {image_id}")
-            
-            return {
-                "prompt_id": prompt_id,
-                "image_id": image_id
-            }
+            generation_ledger.note(image_id=entry["image_id"])
+            with generation_ledger.stage("database"):
+                outbox.add(entry["image_id"], entry)
+                return write_generation(entry)
         except Exception as e:
             print(f"Error saving to database: {str(e)}")
             raise
 
+def write_generation(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Write an outbox entry to the database in one transaction, then clear it from the outbox"""
+    image_data = entry["image_data"]
+    image_record = {
+        "api_used": "dall-e-3",
+        "image_url": image_data["image_url"],
+        "local_path": image_data["local_path"],
+        "settings": image_data["settings"],
+        "generation_type": entry["generation_type"],
+        "created_at": entry["created_at"]
+    }
+    
+    # Add storage path and dalle_url if available
+    if "storage_path" in image_data:
+        image_record["storage_path"] = image_data["storage_path"]
+    
+    if "dalle_url" in image_data:
+        image_record["dalle_url"] = image_data["dalle_url"]
+    
+    for field in ("content_hash", "blurhash", "dominant_color"):
+        if field in image_data:
+            image_record[field] = image_data[field]
+    
+    try:
+        response = supabase.rpc('save_generation', {
+            "prompt_id": entry["prompt_id"],
+            "prompt_text": entry["prompt"],
+            "prompt_character_id": MARVIN_ID,
+            "image_id": entry["image_id"],
+            "image": image_record
+        }).execute()
+        saved_prompt = response.data["prompt"]
+        saved_image = response.data["image"]
+    except Exception as e:
+        # save_generation not installed yet: fall back to two idempotent upserts
+        print(f"save_generation unavailable, saving rows separately: {str(e)}")
+        prompt_response = supabase.table('prompts').upsert({
+            "id": entry["prompt_id"],
+            "text": entry["prompt"],
+            "character_id": MARVIN_ID,
+            "created_at": entry["created_at"]
+        }, ignore_duplicates=True).execute()
+        image_response = supabase.table('images').upsert({
+            "id": entry["image_id"],
+            "prompt_id": entry["prompt_id"],
+            **image_record
+        }, ignore_duplicates=True).execute()
+        saved_prompt = (prompt_response.data or [{"id": entry["prompt_id"], "created_at": entry["created_at"]}])[0]
+        saved_image = (image_response.data or [{"id": entry["image_id"], **image_record}])[0]
+    
+    outbox.remove(entry["image_id"])
+    prompt_id = saved_prompt["id"]
+    image_id = saved_image["id"]
+    
+    # Readable from the replica straight away, before the next sync brings it in
+    read_replica.apply('prompts', [{
+        "text": entry["prompt"], "character_id": MARVIN_ID, "created_at": entry["created_at"], **saved_prompt
+    }])
+    read_replica.apply('images', [{"prompt_id": prompt_id, **image_record, **saved_image}])
+    print(f"\nSaved prompt {prompt_id} and image {image_id} to database")
+    
+    # Remember the prompt so future generations can avoid repeating it
+    try:
+        prompt_index.add(prompt_id, entry["prompt"], saved_prompt.get('created_at'))
+        prompt_index.save()
+    except Exception as e:
+        print(f"Error updating prompt index: {str(e)}")
+    
+    # Hand the image to the background uploader for Supabase Storage
+    if "pending_storage_path" in image_data:
+        upload_queue.enqueue(
+            image_id,
+            image_data["local_path"],
+            image_data["pending_storage_path"],
+            image_data.get("content_type", "image/png"),
+            dalle_url=image_data.get("dalle_url")
+        )
+    if "original_storage_path" in image_data:
+        upload_queue.enqueue(
+            image_id,
+            image_data["original_local_path"],
+            image_data["original_storage_path"],
+            dalle_url=image_data.get("dalle_url"),
+            original=True
+        )
+    
+    search_index.add(prompt_id, entry["prompt"], saved_prompt.get('created_at'), saved_image)
+    
+    # Lets the social agent queue the image without waiting for its next check
+    event_bus.publish("image.created", {
+        "id": image_id,
+        "prompt_id": prompt_id,
+        "created_at": saved_image.get("created_at", entry["created_at"]),
+        "generation_type": entry["generation_type"],
+        "settings": image_record["settings"],
+        "prompts": {"text": entry["prompt"][:2000]}  # NOTIFY payloads are capped at 8000 bytes
+    })
+    
+    return {
+        "prompt_id": prompt_id,
+        "image_id": image_id
+    }
+
+def replay_outbox():
+    """Retry database writes for generations left in the outbox"""
+    for entry in outbox.pending():
+        try:
+            write_generation(entry)
+            logger.info(f"Replayed generation {entry['image_id']} from outbox")
+        except Exception as e:
+            print(f"Error replaying outbox entry {entry.get('image_id')}: {str(e)}")
+
 # Initialize logger
 logger = DatabaseLogger(source="art_generator")
 
+# Log retention: days to keep per level, e.g. "default=7,WARNING=14,ERROR=30"
+LOG_RETENTION_DAYS = parse_retention_days(os.getenv("LOG_RETENTION_DAYS", "default=7,WARNING=14,ERROR=30"))
+LOG_RETENTION_BATCH_SIZE = int(os.getenv("LOG_RETENTION_BATCH_SIZE", "5000"))
+
 # Log cleanup function
-def cleanup_old_logs(days_to_keep=7):
-    """Remove logs older than the specified number of days"""
+def cleanup_old_logs():
+    """Remove logs past their level's retention period"""
     try:
-        cutoff_date = (datetime.now() - timedelta(days=days_to_keep)).isoformat()
-        
-        result = supabase.table('marvin_art_logs')\
-            .delete()\
-            .lt('created_at', cutoff_date)\
-            .execute()
-            
-        deleted_count = len(result.data) if result.data else 0
-        logger.info(f"Cleaned up {deleted_count} logs older than {days_to_keep} days")
+        retention = LogRetention(supabase, LOG_RETENTION_DAYS, batch_size=LOG_RETENTION_BATCH_SIZE)
+        report = retention.run()
+        logger.info(
+            f"Cleaned up {report['rows_deleted']} expired logs",
+            {"retention_days": LOG_RETENTION_DAYS, **report}
+        )
+        return report
     except Exception as e:
         print(f"Error cleaning up old logs: {str(e)}")
 
 # Initialize MarvinArt instance
 marvin = MarvinArt()
 
+# Write any generations that didn't reach the database before the last shutdown
+if len(outbox):
+    print(f"Replaying {len(outbox)} generations from the outbox")
+    replay_outbox()
+
 # Configuration
 MAX_IMAGES_PER_DAY = 4  # Increased from 2 to 4
 CHARACTER_ID = "marvin"  # ID of the character in the database
@@ -493,28 +785,74 @@ def get_generated_images_today(generation_type: str = "auto") -> int:
         print(f"Error getting generated images count: {str(e)}")
         return 0
 
+# feedback also records failed and rate-limited attempts (add_feedback_post_columns.sql);
+# before that migration every row is a post
+feedback_has_status = True
+
+def posted_feedback(columns: str, count: Optional[str] = None):
+    """Select on feedback rows that record a successful post"""
+    query = supabase.table('feedback').select(columns, count=count)
+    return query.eq('status', 'posted') if feedback_has_status else query
+
+def with_posted_feedback(read):
+    """Call read(), which queries through posted_feedback(), without the status filter if there is no such column"""
+    global feedback_has_status
+    try:
+        return read()
+    except Exception as e:
+        if not feedback_has_status or 'status' not in str(e):
+            raise
+        print("feedback has no status column yet, counting every row as posted")
+        feedback_has_status = False
+        return read()
+
+def posted_image_ids() -> set:
+    """Ids of images that have been posted somewhere"""
+    def read():
+        image_ids = set()
+        offset = 0
+        while True:
+            rows = posted_feedback('image_id').range(offset, offset + 999).execute().data or []
+            image_ids.update(row['image_id'] for row in rows)
+            offset += len(rows)
+            if len(rows) < 1000:
+                return image_ids
+    return with_posted_feedback(read)
+
 def get_unposted_images() -> List[Dict[str, Any]]:
     """Get images that haven't been posted yet"""
     try:
-        # Get all images that don't have entries in the feedback table
+        if use_replica():
+            return read_replica.unposted_images()
+        
+        # Failed and rate-limited attempts leave an image unposted
+        posted = posted_image_ids()
         response = supabase.table('images')\
             .select('*, prompts(*)')\
-            .not_('id', 'in', (
-                supabase.table('feedback')
-                .select('image_id')
-                .execute()
-            ))\
             .order('created_at', desc=True)\
             .execute()
         
-        return response.data
+        return [row for row in response.data if row['id'] not in posted]
     except Exception as e:
         print(f"Error getting unposted images: {str(e)}")
         return []
 
+def generation_paused() -> Optional[str]:
+    """Why generation is paused (Supabase or OpenAI circuit open), or None"""
+    for circuit in (supabase_circuit, openai_circuit):
+        if circuit.is_open():
+            return f"{circuit.name} is unavailable ({circuit.last_error})"
+    return None
+
 def auto_generate(generation_type: str = "auto"):
     """Automatically generate art based on schedule or manual trigger"""
     try:
+        # Skip rather than pay for a prompt or image that can't be saved
+        paused = generation_paused()
+        if paused:
+            print(f"Generation paused, skipping: {paused}")
+            return
+        
         # Only check limit and time window for automatic generation
         if generation_type == "auto":
             # Check if current time is within the allowed window (9am-9pm)
@@ -529,26 +867,29 @@ def auto_generate(generation_type: str = "auto"):
                 print(f"Daily automatic generation limit reached ({images_today}/{MAX_IMAGES_PER_DAY})")
                 return
         
-        # Initialize art generator
-        art_generator = MarvinArt()
-        
-        # Generate prompt
-        prompt = art_generator.generate_art_prompt()
-        print(f"Generated prompt: {prompt}")
-        
-        # Generate image
-        image_data = art_generator.generate_image(prompt)
-        if "error" in image_data:
-            print(f"Error generating image: {image_data['error']}")
-            return
-        
-        # Save to database with the specified generation type
-        result = art_generator.save_to_database(prompt, image_data, generation_type)
-        if "error" in result:
-            print(f"Error saving to database: {result['error']}")
-            return
-        
-        print(f"Successfully generated and saved art with ID: {result['image_id']}")
+        with generation_ledger.record(generation_type):
+            # Initialize art generator
+            art_generator = MarvinArt()
+            
+            # Generate prompt
+            prompt = art_generator.generate_art_prompt()
+            print(f"Generated prompt: {prompt}")
+            
+            # Generate image
+            image_data = art_generator.generate_image(prompt)
+            if "error" in image_data:
+                print(f"Error generating image: {image_data['error']}")
+                generation_ledger.note(status="failed", error=image_data['error'])
+                return
+            
+            # Save to database with the specified generation type
+            result = art_generator.save_to_database(prompt, image_data, generation_type)
+            if "error" in result:
+                print(f"Error saving to database: {result['error']}")
+                generation_ledger.note(status="failed", error=result['error'])
+                return
+            
+            print(f"Successfully generated and saved art with ID: {result['image_id']}")
         
     except Exception as e:
         print(f"Error in auto_generate: {str(e)}")
@@ -561,89 +902,273 @@ async def root():
     from fastapi.responses import RedirectResponse
     return RedirectResponse(url="/ui")
 
+def table_version(query) -> tuple:
+    """Row count and newest created_at for a query, used to build cheap ETags"""
+    response = query.order('created_at', desc=True).limit(1).execute()
+    newest = response.data[0]['created_at'] if response.data else None
+    return response.count, newest
+
 @app.get("/character")
-async def get_character():
+async def get_character(request: Request):
     """Get Marvin's character data"""
-    if not marvin.character_data:
+    replica_character = read_replica.row('character_files', MARVIN_ID) if READ_REPLICA else None
+    if use_replica():
+        character_data = replica_character or marvin.character_data
+    else:
+        character_data = marvin.character_data or replica_character
+    if not character_data:
         raise HTTPException(status_code=404, detail="Character data not found")
-    return marvin.character_data
+    etag = make_etag("character", character_data.get('id'), character_data.get('updated_at'))
+    if etag_matches(request, etag):
+        return not_modified(etag, max_age=60)
+    return json_response(request, character_data, etag=etag, max_age=60)
 
-@app.post("/generate", response_model=ImageGenerationResponse)
-async def generate_art(request: ArtRequest):
-    """Generate new art using Marvin's character (no daily limit)"""
+def degraded_response(response: Response) -> Response:
+    """Mark a response as answered from local copies while Supabase is unreachable"""
+    response.headers["X-Degraded"] = "true"
+    return response
+
+def check_generation_available():
+    """503 with Retry-After while generation is paused"""
+    paused = generation_paused()
+    if paused:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Generation is paused: {paused}",
+            headers={"Retry-After": str(int(CIRCUIT_RESET_SECONDS))}
+        )
+
+# Idempotency-Key support for the generation endpoints: a repeated key attaches
+# to the running generation or replays its result instead of paying for another
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "1000"))
+idempotency = IdempotencyStore(ttl_seconds=IDEMPOTENCY_TTL_SECONDS, max_entries=IDEMPOTENCY_MAX_ENTRIES)
+
+def idempotent(scope: str, idempotency_key: Optional[str], fingerprint: str, response: Response, work):
+    """Run work once per Idempotency-Key (or every time without one), marking replays"""
     try:
+        key = check_key(idempotency_key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if key is None:
+        return work()
+    try:
+        result, replayed = idempotency.run(scope, key, fingerprint, work)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+def run_generation(request: ArtRequest) -> ImageGenerationResponse:
+    """Prompt, image and database save for one manual generation"""
+    check_generation_available()
+    with generation_ledger.record("manual"):
         # Generate art prompt
         prompt = marvin.generate_art_prompt()
-        
+    
         # Generate image
         image_data = marvin.generate_image(
             prompt,
             size=request.size,
             quality=request.quality
         )
-        
+    
         # Save to database as manual generation
         result = marvin.save_to_database(prompt, image_data, generation_type="manual")
         if "error" in result:
             raise HTTPException(status_code=500, detail=f"Database save failed: {result['error']}")
-        
+    
+        # Served locally until the background upload completes
+        image_url = image_data["image_url"]
+        if "pending_storage_path" in image_data:
+            image_url = f"/proxy-image/{result['image_id']}/{image_data['content_hash'][:16]}"
+    
         return ImageGenerationResponse(
             prompt=prompt,
-            image_url=image_data["image_url"],
+            image_url=image_url,
             local_path=image_data["local_path"],
             settings=image_data["settings"],
             prompt_id=result["prompt_id"],
             image_id=result["image_id"]
         )
-        
+
+@app.post("/generate", response_model=ImageGenerationResponse)
+async def generate_art(request: ArtRequest, response: Response, idempotency_key: Optional[str] = Header(None)):
+    """Generate new art using Marvin's character (no daily limit)"""
+    try:
+        # Off the event loop, so other requests (and duplicates waiting on this one) are served meanwhile
+        return await run_in_threadpool(
+            idempotent, "generate", idempotency_key, request.model_dump_json(), response,
+            lambda: run_generation(request)
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def page_cursor(row: Dict[str, Any]) -> str:
+    """X-Next-Cursor for a page ending at row: its created_at and id"""
+    return f"{row['created_at']}|{row['id']}"
+
+def parse_cursor(before: str) -> Tuple[str, Optional[str]]:
+    """(created_at, id) from a cursor; older clients may send a bare created_at"""
+    created_at, _, image_id = before.partition('|')
+    return created_at, image_id or None
+
 @app.get("/images")
-async def get_images(limit: int = 10, offset: int = 0):
-    """Get recently generated images"""
+async def get_images(request: Request, limit: int = 10, offset: int = 0, before: Optional[str] = None):
+    """Get recently generated images, newest first.
+
+    Pass the X-Next-Cursor header of a page back as `before` to get the next
+    page; unlike offset paging this stays cheap and stable while new images
+    are being added. limit/offset still work for older clients.
+    """
+    limit = max(1, min(limit, 100))
+    if use_replica():
+        return images_from_replica(request, limit, offset, before)
     try:
-        response = supabase.table('images')\
+        # Revalidate with a tiny count query before loading the full payload
+        etag = make_etag(
+            "images", limit, offset, before,
+            *table_version(supabase.table('images').select('created_at', count='exact'))
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag, max_age=10)
+        
+        query = supabase.table('images')\
             .select('*, prompts(*)')\
-            .order('created_at', desc=True)\
-            .range(offset, offset + limit - 1)\
-            .execute()
+            .order('created_at.desc,id.desc')
+        if before:
+            # Past the cursor's (created_at, id), so images sharing its timestamp aren't skipped
+            created_at, before_id = parse_cursor(before)
+            if before_id:
+                query = after_keyset(query, 'created_at', created_at, before_id, descending=True)
+            else:
+                query = query.lt('created_at', created_at)
+            query = query.limit(limit)
+        else:
+            query = query.range(offset, offset + limit - 1)
+        response = query.execute()
         
-        return response.data
+        result = json_response(request, response.data, etag=etag, max_age=10)
+        if len(response.data) == limit:
+            result.headers["X-Next-Cursor"] = page_cursor(response.data[-1])
+        return result
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        # Read-only fallback: whatever the replica holds, even if it never finished syncing
+        if not READ_REPLICA or not read_replica.images(1):
+            raise HTTPException(status_code=500, detail=str(e))
+        print(f"Serving /images from the read replica: {str(e)}")
+        return images_from_replica(request, limit, offset, before)
+
+def images_from_replica(request: Request, limit: int, offset: int, before: Optional[str]):
+    """/images answered from the local replica, with no Supabase round trip"""
+    etag = make_etag("images-replica", limit, offset, before, read_replica.version)
+    if etag_matches(request, etag):
+        return not_modified(etag, max_age=10)
+    created_at, before_id = parse_cursor(before) if before else (None, None)
+    rows = read_replica.images(limit, offset, created_at, before_id)
+    result = json_response(request, rows, etag=etag, max_age=10)
+    if len(rows) == limit:
+        result.headers["X-Next-Cursor"] = page_cursor(rows[-1])
+    return degraded_response(result) if supabase_circuit.is_open() else result
+
+@app.get("/search")
+async def search_prompts(q: str, limit: int = 20, offset: int = 0):
+    """Full-text search over prompt text with ranked, highlighted results"""
+    limit = max(1, min(limit, 100))
+    offset = max(0, offset)
+    if not q.strip():
+        return {"query": q, "total": 0, "limit": limit, "offset": offset, "results": []}
+    
+    if SEARCH_BACKEND == "postgres":
+        try:
+            response = supabase.rpc('search_prompts', {
+                "search_query": q,
+                "result_limit": limit,
+                "result_offset": offset,
+                "filter_character_id": MARVIN_ID
+            }).execute()
+            rows = response.data or []
+            return {
+                "query": q,
+                "total": rows[0]["total_count"] if rows else 0,
+                "limit": limit,
+                "offset": offset,
+                "backend": "postgres",
+                "results": [{k: v for k, v in row.items() if k != "total_count"} for row in rows]
+            }
+        except Exception as e:
+            logger.warning(f"Postgres search failed, using local index: {str(e)}")
+    
+    # Local fallback: pick up any prompts saved by other processes first
+    sync_search_index()
+    result = search_index.search(q, limit=limit, offset=offset)
+    return {
+        "query": q,
+        "total": result["total"],
+        "limit": limit,
+        "offset": offset,
+        "backend": "local",
+        "results": result["results"]
+    }
 
 @app.get("/unposted")
-async def get_unposted():
+async def get_unposted(request: Request):
     """Get images that haven't been posted yet"""
     try:
+        if use_replica():
+            # The replica holds feedback too, so this needs no round trip at all
+            etag = make_etag("unposted-replica", read_replica.version)
+        else:
+            etag = make_etag(
+                "unposted",
+                *table_version(supabase.table('images').select('created_at', count='exact')),
+                *with_posted_feedback(lambda: table_version(posted_feedback('created_at', count='exact')))
+            )
+        if etag_matches(request, etag):
+            return not_modified(etag, max_age=10)
+        
         images = get_unposted_images()
-        return {
+        return json_response(request, {
             "status": "success",
             "count": len(images),
             "images": images
-        }
+        }, etag=etag, max_age=10)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def start_manual_generation() -> Dict[str, str]:
+    check_generation_available()
+    
+    # Log the generation request
+    logger.info("Manual art generation triggered")
+    
+    # Start the auto_generate in a separate thread with manual type
+    thread = Thread(target=lambda: auto_generate(generation_type="manual"))
+    thread.daemon = True
+    thread.start()
+    return {"status": "success", "message": "Art generation triggered"}
+
 @app.post("/trigger-generation")
-async def trigger_generation():
+async def trigger_generation(response: Response, idempotency_key: Optional[str] = Header(None)):
     """Manually trigger art generation (no daily limit)"""
     try:
-        # Log the generation request
-        logger.info("Manual art generation triggered")
-        
-        # Start the auto_generate in a separate thread with manual type
-        thread = Thread(target=lambda: auto_generate(generation_type="manual"))
-        thread.daemon = True
-        thread.start()
-        return {"status": "success", "message": "Art generation triggered"}
+        # A repeated key gets the first response back and starts nothing; off the
+        # event loop, since a duplicate arriving mid-request waits for the first
+        return await run_in_threadpool(
+            idempotent, "trigger-generation", idempotency_key, "", response, start_manual_generation
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error triggering generation: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/logs")
 async def get_logs(
+    request: Request,
     limit: int = 100, 
     offset: int = 0, 
     level: Optional[str] = None, 
@@ -652,110 +1177,279 @@ async def get_logs(
 ):
     """Get recent logs with optional filtering"""
     try:
-        # Log the logs request
-        logger.info("Logs requested", {"limit": limit, "offset": offset, "level": level, "days": days})
-        
-        query = supabase.table('marvin_art_logs')\
-            .select('*')
+        # Requests are deliberately not logged here: writing a row per request
+        # would change the result on every call and make it uncacheable
+        def filtered(query):
+            # Apply filters if provided
+            if level:
+                query = query.eq('level', level.upper())
+            if source:
+                query = query.eq('source', source)
+                
+            # Only get logs from the last X days
+            cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
+            return query.gte('created_at', cutoff_date)
         
-        # Apply filters if provided
-        if level:
-            query = query.eq('level', level.upper())
-        if source:
-            query = query.eq('source', source)
-            
-        # Only get logs from the last X days
-        cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
-        query = query.gte('created_at', cutoff_date)
+        etag = make_etag(
+            "logs", limit, offset, level, source, days,
+            *table_version(filtered(supabase.table('marvin_art_logs').select('created_at', count='exact')))
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag, max_age=5)
         
         # Order and paginate
-        query = query.order('created_at', desc=True)\
+        query = filtered(supabase.table('marvin_art_logs').select('*'))\
+            .order('created_at', desc=True)\
             .range(offset, offset + limit - 1)
             
         response = query.execute()
         
-        return response.data
+        return json_response(request, response.data, etag=etag, max_age=5)
     except Exception as e:
         logger.error(f"Error retrieving logs: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/proxy-image/{image_id}")
-async def proxy_image(image_id: str):
-    """Proxy images from Supabase Storage or other sources"""
+@app.get("/logs/stats")
+async def get_log_statistics(
+    days: int = 7,
+    bucket: str = "hour",
+    level: Optional[str] = None,
+    source: Optional[str] = None,
+    top: int = 10
+):
+    """Get aggregated log counts by level, source and time bucket"""
+    if bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of: {', '.join(BUCKETS)}")
+    try:
+        since = datetime.utcnow() - timedelta(days=days)
+        stats = get_log_stats(
+            supabase,
+            since,
+            bucket=bucket,
+            level=level.upper() if level else None,
+            source=source,
+            top=max(1, min(top, 50))
+        )
+        return {"days": days, "bucket": bucket, **stats}
+    except Exception as e:
+        logger.error(f"Error retrieving log stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/ledger/summary")
+async def get_ledger_summary(days: int = 7, bucket: str = "day"):
+    """Generation count, cost, token use and stage timings, overall and per time bucket"""
+    if bucket not in LEDGER_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of: {', '.join(LEDGER_BUCKETS)}")
+    try:
+        since = datetime.utcnow() - timedelta(days=days)
+        summary = generation_ledger.summary(since, bucket=bucket)
+        return {"days": days, "max_images_per_day": MAX_IMAGES_PER_DAY, **summary}
+    except Exception as e:
+        logger.error(f"Error retrieving ledger summary: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/health")
+async def health():
+    """Circuit breaker states, and whether the service is degraded or generation paused"""
+    paused = generation_paused()
+    return {
+        "status": "degraded" if supabase_circuit.is_open() else "ok",
+        "generation_paused": paused is not None,
+        "reason": paused,
+        "circuits": breaker_stats(),
+        "read_replica": read_replica.stats() if READ_REPLICA else None
+    }
+
+@app.get("/connections")
+async def get_connection_stats():
+    """Usage of the pooled HTTP connections to Supabase, OpenAI and image sources"""
+    return pool_stats()
+
+PLACEHOLDER_PATH = "static/placeholder.png"
+_placeholder_etag = None
+
+def parse_timestamp(value: Optional[str]) -> Optional[float]:
+    """Parse a Supabase ISO timestamp into a POSIX timestamp"""
+    if not value:
+        return None
+    try:
+        # fromisoformat on Python 3.8 wants exactly 6 fractional digits and no 'Z'
+        value = value.replace('Z', '+00:00')
+        main, _, rest = value.partition('.')
+        if rest:
+            digits = ''.join(c for c in rest if c.isdigit())
+            offset = rest[len(digits):]
+            value = f"{main}.{digits[:6].ljust(6, '0')}{offset}"
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+def serve_placeholder(request: Request):
+    """Serve the placeholder image; cached briefly since the real image may still appear"""
+    global _placeholder_etag
+    if not os.path.exists(PLACEHOLDER_PATH):
+        return None
+    if _placeholder_etag is None:
+        with open(PLACEHOLDER_PATH, "rb") as f:
+            _placeholder_etag = f'"{hashlib.sha256(f.read()).hexdigest()[:16]}"'
+    return binary_response(
+        request, "image/png", _placeholder_etag, "public, max-age=60", path=PLACEHOLDER_PATH
+    )
+
+def read_image_source(row: Dict[str, Any]) -> Optional[bytes]:
+    """Original image bytes from the local store, Supabase Storage or the DALL-E URL"""
+    local_path = image_store.resolve(row.get('local_path'))
+    if local_path:
+        with open(local_path, "rb") as f:
+            return f.read()
+    # Storage is part of Supabase, so skip it while its circuit is open
+    storage_url = None if supabase_circuit.is_open() else row.get('image_url')
+    for source_url in (storage_url, row.get('dalle_url')):
+        if not source_url:
+            continue
+        try:
+            response = http_get(source_url, timeout=10)
+            if response.status_code == 200:
+                return response.content
+        except Exception:
+            logger.warning(f"Failed to fetch image from URL: {source_url}")
+    return None
+
+def serve_image(request: Request, image_id: str, version: Optional[str] = None,
+                width: Optional[int] = None):
+    """Serve an image from Supabase Storage, the local store or its source URL.
+
+    When the URL carries the image's content hash (version), every response
+    is marked immutable; otherwise it is cached for an hour. Local and
+    fetched images get a strong ETag, Last-Modified and byte-range support.
+    With a width, a downscaled WebP thumbnail is served instead.
+    """
     try:
         # Log the image proxy request
         logger.info(f"Image proxy request for image ID: {image_id}")
         
-        # Get image data from database
-        image_data = supabase.table('images').select('image_url, storage_path, local_path, dalle_url').eq('id', image_id).execute()
-        if not image_data.data:
+        # Get image data from the replica, or the database if the replica doesn't have it
+        replica_row = read_replica.row('images', image_id) if READ_REPLICA else None
+        try:
+            if replica_row is not None and use_replica():
+                rows = [replica_row]
+            else:
+                rows = supabase.table('images').select('*').eq('id', image_id).execute().data
+        except Exception as e:
+            if replica_row is None:
+                raise
+            print(f"Serving image {image_id} from the read replica: {str(e)}")
+            rows = [replica_row]
+        if not rows:
             logger.error(f"Image not found: {image_id}")
             raise HTTPException(status_code=404, detail="Image not found")
         
-        # Try to serve from Supabase Storage first (preferred method)
-        if image_data.data[0].get('storage_path'):
-            try:
-                # Get the image from storage
-                storage_path = image_data.data[0].get('storage_path')
-                permanent_url = image_data.data[0].get('image_url')
-                
-                # Redirect to the permanent URL
-                from fastapi.responses import RedirectResponse
-                return RedirectResponse(url=permanent_url)
-            except Exception as e:
-                logger.error(f"Error accessing Supabase Storage: {str(e)}")
-                # Fall through to next option
+        row = rows[0]
+        content_hash = row.get('content_hash')
+        immutable = bool(version and content_hash and content_hash.startswith(version))
+        cache_control = IMMUTABLE_CACHE_CONTROL if immutable else "public, max-age=3600"
+        etag = f'"{content_hash[:16]}"' if content_hash else None
+        last_modified = parse_timestamp(row.get('created_at'))
+        
+        if width:
+            key = content_hash[:16] if content_hash else image_id
+            thumbnail_path = thumbnails.get(key, width, lambda: read_image_source(row))
+            if thumbnail_path:
+                return binary_response(
+                    request, "image/webp", f'"{key}-w{width}"', cache_control,
+                    path=thumbnail_path, last_modified=last_modified
+                )
         
-        # Try local file next
-        local_path = image_data.data[0].get('local_path')
-        if local_path and os.path.exists(local_path):
+        # Try to serve from Supabase Storage first (preferred method), unless it is down
+        permanent_url = row.get('image_url')
+        storage_down = supabase_circuit.is_open() and image_store.resolve(row.get('local_path'))
+        if row.get('storage_path') and not storage_down:
+            # Redirect to the permanent URL; the redirect itself is cacheable too
+            headers = {"Cache-Control": cache_control}
+            if etag:
+                headers["ETag"] = etag
+            return RedirectResponse(url=permanent_url, headers=headers)
+        
+        # Try local file next (the store's index avoids a stat per request)
+        local_path = image_store.resolve(row.get('local_path'))
+        if local_path:
             logger.info(f"Serving local image file: {local_path}")
-            return FileResponse(local_path, media_type="image/png")
+            media_type = mimetypes.guess_type(local_path)[0] or "image/png"
+            if etag is None:
+                with open(local_path, "rb") as f:
+                    etag = f'"{hashlib.sha256(f.read()).hexdigest()[:16]}"'
+            return binary_response(
+                request, media_type, etag, cache_control,
+                path=local_path, last_modified=last_modified
+            )
         
-        # Try the original DALL-E URL if available
-        dalle_url = image_data.data[0].get('dalle_url')
-        if dalle_url:
+        # Then the original DALL-E URL, then image_url if it isn't a storage URL
+        for source_url in (row.get('dalle_url'), None if row.get('storage_path') else permanent_url):
+            if not source_url:
+                continue
             try:
-                response = requests.get(dalle_url, timeout=5)
+                response = http_get(source_url, timeout=5)
                 if response.status_code == 200:
-                    return Response(
-                        content=response.content,
-                        media_type=response.headers.get('Content-Type', 'image/png')
+                    return binary_response(
+                        request,
+                        response.headers.get('Content-Type', 'image/png'),
+                        etag or f'"{hashlib.sha256(response.content).hexdigest()[:16]}"',
+                        cache_control,
+                        data=response.content,
+                        last_modified=last_modified
                     )
-            except:
-                logger.warning(f"Failed to fetch image from DALL-E URL: {dalle_url}")
+            except Exception:
+                logger.warning(f"Failed to fetch image from URL: {source_url}")
                 # Fall through to next option
         
-        # Last resort: try the image_url if it's different from the storage URL
-        image_url = image_data.data[0].get('image_url')
-        if image_url and (not image_data.data[0].get('storage_path') or image_url != permanent_url):
-            try:
-                response = requests.get(image_url, timeout=5)
-                if response.status_code == 200:
-                    return Response(
-                        content=response.content,
-                        media_type=response.headers.get('Content-Type', 'image/png')
-                    )
-            except:
-                logger.warning(f"Failed to fetch image from image_url: {image_url}")
-                # Fall through to placeholder
-        
         # If all else fails, return placeholder
-        placeholder_path = "static/placeholder.png"
-        if os.path.exists(placeholder_path):
+        placeholder = serve_placeholder(request)
+        if placeholder is not None:
             logger.warning(f"Serving placeholder image for image ID: {image_id}")
-            return FileResponse(placeholder_path, media_type="image/png")
+            return placeholder
         
         # If even placeholder doesn't exist, return error
         raise HTTPException(status_code=404, detail="Image not available")
     except Exception as e:
         logger.error(f"Error proxying image: {str(e)}")
         # Return a placeholder image instead of an error
-        placeholder_path = "static/placeholder.png"
-        if os.path.exists(placeholder_path):
-            return FileResponse(placeholder_path, media_type="image/png")
+        placeholder = serve_placeholder(request)
+        if placeholder is not None:
+            return placeholder
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/proxy-image/{image_id}")
+async def proxy_image(image_id: str, request: Request, w: Optional[int] = None):
+    """Proxy images from Supabase Storage or other sources; w asks for a smaller variant"""
+    # Lookups, file reads, fetches and thumbnail encoding all block, so keep them off the event loop
+    return await run_in_threadpool(serve_image, request, image_id, width=snap_width(w) if w else None)
+
+@app.get("/proxy-image/{image_id}/{version}")
+async def proxy_image_versioned(image_id: str, version: str, request: Request, w: Optional[int] = None):
+    """Serve an image under its immutable URL (image id plus content hash)"""
+    width = snap_width(w) if w else None
+    # The version is the content hash, so a matching validator needs no lookup at all
+    etag = f'"{version}-w{width}"' if width else f'"{version}"'
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL})
+    return await run_in_threadpool(serve_image, request, image_id, version=version, width=width)
+
+# Streams the gallery as an archive, downloading a few images ahead of the writer
+archive_exporter = ArchiveExporter(supabase, read_image_source)
+
+@app.get("/export")
+async def export_archive(format: str = "zip", since: Optional[str] = None, until: Optional[str] = None):
+    """Download all images (or those created in [since, until)) as a ZIP or tar with a JSONL manifest"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    logger.info(f"Starting {format} export", {"since": since, "until": until})
+    filename = f"marvin-art-export-{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    return StreamingResponse(
+        archive_exporter.stream(format, since, until, mtime=lambda row: parse_timestamp(row.get('created_at'))),
+        media_type="application/zip" if format == "zip" else "application/x-tar",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 # Schedule tasks
 # Schedule 4 generations between 9am and 9pm
 schedule.every().day.at("09:00").do(auto_generate)
@@ -763,6 +1457,7 @@ schedule.every().day.at("13:00").do(auto_generate)
 schedule.every().day.at("17:00").do(auto_generate)
 schedule.every().day.at("21:00").do(auto_generate)
 schedule.every().day.at("00:00").do(cleanup_old_logs)  # Run log cleanup daily at midnight
+schedule.every(15).minutes.do(replay_outbox)  # Retry generations that failed to save
 
 if __name__ == "__main__":
     # Start scheduler in a separate thread
@@ -774,5 +1469,11 @@ if __name__ == "__main__":
     scheduler_thread = Thread(target=run_scheduler)
     scheduler_thread.start()
     
+    # Start the background storage uploader, ledger writer and replica sync
+    upload_queue.start()
+    generation_ledger.start()
+    if READ_REPLICA:
+        read_replica.start()
+    
     # Start FastAPI server
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,55 @@
+import os
+import json
+import threading
+from typing import Any, Dict, List
+
+
+class Outbox:
+    """Local holding area for finished generations not yet confirmed in the database.
+
+    Each entry is written to its own JSON file before the database write is
+    attempted and deleted once the write is confirmed, so a crash or a
+    database outage never loses an image we have already paid for.
+    """
+
+    def __init__(self, directory: str = "data/outbox"):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, entry_id: str) -> str:
+        return os.path.join(self.directory, f"{entry_id}.json")
+
+    def add(self, entry_id: str, entry: Dict[str, Any]) -> None:
+        path = self._path(entry_id)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def remove(self, entry_id: str) -> None:
+        try:
+            os.remove(self._path(entry_id))
+        except FileNotFoundError:
+            pass
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """Entries still waiting to be written, oldest first"""
+        entries = []
+        with self._lock:
+            names = sorted(
+                (n for n in os.listdir(self.directory) if n.endswith(".json")),
+                key=lambda n: os.path.getmtime(os.path.join(self.directory, n))
+            )
+            for name in names:
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        entries.append(json.load(f))
+                except (OSError, ValueError) as e:
+                    print(f"Skipping unreadable outbox entry {name}: {str(e)}")
+        return entries
+
+    def __len__(self) -> int:
+        return sum(1 for n in os.listdir(self.directory) if n.endswith(".json"))
@@ -0,0 +1,184 @@
+import os
+import re
+import zlib
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Small stopword list so that filler words don't dominate the similarity score
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "into",
+    "is", "it", "its", "of", "on", "or", "that", "the", "this", "to", "with",
+    "while", "where", "which", "their", "there", "each", "his", "her"
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+class PromptIndex:
+    """Incrementally maintained similarity index over past art prompts.
+
+    Each prompt is turned into a hashed bag of word unigrams and bigrams,
+    weighted with sublinear term frequency and L2-normalised, and stored as
+    a row of a NumPy matrix. Checking a new prompt against every past prompt
+    is then a single matrix-vector product.
+    """
+
+    def __init__(self, path: Optional[str] = None, dim: int = 1024):
+        self.path = path
+        self.dim = dim
+        self.ids: List[str] = []
+        self._id_set = set()
+        self._matrix = np.zeros((64, dim), dtype=np.float32)
+        self._lock = threading.Lock()
+        self.last_created_at: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, prompt_id: str) -> bool:
+        return prompt_id in self._id_set
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """The populated part of the index matrix (one row per prompt)"""
+        return self._matrix[:len(self.ids)]
+
+    def vectorize(self, text: str) -> np.ndarray:
+        """Turn prompt text into a normalised hashed n-gram vector"""
+        tokens = [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if not features:
+            return vector
+
+        # crc32 is stable across processes, unlike hash(), so saved indexes stay valid
+        hashes = np.fromiter(
+            (zlib.crc32(f.encode("utf-8")) for f in features),
+            dtype=np.uint32,
+            count=len(features)
+        )
+        buckets = (hashes % self.dim).astype(np.intp)
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(vector, buckets, signs)
+
+        # Sublinear tf keeps repeated words from swamping the rest of the prompt
+        vector = np.sign(vector) * np.log1p(np.abs(vector))
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def add(self, prompt_id: str, text: str, created_at: Optional[str] = None) -> None:
+        """Add a prompt to the index, growing the matrix when needed"""
+        vector = self.vectorize(text)
+        with self._lock:
+            if prompt_id in self._id_set:
+                return
+            n = len(self.ids)
+            if n >= self._matrix.shape[0]:
+                grown = np.zeros((self._matrix.shape[0] * 2, self.dim), dtype=np.float32)
+                grown[:n] = self._matrix[:n]
+                self._matrix = grown
+            self._matrix[n] = vector
+            self.ids.append(prompt_id)
+            self._id_set.add(prompt_id)
+            self._advance_watermark(created_at)
+
+    def _advance_watermark(self, created_at: Optional[str]) -> None:
+        if created_at and (self.last_created_at is None or created_at > self.last_created_at):
+            self.last_created_at = created_at
+
+    def top_k(self, text: str, k: int = 5) -> List[Tuple[str, float]]:
+        """Return the k most similar past prompts as (prompt_id, cosine similarity)"""
+        with self._lock:
+            n = len(self.ids)
+            if n == 0:
+                return []
+            scores = self._matrix[:n] @ self.vectorize(text)
+            k = min(k, n)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self.ids[i], float(scores[i])) for i in top]
+
+    def max_similarity(self, text: str) -> Tuple[Optional[str], float]:
+        """Return the closest past prompt and its similarity score"""
+        matches = self.top_k(text, k=1)
+        if not matches:
+            return None, 0.0
+        return matches[0]
+
+    def save(self) -> None:
+        """Persist the index to disk"""
+        if not self.path:
+            return
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    matrix=self._matrix[:len(self.ids)],
+                    ids=np.array(self.ids, dtype=str),
+                    dim=np.array(self.dim),
+                    last_created_at=np.array(self.last_created_at or "")
+                )
+            os.replace(tmp_path, self.path)
+
+    def load(self) -> bool:
+        """Load a previously saved index. Returns False if there was nothing usable on disk."""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        with np.load(self.path, allow_pickle=False) as data:
+            if int(data["dim"]) != self.dim:
+                print(f"Prompt index on disk has dim {int(data['dim'])}, expected {self.dim}; rebuilding")
+                return False
+            matrix = data["matrix"].astype(np.float32, copy=False)
+            ids = [str(i) for i in data["ids"]]
+            last_created_at = str(data["last_created_at"]) or None
+
+        with self._lock:
+            capacity = max(64, 1 << max(len(ids) - 1, 0).bit_length())
+            self._matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+            self._matrix[:len(ids)] = matrix
+            self.ids = ids
+            self._id_set = set(ids)
+            self.last_created_at = last_created_at
+        return True
+
+    def sync(self, supabase, character_id: Optional[str] = None, page_size: int = 1000) -> int:
+        """Add prompts created since the last sync from the prompts table"""
+        added = 0
+        # gte plus a skip count, so prompts sharing a timestamp across a page
+        # boundary aren't lost; the ones at the starting mark are read again
+        # and skipped as already indexed
+        mark, at_mark = self.last_created_at, 0
+        while True:
+            query = supabase.table('prompts').select('id, text, created_at')
+            if character_id:
+                query = query.eq('character_id', character_id)
+            if mark:
+                query = query.gte('created_at', mark)
+            response = query.order('created_at,id').range(at_mark, at_mark + page_size - 1).execute()
+
+            rows = response.data or []
+            for row in rows:
+                if row.get('created_at') == mark:
+                    at_mark += 1
+                else:
+                    mark, at_mark = row.get('created_at'), 1
+                if row['id'] in self:
+                    continue
+                if row.get('text'):
+                    self.add(row['id'], row['text'], row.get('created_at'))
+                    added += 1
+                else:
+                    with self._lock:
+                        self._advance_watermark(row.get('created_at'))
+            if len(rows) < page_size:
+                break
+        return added
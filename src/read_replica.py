@@ -0,0 +1,351 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import orjson
+
+from service_clients import after_keyset
+
+PAGE_SIZE = 1000
+
+# Mirrored tables and the columns kept outside the JSON row for querying
+TABLES = {
+    "images": ("created_at", "prompt_id"),
+    "prompts": ("created_at",),
+    "character_files": ("created_at",),
+    "feedback": ("created_at", "image_id", "status"),
+}
+
+# Column each table is synced by; feedback rows are written once and never updated
+WATERMARK_COLUMNS = {"feedback": "created_at"}
+
+# Watermark columns that move when a row changes. These are paged on an
+# (updated_at, id) keyset, since a row updated after being read jumps past the
+# mark and a skip count would then skip a different row. Append-only created_at
+# is paged with gte plus a count of rows already read at the mark.
+KEYSET_COLUMNS = ("updated_at",)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (id TEXT PRIMARY KEY, created_at TEXT, prompt_id TEXT, data BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS images_newest ON images (created_at DESC, id DESC);
+CREATE TABLE IF NOT EXISTS prompts (id TEXT PRIMARY KEY, created_at TEXT, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS character_files (id TEXT PRIMARY KEY, created_at TEXT, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS feedback (id TEXT PRIMARY KEY, created_at TEXT, image_id TEXT, status TEXT, data BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS feedback_image_id ON feedback (image_id);
+CREATE TABLE IF NOT EXISTS sync_state (
+    table_name TEXT PRIMARY KEY,
+    watermark_column TEXT NOT NULL,
+    watermark TEXT,
+    at_mark INTEGER NOT NULL DEFAULT 0,
+    synced_at REAL,
+    last_id TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+
+class ReadReplica:
+    """SQLite copy of images, prompts, character_files and feedback, so reads don't go to Supabase.
+
+    A background thread pulls rows changed since each table's watermark
+    (updated_at, or created_at until add_replica_watermarks.sql has been
+    run) every `sync_seconds`, and sooner when refresh() is asked for
+    particular images, e.g. on an image.created or image.uploaded event.
+    Rows this process writes are applied with apply() straight away, so
+    they can be read back immediately. Rows deleted upstream are removed
+    when the local row count runs ahead of the remote one.
+
+    `version` changes with every applied change and survives restarts,
+    so it can go into ETags in place of a remote count query.
+    """
+
+    def __init__(self, supabase, path: str = "data/replica.sqlite3", sync_seconds: float = 30.0):
+        self.supabase = supabase
+        self.path = path
+        self.sync_seconds = sync_seconds
+        self.last_error: Optional[str] = None
+        self.last_sync_seconds: Optional[float] = None
+        self._refresh_ids: Set[str] = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(sync_state)")]
+            if "last_id" not in columns:
+                self._conn.execute("ALTER TABLE sync_state ADD COLUMN last_id TEXT")
+        self._checked_updated_at: Set[str] = set()
+
+    # Writes
+
+    def _upsert(self, table: str, rows: Iterable[Dict[str, Any]], merge: bool = False) -> int:
+        """Write rows inside the caller's transaction; merge keeps columns the rows don't have"""
+        columns = TABLES[table]
+        written = 0
+        for row in rows:
+            if merge:
+                existing = self._conn.execute(f"SELECT data FROM {table} WHERE id = ?", (row["id"],)).fetchone()
+                if existing:
+                    row = {**orjson.loads(existing[0]), **row}
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {table} (id, {', '.join(columns)}, data) "
+                f"VALUES (?, {', '.join('?' for _ in columns)}, ?)",
+                (row["id"], *(row.get(c) for c in columns), orjson.dumps(row))
+            )
+            written += 1
+        if written:
+            self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        return written
+
+    def apply(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        """Apply rows this process just wrote, merged into any copy already held (read-your-writes)"""
+        try:
+            with self._lock, self._conn:
+                self._upsert(table, rows, merge=True)
+        except Exception as e:
+            print(f"Error applying rows to the read replica: {str(e)}")
+
+    def request_sync(self) -> None:
+        """Have the sync thread run now instead of at its next interval"""
+        self._wakeup.set()
+
+    def refresh(self, image_id: str) -> None:
+        """Have the sync thread re-read one image (and its prompt) soon"""
+        with self._lock:
+            self._refresh_ids.add(image_id)
+        self._wakeup.set()
+
+    # Sync
+
+    def _state(self, table: str) -> Dict[str, Any]:
+        row = self._conn.execute(
+            "SELECT watermark_column, watermark, at_mark, synced_at, last_id FROM sync_state WHERE table_name = ?",
+            (table,)
+        ).fetchone()
+        if row is None:
+            return {"column": WATERMARK_COLUMNS.get(table, "updated_at"), "watermark": None,
+                    "at_mark": 0, "synced_at": None, "last_id": None}
+        return {"column": row[0], "watermark": row[1], "at_mark": row[2], "synced_at": row[3], "last_id": row[4]}
+
+    def _has_updated_at(self, table: str) -> bool:
+        try:
+            self.supabase.table(table).select('updated_at').limit(1).execute()
+            return True
+        except Exception as e:
+            if "updated_at" in str(e):
+                return False
+            raise
+
+    def _sync_table(self, table: str) -> int:
+        with self._lock:
+            state = self._state(table)
+        preferred = WATERMARK_COLUMNS.get(table, "updated_at")
+        if state["column"] != preferred and table not in self._checked_updated_at:
+            # Followed by created_at so far: once per process, see whether
+            # add_replica_watermarks.sql has been run since, and only then
+            # start over on updated_at
+            if self._has_updated_at(table):
+                print(f"{table} now has an updated_at column, resyncing it by updated_at")
+                state.update(column=preferred, watermark=None, at_mark=0, last_id=None)
+            self._checked_updated_at.add(table)
+        applied = 0
+        while True:
+            column = state["column"]
+            keyset = column in KEYSET_COLUMNS
+            # Ordered by id too, so rows sharing a timestamp come in a stable order
+            query = self.supabase.table(table).select('*').order(f'{column},id')
+            if keyset and state["watermark"] and state["last_id"]:
+                query = after_keyset(query, column, state["watermark"], state["last_id"])
+            elif state["watermark"]:
+                # Also where an older replica left an updated_at mark without an id:
+                # the rows at the mark are read once more
+                query = query.gte(column, state["watermark"])
+            start = 0 if keyset else state["at_mark"]
+            try:
+                rows = query.range(start, start + PAGE_SIZE - 1).execute().data or []
+            except Exception as e:
+                if column == "updated_at" and "updated_at" in str(e):
+                    # Table has no updated_at yet: follow inserts by created_at instead
+                    print(f"{table} has no updated_at column, syncing it by created_at")
+                    state.update(column="created_at", watermark=None, at_mark=0, last_id=None)
+                    self._checked_updated_at.add(table)
+                    continue
+                raise
+            if len(rows) < PAGE_SIZE:
+                state["synced_at"] = time.time()
+            for row in rows:
+                value = row.get(column)
+                if value is None:
+                    continue
+                if keyset:
+                    state["watermark"], state["last_id"] = value, row["id"]
+                elif value == state["watermark"]:
+                    state["at_mark"] += 1
+                else:
+                    state["watermark"] = value
+                    state["at_mark"] = 1
+            with self._lock, self._conn:
+                applied += self._upsert(table, rows)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sync_state "
+                    "(table_name, watermark_column, watermark, at_mark, synced_at, last_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (table, column, state["watermark"], state["at_mark"], state["synced_at"], state["last_id"])
+                )
+            if len(rows) < PAGE_SIZE:
+                return applied
+
+    def _remove_deleted(self, table: str) -> int:
+        """Drop rows deleted upstream; only pages through ids when the counts disagree"""
+        remote = self.supabase.table(table).select('id', count='exact').limit(1).execute().count
+        with self._lock:
+            local = self._conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+        if remote is None or local <= remote:
+            return 0
+        remote_ids = set()
+        while True:
+            page = self.supabase.table(table).select('id').order('id')\
+                .range(len(remote_ids), len(remote_ids) + PAGE_SIZE - 1).execute().data or []
+            remote_ids.update(row['id'] for row in page)
+            if len(page) < PAGE_SIZE:
+                break
+        with self._lock, self._conn:
+            local_ids = [row[0] for row in self._conn.execute(f"SELECT id FROM {table}")]
+            deleted = [(i,) for i in local_ids if i not in remote_ids]
+            self._conn.executemany(f"DELETE FROM {table} WHERE id = ?", deleted)
+            if deleted:
+                self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        return len(deleted)
+
+    def _refresh_images(self) -> int:
+        with self._lock:
+            ids, self._refresh_ids = list(self._refresh_ids), set()
+        if not ids:
+            return 0
+        try:
+            rows = self.supabase.table('images').select('*, prompts(*)').in_('id', ids).execute().data or []
+        except Exception:
+            with self._lock:
+                self._refresh_ids.update(ids)
+            raise
+        prompts = [row.pop('prompts') for row in rows if row.get('prompts')]
+        with self._lock, self._conn:
+            self._upsert('prompts', prompts)
+            return self._upsert('images', rows)
+
+    def sync(self) -> Dict[str, int]:
+        """Pull changes for every table; returns rows applied per table"""
+        started = time.monotonic()
+        applied = {"refreshed": self._refresh_images()}
+        for table in TABLES:
+            applied[table] = self._sync_table(table)
+            self._remove_deleted(table)
+        self.last_sync_seconds = round(time.monotonic() - started, 3)
+        return applied
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                applied = self.sync()
+                self.last_error = None
+                if any(applied.values()):
+                    print(f"Read replica synced: {applied}")
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error syncing read replica: {str(e)}")
+            self._wakeup.wait(self.sync_seconds)
+            self._wakeup.clear()
+
+    # Reads
+
+    @property
+    def ready(self) -> bool:
+        """True once every table has been copied in full at least once"""
+        with self._lock:
+            synced = self._conn.execute(
+                "SELECT count(*) FROM sync_state WHERE synced_at IS NOT NULL"
+            ).fetchone()[0]
+        return synced == len(TABLES)
+
+    @property
+    def version(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def row(self, table: str, row_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            found = self._conn.execute(f"SELECT data FROM {table} WHERE id = ?", (row_id,)).fetchone()
+        return orjson.loads(found[0]) if found else None
+
+    def _images_with_prompts(self, where: str = "", params: tuple = (), limit: int = -1,
+                             offset: int = 0) -> List[Dict[str, Any]]:
+        with self._lock:
+            found = self._conn.execute(
+                "SELECT i.data, p.data FROM images i LEFT JOIN prompts p ON p.id = i.prompt_id "
+                f"{where} ORDER BY i.created_at DESC, i.id DESC LIMIT ? OFFSET ?",
+                (*params, limit, offset)
+            ).fetchall()
+        rows = []
+        for image, prompt in found:
+            row = orjson.loads(image)
+            row["prompts"] = orjson.loads(prompt) if prompt else None
+            rows.append(row)
+        return rows
+
+    def images(self, limit: int, offset: int = 0, before: Optional[str] = None,
+               before_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Images with their prompts, newest first, paged like /images.
+
+        before/before_id is the (created_at, id) of the last row of the
+        previous page, so images sharing its timestamp aren't skipped.
+        """
+        if before and before_id:
+            return self._images_with_prompts(
+                "WHERE i.created_at < ? OR (i.created_at = ? AND i.id < ?)", (before, before, before_id), limit
+            )
+        if before:
+            return self._images_with_prompts("WHERE i.created_at < ?", (before,), limit)
+        return self._images_with_prompts(limit=limit, offset=offset)
+
+    def unposted_images(self) -> List[Dict[str, Any]]:
+        """Images with no successful post, with their prompts, newest first.
+
+        Failed and rate-limited attempts don't count; feedback rows from
+        before add_feedback_post_columns.sql have no status and are posts.
+        """
+        return self._images_with_prompts(
+            "WHERE NOT EXISTS (SELECT 1 FROM feedback f "
+            "WHERE f.image_id = i.id AND coalesce(f.status, 'posted') = 'posted')"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tables = {}
+            for table in TABLES:
+                state = self._state(table)
+                tables[table] = {
+                    "rows": self._conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0],
+                    "watermark_column": state["column"],
+                    "watermark": state["watermark"],
+                    "seconds_since_sync": round(time.time() - state["synced_at"], 1) if state["synced_at"] else None
+                }
+        return {
+            "ready": self.ready,
+            "version": self.version,
+            "last_sync_seconds": self.last_sync_seconds,
+            "last_error": self.last_error,
+            "tables": tables
+        }
@@ -0,0 +1,191 @@
+import math
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from prompt_index import STOPWORDS, TOKEN_PATTERN
+
+
+def _stem(token: str) -> str:
+    """Very light stemming so that 'forests' matches 'forest'"""
+    if token.endswith("'s"):
+        token = token[:-2]
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(t) for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class InvertedIndex:
+    """In-process BM25 full-text index over prompt text.
+
+    Used by /search when the Postgres search function isn't available
+    (local development, offline use, or before the migration is applied).
+    Postings are kept as Python lists for cheap appends and converted to
+    NumPy arrays on demand, so scoring a query is a handful of vectorized
+    scatter-adds rather than a loop over every matching document.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.docs: List[Dict[str, Any]] = []
+        self.doc_ids: Dict[str, int] = {}
+        self.doc_lengths: List[int] = []
+        self.postings: Dict[str, List[List[int]]] = {}
+        self._arrays: Dict[str, tuple] = {}
+        self._lengths_array: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self.last_created_at: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, prompt_id: str, text: str, created_at: Optional[str] = None,
+            image: Optional[Dict[str, Any]] = None) -> None:
+        """Add a prompt (and the image generated from it, if known) to the index"""
+        tokens = tokenize(text)
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+
+        with self._lock:
+            if prompt_id in self.doc_ids:
+                return
+            doc_index = len(self.docs)
+            self.doc_ids[prompt_id] = doc_index
+            self.docs.append({
+                "prompt_id": prompt_id,
+                "text": text,
+                "created_at": created_at,
+                "image": image
+            })
+            self.doc_lengths.append(len(tokens))
+            for token, count in counts.items():
+                postings = self.postings.setdefault(token, [[], []])
+                postings[0].append(doc_index)
+                postings[1].append(count)
+                self._arrays.pop(token, None)
+            self._lengths_array = None
+            if created_at and (self.last_created_at is None or created_at > self.last_created_at):
+                self.last_created_at = created_at
+
+    def _postings_array(self, token: str):
+        arrays = self._arrays.get(token)
+        if arrays is None:
+            docs, counts = self.postings[token]
+            arrays = (np.array(docs, dtype=np.int64), np.array(counts, dtype=np.float32))
+            self._arrays[token] = arrays
+        return arrays
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """Return BM25-ranked matches for the query with highlighted snippets"""
+        terms = [t for t in dict.fromkeys(tokenize(query)) if t in self.postings]
+
+        with self._lock:
+            n = len(self.docs)
+            if not terms or n == 0:
+                return {"total": 0, "results": []}
+
+            if self._lengths_array is None:
+                self._lengths_array = np.array(self.doc_lengths, dtype=np.float32)
+            lengths = self._lengths_array
+            avg_length = float(lengths.mean()) or 1.0
+
+            scores = np.zeros(n, dtype=np.float32)
+            for term in terms:
+                docs, tf = self._postings_array(term)
+                idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                norm = self.K1 * (1 - self.B + self.B * lengths[docs] / avg_length)
+                np.add.at(scores, docs, idf * tf * (self.K1 + 1) / (tf + norm))
+
+            matches = np.flatnonzero(scores)
+            total = len(matches)
+            end = min(offset + limit, total)
+            if offset >= end:
+                return {"total": total, "results": []}
+
+            # Only fully sort the slice of matches we actually need for this page
+            if end < total:
+                top = matches[np.argpartition(-scores[matches], end - 1)[:end]]
+            else:
+                top = matches
+            top = top[np.argsort(-scores[top], kind="stable")][offset:end]
+            page = [(self.docs[i], float(scores[i])) for i in top]
+
+        results = []
+        for doc, score in page:
+            image = doc.get("image") or {}
+            results.append({
+                "prompt_id": doc["prompt_id"],
+                "image_id": image.get("id"),
+                "text": doc["text"],
+                "snippet": highlight(doc["text"], terms),
+                "rank": score,
+                "created_at": doc["created_at"],
+                "image_created_at": image.get("created_at"),
+                "settings": image.get("settings")
+            })
+        return {"total": total, "results": results}
+
+    def sync(self, supabase, character_id: Optional[str] = None, page_size: int = 1000) -> int:
+        """Add prompts created since the last sync from the prompts table"""
+        added = 0
+        # Same gte plus skip count scheme as PromptIndex.sync, so prompts tied
+        # at a page boundary aren't lost
+        mark, at_mark = self.last_created_at, 0
+        while True:
+            query = supabase.table('prompts').select('id, text, created_at, images(id, created_at, settings)')
+            if character_id:
+                query = query.eq('character_id', character_id)
+            if mark:
+                query = query.gte('created_at', mark)
+            response = query.order('created_at,id').range(at_mark, at_mark + page_size - 1).execute()
+
+            rows = response.data or []
+            for row in rows:
+                if row.get('created_at') == mark:
+                    at_mark += 1
+                else:
+                    mark, at_mark = row.get('created_at'), 1
+                if row['id'] in self.doc_ids:
+                    continue
+                images = row.get('images') or []
+                image = max(images, key=lambda i: i.get('created_at') or '') if images else None
+                self.add(row['id'], row.get('text') or '', row.get('created_at'), image)
+                added += 1
+            if len(rows) < page_size:
+                break
+        return added
+
+
+def highlight(text: str, terms: List[str], max_words: int = 25) -> str:
+    """Build a short snippet around the first match, wrapping matched words in <mark>"""
+    words = text.split()
+    term_set = set(terms)
+    matched = [
+        i for i, word in enumerate(words)
+        if any(_stem(t) in term_set for t in TOKEN_PATTERN.findall(word.lower()))
+    ]
+    if not matched:
+        return " ".join(words[:max_words]) + (" ..." if len(words) > max_words else "")
+
+    start = max(0, matched[0] - max_words // 3)
+    end = min(len(words), start + max_words)
+    matched_set = set(matched)
+    snippet = " ".join(
+        f"<mark>{words[i]}</mark>" if i in matched_set else words[i]
+        for i in range(start, end)
+    )
+    if start > 0:
+        snippet = "... " + snippet
+    if end < len(words):
+        snippet += " ..."
+    return snippet
@@ -10,9 +10,62 @@ document.addEventListener('DOMContentLoaded', function() {
     const logLevelFilter = document.getElementById('log-level-filter');
     const logDaysFilter = document.getElementById('log-days-filter');
     const logsContainer = document.getElementById('logs-container');
+    const logStatsContainer = document.getElementById('log-stats');
+    const searchForm = document.getElementById('search-form');
+    const searchInput = document.getElementById('search-input');
+    const searchClearBtn = document.getElementById('search-clear');
+    const searchMoreBtn = document.getElementById('search-more-btn');
+    const searchPageSize = 20;
+    let searchQuery = '';
+    let searchOffset = 0;
+    
+    // Gallery paging: each /images page returns the cursor for the next one
+    const galleryPageSize = 24;
+    const gallerySentinel = document.getElementById('gallery-sentinel');
+    const galleryIds = new Set();
+    let galleryCursor = null;
+    let galleryDone = false;
+    let galleryLoading = false;
+    let galleryGeneration = 0;
+    
+    // Fetch the next page as the sentinel below the grid comes within a screen of view
+    const sentinelObserver = new IntersectionObserver(entries => {
+        if (entries[0].isIntersecting && !searchQuery) {
+            loadMoreImages();
+        }
+    }, { rootMargin: '800px 0px' });
+    
+    // Cards far outside the viewport drop their image so thousands of cards don't
+    // keep thousands of decoded bitmaps alive; they get it back as they scroll in
+    const cardObserver = new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            const img = entry.target.querySelector('img');
+            if (entry.isIntersecting) {
+                if (!img.getAttribute('src')) {
+                    img.srcset = img.dataset.srcset;
+                    img.src = img.dataset.src;
+                }
+            } else if (img.getAttribute('src')) {
+                img.removeAttribute('srcset');
+                img.removeAttribute('src');
+            }
+        });
+    }, { rootMargin: '2000px 0px' });
     
     // Load images on page load
     loadImages();
+    sentinelObserver.observe(gallerySentinel);
+    
+    // Idempotency-Key for the current generate request; kept after a failure so
+    // retrying can't start a second generation if the first one did get through
+    let generationKey = null;
+    
+    function newIdempotencyKey() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+    }
     
     // Generate new art
     generateBtn.addEventListener('click', function() {
@@ -23,13 +76,16 @@ document.addEventListener('DOMContentLoaded', function() {
         // Add loading animation to button
         generateBtn.innerHTML = '<span class="spinner"></span> Generating...';
         
+        generationKey = generationKey || newIdempotencyKey();
         fetch('/trigger-generation', {
-            method: 'POST'
+            method: 'POST',
+            headers: {'Idempotency-Key': generationKey}
         })
         .then(response => {
             if (!response.ok) {
                 throw new Error('Network response was not ok');
             }
+            generationKey = null;
             return response.json();
         })
         .then(data => {
@@ -57,8 +113,8 @@ document.addEventListener('DOMContentLoaded', function() {
                         const currentFirstImageId = currentFirstImage ? currentFirstImage.dataset.id : null;
                         
                         if (!currentFirstImageId || data[0].id !== currentFirstImageId) {
-                            // New image found, reload the gallery
-                            loadImages();
+                            // New image found, add it to the top of the gallery
+                            loadNewImages();
                             generateBtn.innerHTML = 'Generate New Art';
                             generateBtn.disabled = false;
                             statusDiv.textContent = 'New artwork generated successfully!';
@@ -88,22 +144,44 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
     
-    // Load images from API
+    // Start the gallery over from the newest image
     function loadImages() {
+        // Responses for the previous gallery are dropped when they arrive
+        galleryGeneration++;
+        cardObserver.disconnect();
+        imagesContainer.innerHTML = '';
+        galleryIds.clear();
+        galleryCursor = null;
+        galleryDone = false;
+        galleryLoading = false;
+        loadMoreImages();
+    }
+    
+    // Append the next page of images below the ones already shown
+    function loadMoreImages() {
+        if (galleryLoading || galleryDone) return;
+        galleryLoading = true;
+        const generation = galleryGeneration;
         statusDiv.textContent = 'Loading images...';
         statusDiv.className = 'status loading';
         
-        fetch('/images?limit=20')
+        const cursor = galleryCursor ? `&before=${encodeURIComponent(galleryCursor)}` : '';
+        fetch(`/images?limit=${galleryPageSize}${cursor}`)
         .then(response => {
             if (!response.ok) {
                 throw new Error('Network response was not ok');
             }
-            return response.json();
+            const cursor = response.headers.get('X-Next-Cursor');
+            return response.json().then(data => ({ data, cursor }));
         })
-        .then(data => {
-            imagesContainer.innerHTML = '';
+        .then(({ data, cursor }) => {
+            // The gallery may have been reset or replaced by a search meanwhile
+            if (generation !== galleryGeneration || searchQuery) return;
+            galleryLoading = false;
+            galleryCursor = cursor;
+            galleryDone = !cursor;
             
-            if (data.length === 0) {
+            if (data.length === 0 && galleryIds.size === 0) {
                 // Show empty state
                 imagesContainer.innerHTML = `
                     <div class="empty-state">
@@ -116,78 +194,296 @@ document.addEventListener('DOMContentLoaded', function() {
                 return;
             }
             
-            // Create a document fragment for better performance
-            const fragment = document.createDocumentFragment();
+            imagesContainer.appendChild(buildCards(data));
             
-            data.forEach(image => {
-                const card = document.createElement('div');
-                card.className = 'image-card';
-                card.dataset.id = image.id; // Store the image ID for comparison
-                
-                // Create image wrapper for hover effects
-                const imgWrapper = document.createElement('div');
-                imgWrapper.className = 'image-wrapper';
-                
-                const img = document.createElement('img');
-                img.src = `/proxy-image/${image.id}`;
-                img.alt = 'Generated art';
+            statusDiv.textContent = `Loaded ${galleryIds.size} images`;
+            statusDiv.className = 'status success';
+            
+            // The sentinel may still be in view if the page was short; keep filling
+            if (!galleryDone) {
+                sentinelObserver.unobserve(gallerySentinel);
+                sentinelObserver.observe(gallerySentinel);
+            }
+        })
+        .catch(error => {
+            if (generation !== galleryGeneration) return;
+            galleryLoading = false;
+            galleryDone = true;
+            console.error('Error loading images:', error);
+            statusDiv.textContent = 'Error loading images: ' + error.message;
+            statusDiv.className = 'status error';
+            
+            // Show error state
+            if (galleryIds.size === 0) {
+                imagesContainer.innerHTML = `
+                    <div class="empty-state">
+                        <p>Failed to load images. Please try again.</p>
+                        <button class="btn primary" onclick="location.reload()">Reload Page</button>
+                    </div>
+                `;
+            }
+        });
+    }
+    
+    // Insert images newer than the top of the gallery without touching the rest
+    function loadNewImages() {
+        fetch('/images?limit=10')
+        .then(response => response.json())
+        .then(data => {
+            if (searchQuery) return;
+            const emptyState = imagesContainer.querySelector('.empty-state');
+            if (emptyState) emptyState.remove();
+            imagesContainer.prepend(buildCards(data));
+        })
+        .catch(error => {
+            console.error('Error loading new images:', error);
+        });
+    }
+    
+    // Cards for images not yet in the gallery, faded in on the next frame
+    function buildCards(images) {
+        const fragment = document.createDocumentFragment();
+        const cards = [];
+        images.forEach(image => {
+            if (galleryIds.has(image.id)) return;
+            galleryIds.add(image.id);
+            const card = createImageCard(image);
+            cards.push(card);
+            fragment.appendChild(card);
+        });
+        requestAnimationFrame(() => {
+            cards.forEach(card => card.classList.add('visible'));
+        });
+        return fragment;
+    }
+    
+    // Versioned image URLs (id plus content hash) are cached by the browser forever
+    function imageUrl(image) {
+        return image.content_hash
+            ? `/proxy-image/${image.id}/${image.content_hash.substring(0, 16)}`
+            : `/proxy-image/${image.id}`;
+    }
+    
+    // Decode a BlurHash into a small data URL used as the card background
+    // until the real image arrives (see src/image_preview.py for the encoder)
+    const BASE83_CHARS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~';
+    const previewCanvas = document.createElement('canvas');
+    previewCanvas.width = 32;
+    previewCanvas.height = 32;
+    
+    function blurhashPreview(hash) {
+        const decode83 = str => [...str].reduce((value, c) => value * 83 + BASE83_CHARS.indexOf(c), 0);
+        const toLinear = v => { v /= 255; return v <= 0.04045 ? v / 12.92 : Math.pow((v + 0.055) / 1.055, 2.4); };
+        const toSrgb = v => {
+            v = Math.max(0, Math.min(1, v));
+            return Math.round(v <= 0.0031308 ? v * 12.92 * 255 : (1.055 * Math.pow(v, 1 / 2.4) - 0.055) * 255);
+        };
+        const signPow = v => Math.sign(v) * v * v;
+        
+        const sizeFlag = decode83(hash[0]);
+        const numX = (sizeFlag % 9) + 1;
+        const numY = Math.floor(sizeFlag / 9) + 1;
+        if (hash.length !== 4 + 2 * numX * numY) return null;
+        const maxValue = (decode83(hash[1]) + 1) / 166;
+        
+        const colors = [];
+        const dc = decode83(hash.substring(2, 6));
+        colors.push([toLinear(dc >> 16), toLinear((dc >> 8) & 255), toLinear(dc & 255)]);
+        for (let i = 1; i < numX * numY; i++) {
+            const ac = decode83(hash.substring(4 + i * 2, 6 + i * 2));
+            colors.push([
+                signPow((Math.floor(ac / 361) - 9) / 9) * maxValue,
+                signPow((Math.floor(ac / 19) % 19 - 9) / 9) * maxValue,
+                signPow((ac % 19 - 9) / 9) * maxValue
+            ]);
+        }
+        
+        const size = previewCanvas.width;
+        const context = previewCanvas.getContext('2d');
+        const pixels = context.createImageData(size, size);
+        for (let y = 0; y < size; y++) {
+            for (let x = 0; x < size; x++) {
+                let r = 0, g = 0, b = 0;
+                for (let j = 0; j < numY; j++) {
+                    for (let i = 0; i < numX; i++) {
+                        const basis = Math.cos(Math.PI * x * i / size) * Math.cos(Math.PI * y * j / size);
+                        const color = colors[i + j * numX];
+                        r += color[0] * basis;
+                        g += color[1] * basis;
+                        b += color[2] * basis;
+                    }
+                }
+                const offset = 4 * (x + y * size);
+                pixels.data[offset] = toSrgb(r);
+                pixels.data[offset + 1] = toSrgb(g);
+                pixels.data[offset + 2] = toSrgb(b);
+                pixels.data[offset + 3] = 255;
+            }
+        }
+        context.putImageData(pixels, 0, 0);
+        return previewCanvas.toDataURL();
+    }
+    
+    // Build a gallery card for an image; snippetHtml replaces the prompt preview when set
+    function createImageCard(image, snippetHtml) {
+        const card = document.createElement('div');
+        card.className = 'image-card';
+        card.dataset.id = image.id; // Store the image ID for comparison
+        
+        // Create image wrapper for hover effects
+        const imgWrapper = document.createElement('div');
+        imgWrapper.className = 'image-wrapper';
+        
+        // Paint the stored preview right away; the real image fades in over it
+        if (image.dominant_color) {
+            imgWrapper.style.backgroundColor = image.dominant_color;
+        }
+        if (image.blurhash) {
+            const preview = blurhashPreview(image.blurhash);
+            if (preview) {
+                imgWrapper.style.backgroundImage = `url(${preview})`;
+            }
+        }
+        
+        // Cards are ~300px wide, so the browser picks the 256/512 variant by pixel density
+        const url = imageUrl(image);
+        const img = document.createElement('img');
+        img.dataset.src = `${url}?w=512`;
+        img.dataset.srcset = `${url}?w=256 256w, ${url}?w=512 512w, ${url}?w=1024 1024w`;
+        img.sizes = '(max-width: 600px) 100vw, 320px';
+        img.srcset = img.dataset.srcset;
+        img.src = img.dataset.src;
+        img.loading = 'lazy';
+        img.decoding = 'async';
+        img.alt = 'Generated art';
+        
+        // Add loading state and fade-in effect
+        img.className = 'loading';
+        img.onload = function() {
+            this.classList.remove('loading');
+            this.classList.add('loaded');
+        };
+        
+        const prompt = document.createElement('p');
+        prompt.className = 'prompt';
+        if (snippetHtml) {
+            prompt.innerHTML = snippetHtml;
+        } else {
+            prompt.textContent = image.prompts.text.substring(0, 100) + (image.prompts.text.length > 100 ? '...' : '');
+        }
+        
+        const date = document.createElement('p');
+        date.className = 'date';
+        date.textContent = formatDate(new Date(image.created_at));
+        
+        imgWrapper.appendChild(img);
+        card.appendChild(imgWrapper);
+        card.appendChild(prompt);
+        card.appendChild(date);
+        
+        card.addEventListener('click', function() {
+            openModal(image);
+        });
+        
+        cardObserver.observe(card);
+        return card;
+    }
+    
+    // Escape search snippets, keeping only the <mark> highlight tags
+    function renderSnippet(snippet) {
+        const escaped = document.createElement('div');
+        escaped.textContent = snippet;
+        return escaped.innerHTML
+            .replace(/&lt;mark&gt;/g, '<mark>')
+            .replace(/&lt;\/mark&gt;/g, '</mark>');
+    }
+    
+    // Search prompts; append adds the next page to the current results
+    function searchImages(append) {
+        if (!append) {
+            searchOffset = 0;
+            galleryGeneration++;
+            cardObserver.disconnect();
+            imagesContainer.innerHTML = '<div class="loading-spinner"></div>';
+        }
+        statusDiv.textContent = 'Searching...';
+        statusDiv.className = 'status loading';
+        searchMoreBtn.disabled = true;
+        
+        fetch(`/search?q=${encodeURIComponent(searchQuery)}&limit=${searchPageSize}&offset=${searchOffset}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Network response was not ok');
+            }
+            return response.json();
+        })
+        .then(data => {
+            if (!append) {
+                imagesContainer.innerHTML = '';
+            }
+            
+            if (data.total === 0) {
+                imagesContainer.innerHTML = '<p class="empty-message">No artworks match your search.</p>';
+                statusDiv.textContent = 'No results';
+                statusDiv.className = 'status';
+                searchMoreBtn.hidden = true;
+                return;
+            }
+            
+            const fragment = document.createDocumentFragment();
+            data.results.forEach(result => {
+                // Prompts whose image was never saved have nothing to show
+                if (!result.image_id) return;
                 
-                // Add loading state and fade-in effect
-                img.className = 'loading';
-                img.onload = function() {
-                    this.classList.remove('loading');
-                    this.classList.add('loaded');
+                const image = {
+                    id: result.image_id,
+                    created_at: result.image_created_at || result.created_at,
+                    settings: result.settings,
+                    prompts: { text: result.text }
                 };
-                
-                const prompt = document.createElement('p');
-                prompt.className = 'prompt';
-                prompt.textContent = image.prompts.text.substring(0, 100) + (image.prompts.text.length > 100 ? '...' : '');
-                
-                const date = document.createElement('p');
-                date.className = 'date';
-                date.textContent = formatDate(new Date(image.created_at));
-                
-                imgWrapper.appendChild(img);
-                card.appendChild(imgWrapper);
-                card.appendChild(prompt);
-                card.appendChild(date);
-                
-                card.addEventListener('click', function() {
-                    openModal(image);
-                });
-                
+                const card = createImageCard(image, renderSnippet(result.snippet));
+                card.classList.add('visible');
                 fragment.appendChild(card);
             });
-            
             imagesContainer.appendChild(fragment);
             
-            statusDiv.textContent = `Loaded ${data.length} images`;
+            searchOffset += data.results.length;
+            searchMoreBtn.hidden = searchOffset >= data.total;
+            searchMoreBtn.disabled = false;
+            statusDiv.textContent = `Showing ${searchOffset} of ${data.total} results for "${searchQuery}"`;
             statusDiv.className = 'status success';
-            
-            // Add fade-in animation to cards
-            setTimeout(() => {
-                document.querySelectorAll('.image-card').forEach((card, index) => {
-                    setTimeout(() => {
-                        card.classList.add('visible');
-                    }, index * 50);
-                });
-            }, 100);
         })
         .catch(error => {
-            console.error('Error loading images:', error);
-            statusDiv.textContent = 'Error loading images: ' + error.message;
+            console.error('Error searching images:', error);
+            statusDiv.textContent = 'Error searching images: ' + error.message;
             statusDiv.className = 'status error';
-            
-            // Show error state
-            imagesContainer.innerHTML = `
-                <div class="empty-state">
-                    <p>Failed to load images. Please try again.</p>
-                    <button class="btn primary" onclick="location.reload()">Reload Page</button>
-                </div>
-            `;
+            searchMoreBtn.disabled = false;
         });
     }
     
+    searchForm.addEventListener('submit', function(event) {
+        event.preventDefault();
+        searchQuery = searchInput.value.trim();
+        if (!searchQuery) {
+            searchClearBtn.click();
+            return;
+        }
+        searchClearBtn.hidden = false;
+        searchImages(false);
+    });
+    
+    searchMoreBtn.addEventListener('click', function() {
+        searchImages(true);
+    });
+    
+    searchClearBtn.addEventListener('click', function() {
+        searchQuery = '';
+        searchInput.value = '';
+        searchClearBtn.hidden = true;
+        searchMoreBtn.hidden = true;
+        loadImages();
+    });
+    
     // Format date in a more readable way
     function formatDate(date) {
         const now = new Date();
@@ -219,7 +515,7 @@ document.addEventListener('DOMContentLoaded', function() {
         modal.style.display = 'block';
         
         // Set image source (will load in background)
-        modalImg.src = `/proxy-image/${image.id}`;
+        modalImg.src = imageUrl(image);
         
         // When image loads, remove loading state
         modalImg.onload = function() {
@@ -258,7 +554,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 ${formattedSettings}
             </div>
             <div class="detail-actions">
-                <a href="/proxy-image/${image.id}" target="_blank" class="btn secondary">Open Image in New Tab</a>
+                <a href="${imageUrl(image)}" target="_blank" class="btn secondary">Open Image in New Tab</a>
             </div>
         `;
     }
@@ -278,6 +574,8 @@ document.addEventListener('DOMContentLoaded', function() {
     function loadLogs() {
         if (!logsContainer) return;
         
+        loadLogStats();
+        
         const level = logLevelFilter ? logLevelFilter.value : '';
         const days = logDaysFilter ? logDaysFilter.value : '7';
         
@@ -345,6 +643,81 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    // Load aggregated log statistics and draw the trend chart
+    function loadLogStats() {
+        if (!logStatsContainer) return;
+        
+        const level = logLevelFilter ? logLevelFilter.value : '';
+        const days = logDaysFilter ? parseInt(logDaysFilter.value, 10) : 7;
+        const bucket = days > 3 ? 'day' : 'hour';
+        
+        fetch(`/logs/stats?days=${days}&bucket=${bucket}${level ? '&level=' + level : ''}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Network response was not ok');
+            }
+            return response.json();
+        })
+        .then(stats => {
+            logStatsContainer.innerHTML = '';
+            
+            // Totals per level
+            const summary = document.createElement('div');
+            summary.className = 'log-stats-summary';
+            ['INFO', 'WARNING', 'ERROR'].forEach(lvl => {
+                const badge = document.createElement('span');
+                badge.className = `log-stats-badge log-level-${lvl.toLowerCase()}`;
+                badge.textContent = `${lvl}: ${stats.by_level[lvl] || 0}`;
+                summary.appendChild(badge);
+            });
+            logStatsContainer.appendChild(summary);
+            
+            // One stacked bar per time bucket, summed across sources
+            const totals = {};
+            stats.buckets.forEach(entry => {
+                const key = entry.bucket;
+                totals[key] = totals[key] || { INFO: 0, WARNING: 0, ERROR: 0 };
+                totals[key][entry.level] = (totals[key][entry.level] || 0) + entry.count;
+            });
+            const keys = Object.keys(totals).sort();
+            const max = Math.max(1, ...keys.map(key => Object.values(totals[key]).reduce((a, b) => a + b, 0)));
+            
+            const chart = document.createElement('div');
+            chart.className = 'log-stats-chart';
+            keys.forEach(key => {
+                const bar = document.createElement('div');
+                bar.className = 'log-stats-bar';
+                bar.title = `${new Date(key).toLocaleString()}: ` +
+                    Object.entries(totals[key]).map(([lvl, count]) => `${lvl} ${count}`).join(', ');
+                ['ERROR', 'WARNING', 'INFO'].forEach(lvl => {
+                    if (!totals[key][lvl]) return;
+                    const segment = document.createElement('div');
+                    segment.className = `log-stats-segment log-stats-${lvl.toLowerCase()}`;
+                    segment.style.height = `${(totals[key][lvl] / max) * 100}%`;
+                    bar.appendChild(segment);
+                });
+                chart.appendChild(bar);
+            });
+            logStatsContainer.appendChild(chart);
+            
+            // Most frequent messages
+            if (stats.top_messages.length > 0) {
+                const list = document.createElement('ul');
+                list.className = 'log-stats-top';
+                stats.top_messages.slice(0, 5).forEach(entry => {
+                    const item = document.createElement('li');
+                    item.textContent = `${entry.count} × [${entry.level}] ${entry.message}`;
+                    list.appendChild(item);
+                });
+                logStatsContainer.appendChild(list);
+            }
+        })
+        .catch(error => {
+            console.error('Error loading log stats:', error);
+            logStatsContainer.innerHTML = '';
+        });
+    }
+    
     // Add event listeners for log controls
     if (refreshLogsBtn) {
         refreshLogsBtn.addEventListener('click', loadLogs);
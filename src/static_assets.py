@@ -0,0 +1,117 @@
+import os
+import gzip
+import hashlib
+import mimetypes
+from typing import Dict, Optional, Set
+
+import brotli
+from fastapi import Request
+from fastapi.responses import Response
+
+from http_cache import IMMUTABLE_CACHE_CONTROL, accepted_encodings, binary_response
+
+COMPRESSIBLE_EXTENSIONS = {".html", ".css", ".js", ".json", ".svg", ".txt"}
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+class StaticAssets:
+    """Build-free asset step for the web UI, run once at startup.
+
+    Every file in the static directory is copied into the build directory
+    under a content-fingerprinted name (script.js -> script.1a2b3c4d5e.js),
+    with .gz and .br siblings for text assets. index.html is rewritten to
+    reference the fingerprinted names. Fingerprinted files are served with
+    immutable caching; index.html and the original names are revalidated.
+    """
+
+    def __init__(self, source_dir: str = "static", build_dir: str = "data/static"):
+        self.source_dir = source_dir
+        self.build_dir = build_dir
+        self.manifest: Dict[str, str] = {}      # original name -> fingerprinted name
+        self.fingerprinted: Dict[str, str] = {}  # fingerprinted name -> original name
+        self.hashes: Dict[str, str] = {}         # built name -> content hash
+        self.variants: Set[str] = set()          # precompressed files written to the build dir
+
+    def build(self) -> Dict[str, str]:
+        os.makedirs(self.build_dir, exist_ok=True)
+        names = sorted(
+            n for n in os.listdir(self.source_dir)
+            if os.path.isfile(os.path.join(self.source_dir, n))
+        )
+
+        for name in names:
+            if name == "index.html":
+                continue
+            with open(os.path.join(self.source_dir, name), "rb") as f:
+                content = f.read()
+            digest = hashlib.sha256(content).hexdigest()
+            stem, ext = os.path.splitext(name)
+            built_name = f"{stem}.{digest[:10]}{ext}"
+            self.manifest[name] = built_name
+            self.fingerprinted[built_name] = name
+            self.hashes[built_name] = digest[:16]
+            self.hashes[name] = digest[:16]
+            self._write(built_name, content)
+
+        index_path = os.path.join(self.source_dir, "index.html")
+        if os.path.exists(index_path):
+            with open(index_path, encoding="utf-8") as f:
+                html = f.read()
+            for name, built_name in self.manifest.items():
+                html = html.replace(f"/static/{name}", f"/static/{built_name}")
+            content = html.encode("utf-8")
+            self.hashes["index.html"] = hashlib.sha256(content).hexdigest()[:16]
+            self._write("index.html", content)
+
+        return self.manifest
+
+    def _write(self, name: str, content: bytes) -> None:
+        path = os.path.join(self.build_dir, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        if os.path.splitext(name)[1] not in COMPRESSIBLE_EXTENSIONS:
+            return
+        for suffix, compressed in ((".gz", gzip.compress(content, compresslevel=9)),
+                                   (".br", brotli.compress(content, quality=11))):
+            if len(compressed) < len(content):
+                with open(path + suffix, "wb") as f:
+                    f.write(compressed)
+                self.variants.add(path + suffix)
+            elif os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    def _variant(self, request: Request, name: str):
+        """Pick the best precompressed variant the client accepts"""
+        path = os.path.join(self.build_dir, name)
+        accepted = accepted_encodings(request)
+        for encoding in ("br", "gzip"):
+            candidate = path + ENCODING_SUFFIXES[encoding]
+            if encoding in accepted and candidate in self.variants:
+                return candidate, encoding
+        return path, None
+
+    def _serve(self, request: Request, name: str, cache_control: str) -> Response:
+        path, encoding = self._variant(request, name)
+        media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        # Each encoding is a different representation, so it gets its own strong ETag
+        etag = f'"{self.hashes[name]}{"-" + encoding if encoding else ""}"'
+        response = binary_response(request, media_type, etag, cache_control, path=path)
+        response.headers["Vary"] = "Accept-Encoding"
+        if encoding and response.status_code != 304:
+            response.headers["Content-Encoding"] = encoding
+        return response
+
+    def url(self, name: str) -> str:
+        return f"/static/{self.manifest.get(name, name)}"
+
+    def serve(self, request: Request, name: str) -> Optional[Response]:
+        """Serve a static file by fingerprinted or original name; None if unknown"""
+        if name in self.fingerprinted:
+            return self._serve(request, name, IMMUTABLE_CACHE_CONTROL)
+        if name in self.manifest:
+            # Unversioned names can change between deploys, so always revalidate
+            return self._serve(request, self.manifest[name], "no-cache")
+        return None
+
+    def serve_index(self, request: Request) -> Response:
+        return self._serve(request, "index.html", "no-cache")
@@ -0,0 +1,63 @@
+import os
+import threading
+from io import BytesIO
+from typing import Callable, Optional, Sequence
+
+from PIL import Image
+
+# Widths offered to the gallery's srcset; anything else is snapped to one of these
+THUMBNAIL_WIDTHS = (256, 512, 1024)
+
+
+def snap_width(width: int, widths: Sequence[int] = THUMBNAIL_WIDTHS) -> int:
+    """Smallest offered width that is at least as wide as requested"""
+    for candidate in widths:
+        if candidate >= width:
+            return candidate
+    return widths[-1]
+
+
+class ThumbnailCache:
+    """Downscaled WebP copies of generated images for the gallery.
+
+    Thumbnails are generated on first request from whatever source the
+    caller can provide and kept on disk under the image's version key, so
+    each size is encoded once. Names already on disk are held in memory to
+    avoid a stat per request.
+    """
+
+    def __init__(self, directory: str = "data/thumbnails", quality: int = 80):
+        self.directory = directory
+        self.quality = quality
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.names = {n for n in os.listdir(directory) if n.endswith(".webp")}
+
+    def _name(self, key: str, width: int) -> str:
+        return f"{key}_w{width}.webp"
+
+    def get(self, key: str, width: int, load_source: Callable[[], Optional[bytes]]) -> Optional[str]:
+        """Path of the thumbnail for key at width, creating it from load_source() if needed"""
+        name = self._name(key, width)
+        path = os.path.join(self.directory, name)
+        if name in self.names:
+            return path
+
+        data = load_source()
+        if not data:
+            return None
+        with Image.open(BytesIO(data)) as image:
+            image = image.convert("RGB")
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS)
+            buffer = BytesIO()
+            image.save(buffer, format="WEBP", quality=self.quality, method=4)
+
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.names.add(name)
+        return path
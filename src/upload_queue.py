@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import mimetypes
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from service_clients import http_get
+
+
+STORAGE_BUCKET = "marvin-art-images"
+
+
+class UploadQueue:
+    """Persistent queue of images waiting to be uploaded to Supabase Storage.
+
+    Generation saves the image locally and enqueues it here instead of
+    uploading on the request path. A background worker uploads each image,
+    then points the images row at the permanent URL. Failed uploads are
+    retried with exponential backoff, and pending jobs survive restarts
+    because the queue is written to disk on every change.
+    """
+
+    def __init__(self, supabase, image_store, path: str = "data/upload_queue.json",
+                 max_backoff_seconds: int = 3600, poll_seconds: float = 5.0,
+                 on_uploaded: Optional[Callable[[str], None]] = None):
+        self.supabase = supabase
+        self.image_store = image_store
+        self.path = path
+        self.max_backoff_seconds = max_backoff_seconds
+        self.poll_seconds = poll_seconds
+        self.on_uploaded = on_uploaded
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path) as f:
+                self.jobs = {job.get("job_id", job["image_id"]): job for job in json.load(f)}
+            if self.jobs:
+                print(f"Loaded {len(self.jobs)} pending uploads")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Error loading upload queue: {str(e)}")
+
+    def _save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(list(self.jobs.values()), f)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self.jobs)
+
+    def enqueue(self, image_id: str, local_path: str, storage_path: str,
+                content_type: str = "image/png", dalle_url: Optional[str] = None,
+                original: bool = False) -> None:
+        """Queue an image for upload; it is picked up by the worker straight away.
+
+        original marks an untouched copy kept next to the stored image; it is
+        uploaded the same way but doesn't change the images row.
+        """
+        job_id = f"{image_id}:original" if original else image_id
+        with self._lock:
+            self.jobs[job_id] = {
+                "job_id": job_id,
+                "image_id": image_id,
+                "original": original,
+                "local_path": local_path,
+                "storage_path": storage_path,
+                "content_type": content_type,
+                "dalle_url": dalle_url,
+                "attempts": 0,
+                "next_attempt": 0,
+                "last_error": None
+            }
+            self._save()
+        self._wakeup.set()
+
+    def pending(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(job) for job in self.jobs.values()]
+
+    def start(self) -> None:
+        """Start the background upload worker"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            with self._lock:
+                due = [dict(job) for job in self.jobs.values() if job["next_attempt"] <= now]
+            for job in due:
+                self.process(job)
+            self._wakeup.wait(self.poll_seconds)
+
+    def _read_image(self, job: Dict[str, Any]) -> bytes:
+        local_path = self.image_store.resolve(job["local_path"])
+        if local_path:
+            with open(local_path, "rb") as f:
+                return f.read()
+        # The local copy is gone; the DALL-E URL may still be valid for a few hours
+        if job.get("dalle_url"):
+            response = http_get(job["dalle_url"], timeout=30)
+            response.raise_for_status()
+            return response.content
+        raise FileNotFoundError(f"No local copy or source URL for image {job['image_id']}")
+
+    def process(self, job: Dict[str, Any]) -> bool:
+        """Upload one image and update its row; reschedules the job on failure"""
+        try:
+            data = self._read_image(job)
+            bucket = self.supabase.storage.from_(STORAGE_BUCKET)
+            # upsert so a retry after a partial failure doesn't trip over the existing object;
+            # stored images never change, so let browsers and CDNs cache them for a year
+            bucket.upload(
+                path=job["storage_path"],
+                file=data,
+                file_options={
+                    "content-type": job["content_type"],
+                    "cache-control": "31536000",
+                    "upsert": "true"
+                }
+            )
+            if not job.get("original"):
+                permanent_url = bucket.get_public_url(job["storage_path"])
+                self.supabase.table('images').update({
+                    "storage_path": job["storage_path"],
+                    "image_url": permanent_url
+                }).eq('id', job["image_id"]).execute()
+
+            self.image_store.mark_uploaded(job["local_path"])
+            with self._lock:
+                self.jobs.pop(job.get("job_id", job["image_id"]), None)
+                self._save()
+            print(f"Image {job['image_id']} uploaded to Supabase Storage: {job['storage_path']}")
+            if self.on_uploaded and not job.get("original"):
+                self.on_uploaded(job["image_id"])
+            return True
+        except Exception as e:
+            with self._lock:
+                current = self.jobs.get(job.get("job_id", job["image_id"]))
+                if current is not None:
+                    current["attempts"] += 1
+                    backoff = min(self.max_backoff_seconds, 5 * 2 ** current["attempts"])
+                    current["next_attempt"] = time.time() + backoff
+                    current["last_error"] = str(e)
+                    self._save()
+                    print(f"Upload of image {job['image_id']} failed (attempt {current['attempts']}), "
+                          f"retrying in {backoff}s: {str(e)}")
+            return False
+
+    def enqueue_missing(self, limit: int = 100) -> int:
+        """Queue images that never made it to storage, e.g. from before the queue existed"""
+        response = self.supabase.table('images')\
+            .select('id, local_path, dalle_url, created_at')\
+            .is_('storage_path', 'null')\
+            .order('created_at', desc=True)\
+            .limit(limit)\
+            .execute()
+        added = 0
+        for row in response.data or []:
+            if row['id'] in self.jobs:
+                continue
+            local_path = self.image_store.resolve(row.get('local_path'))
+            if not local_path:
+                continue
+            timestamp = (row.get('created_at') or '')[:19].replace('-', '').replace(':', '').replace('T', '_')
+            storage_path = f"images/{timestamp}/{os.path.basename(local_path)}"
+            content_type = mimetypes.guess_type(local_path)[0] or "image/png"
+            self.enqueue(row['id'], local_path, storage_path, content_type, dalle_url=row.get('dalle_url'))
+            added += 1
+        return added